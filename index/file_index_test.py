@@ -1,4 +1,6 @@
 from .structure import *
+import sys
+import threading
 import unittest
 from .index_structure_test import StructureTest
 from .performance_test import PerformanceTest
@@ -7,19 +9,23 @@ from .performance_test import PerformanceTest
 
 class FileIndexTest(unittest.TestCase):
 
-    def check_idx_file(self, obj_index, set_occurrences):
+    def check_idx_file(self, obj_index, set_occurrences, lst_file_names=None):
         #verifica a ordem das ocorrencias
         list_size = obj_index.idx_tmp_occur_last_element - obj_index.idx_tmp_occur_first_element + 1
         self.assertEqual(list_size,0,"A lista de ocorrencias deve ser zerada após chamar o método save_tmp_occurrences")
-        last_occur = TermOccurrence(float('-inf'),float('-inf'),10)
+        if lst_file_names is None:
+            lst_file_names = [obj_index.str_idx_file_name]
         set_file_occurrences = set()
-        with open(obj_index.str_idx_file_name,"rb") as idx_file:
-            occur = obj_index.next_from_file(idx_file)
-            while occur is not None:
-                self.assertTrue(occur>last_occur, msg=f"A ocorrencia {last_occur} foi colocada de forma incorreta antes da ocorrencia {occur}")
-                set_file_occurrences.add(occur)
-                last_occur = occur
+        for str_file_name in lst_file_names:
+            #cada arquivo (execução) deve estar ordenado de forma independente
+            last_occur = TermOccurrence(float('-inf'),float('-inf'),10)
+            with open(str_file_name,"rb") as idx_file:
                 occur = obj_index.next_from_file(idx_file)
+                while occur is not None:
+                    self.assertTrue(occur>last_occur, msg=f"A ocorrencia {last_occur} foi colocada de forma incorreta antes da ocorrencia {occur}")
+                    set_file_occurrences.add(occur)
+                    last_occur = occur
+                    occur = obj_index.next_from_file(idx_file)
 
         sobra_arquivo = set_file_occurrences-set_occurrences
         sobra_lista = set_occurrences-set_file_occurrences
@@ -85,7 +91,7 @@ class FileIndexTest(unittest.TestCase):
         set_occurrences = set(self.index.lst_occurrences_tmp) - {None}
         self.index.idx_tmp_occur_last_element  = 3
         self.index.save_tmp_occurrences()
-        self.check_idx_file(self.index, set_occurrences)
+        self.check_idx_file(self.index, set_occurrences, self.index.lst_run_file_names)
         print("Primeira execução (criação inicial do indice) [ok]")
 
         #adicina alguns
@@ -94,7 +100,7 @@ class FileIndexTest(unittest.TestCase):
         self.index.idx_tmp_occur_last_element  = 1
         set_occurrences = set_occurrences | set(self.index.lst_occurrences_tmp)
         self.index.save_tmp_occurrences()
-        self.check_idx_file(self.index, set_occurrences)
+        self.check_idx_file(self.index, set_occurrences, self.index.lst_run_file_names)
         print("Inserção de alguns itens - teste 1/2 [ok]")
 
 
@@ -108,9 +114,53 @@ class FileIndexTest(unittest.TestCase):
         #checa ordenação do arquivo e verifica todas as ocorrencias existem
         set_occurrences = set_occurrences|set(self.index.lst_occurrences_tmp)
         self.index.save_tmp_occurrences()
-        self.check_idx_file(self.index, set_occurrences)
+        self.check_idx_file(self.index, set_occurrences, self.index.lst_run_file_names)
         print("Inserção de alguns itens - teste 2/2 [ok]")
 
+        #cada chamada deve gerar uma execução independente
+        self.assertEqual(len(self.index.lst_run_file_names),3,"Cada chamada de save_tmp_occurrences deveria gerar uma nova execução")
+
+        #a intercalação final deve gerar um único arquivo ordenado
+        self.index.merge_all_runs()
+        self.check_idx_file(self.index, set_occurrences)
+        print("Intercalação das execuções [ok]")
+
+    def test_merge_all_runs(self):
+        #com fan-in 2, as 5 execuções precisam de passadas intermediárias
+        self.index = FileIndex(merge_fan_in=2)
+        set_occurrences = set()
+        for run in range(5):
+            self.index.lst_occurrences_tmp = [TermOccurrence(doc_id,term_id,run+1)
+                                                for doc_id in range(run,20,5)
+                                                for term_id in (3,1,2)]
+            self.index.idx_tmp_occur_first_element = 0
+            self.index.idx_tmp_occur_last_element  = len(self.index.lst_occurrences_tmp)-1
+            set_occurrences = set_occurrences | set(self.index.lst_occurrences_tmp)
+            self.index.save_tmp_occurrences()
+
+        str_final_file = self.index.merge_all_runs()
+        self.assertEqual(self.index.lst_run_file_names,[str_final_file],"Deveria restar apenas uma execução após a intercalação")
+        self.check_idx_file(self.index, set_occurrences)
+
+    def test_simultaneous_indexes(self):
+        #dois índices construídos ao mesmo tempo (no mesmo diretório) não devem compartilhar arquivos
+        lst_indexes = [FileIndex(), FileIndex()]
+        for doc_id in range(1, 40):
+            for int_index, obj_index in enumerate(lst_indexes):
+                obj_index.index("casa", doc_id, int_index+1)
+                obj_index.index(f"termo{int_index}", doc_id*2, 1)
+            if doc_id % 10 == 0:
+                for obj_index in lst_indexes:
+                    obj_index.save_tmp_occurrences()
+        for obj_index in lst_indexes:
+            obj_index.finish_indexing()
+
+        self.assertNotEqual(lst_indexes[0].str_idx_file_name, lst_indexes[1].str_idx_file_name)
+        for int_index, obj_index in enumerate(lst_indexes):
+            self.assertListEqual([(occur.doc_id, occur.term_freq) for occur in obj_index.get_occurrence_list("casa")],
+                                 [(doc_id, int_index+1) for doc_id in range(1, 40)], f"Ocorrências inesperadas no índice {int_index}")
+            self.assertListEqual([occur.doc_id for occur in obj_index.get_occurrence_list(f"termo{int_index}")], list(range(2, 80, 2)))
+
     def test_finish_indexing(self):
         self.index = FileIndex()
         self.index.idx_tmp_occur_last_element  = 8
@@ -135,13 +185,7 @@ class FileIndexTest(unittest.TestCase):
         print("Lista de ocorrências a serem testadas:")
         for i,occ in enumerate(self.index.lst_occurrences_tmp):
             print(f"{occ}")
-        x = 100
-        int_size_of_occur = None
-        with open("teste_file.idx","wb") as file:
-            self.index.lst_occurrences_tmp[0].write(file)
-            int_size_of_occur = file.tell()
 
-        print(f"Tamanho de cada ocorrência: {int_size_of_occur} bytes")
         self.index.save_tmp_occurrences()
         #verifica, para cada posição
         self.index.dic_index = {"casa":TermFilePosition(1),
@@ -154,12 +198,14 @@ class FileIndexTest(unittest.TestCase):
         #testa se o id manteve-se o mesmo
         [self.assertEqual(self.index.dic_index[arr_termos[i]].term_id, i+1, f"O id do termo {i+1} mudou para {self.index.dic_index[arr_termos[i]].term_id}") for i in range(4)]
 
+        #cada ocorrência compactada ocupa 2 bytes (intervalo entre doc_ids e frequência, ambos < 128)
+        #e o term_id não é armazenado
+        arr_tam_por_termo = [6,6,2,4]
+        [self.assertEqual(self.index.dic_index[arr_termos[i]].term_file_length,arr_tam_por_termo[i],f"O bloco do termo de id {i+1} deveria ocupar {arr_tam_por_termo[i]} bytes e não {self.index.dic_index[arr_termos[i]].term_file_length}") for i in range(4)]
 
-
-        #testa se a quantidade de documentos que possuem um determinado termo está correto
-        arr_pos_por_termo = [0,int_size_of_occur*3,int_size_of_occur*6,int_size_of_occur*7]
-        arr_pos = [1,4,7,8]
-        [self.assertEqual(self.index.dic_index[arr_termos[i]].term_file_start_pos,arr_pos_por_termo[i],f"A posição inicial do termo de id {i+1} no arquivo seria {arr_pos_por_termo[i]} (ou seja, antes da {arr_pos[i]}ª ocorrencia) e não {self.index.dic_index[arr_termos[i]].term_file_start_pos}") for i in range(4)]
+        #testa a posição inicial do bloco de cada termo
+        arr_pos_por_termo = [0,6,12,14]
+        [self.assertEqual(self.index.dic_index[arr_termos[i]].term_file_start_pos,arr_pos_por_termo[i],f"A posição inicial do termo de id {i+1} no arquivo seria {arr_pos_por_termo[i]} e não {self.index.dic_index[arr_termos[i]].term_file_start_pos}") for i in range(4)]
 
         #testa se a quantidade de documentos que possuem um determinado termo está correto
         arr_doc_por_termo = [3,3,1,2]
@@ -168,6 +214,203 @@ class FileIndexTest(unittest.TestCase):
 
 
 
+    def test_posting_cursor(self):
+        self.index = FileIndex()
+        arr_doc_ids = list(range(3, 3000, 3))
+        for doc_id in arr_doc_ids:
+            self.index.index("casa", doc_id, doc_id % 7 + 1)
+            if doc_id % 300 == 0:
+                self.index.index("verde", doc_id, 1)
+        int_min_doc_count, int_block_size = FileIndex.SKIP_MIN_DOC_COUNT, FileIndex.SKIP_BLOCK_SIZE
+        FileIndex.SKIP_MIN_DOC_COUNT, FileIndex.SKIP_BLOCK_SIZE = 100, 16
+        try:
+            self.index.finish_indexing()
+            #as tabelas de saltos também são gravadas no arquivo do índice
+            self.index.write("cursor_test.idx")
+        finally:
+            FileIndex.SKIP_MIN_DOC_COUNT, FileIndex.SKIP_BLOCK_SIZE = int_min_doc_count, int_block_size
+
+        self.assertEqual(self.index.dic_index["casa"].skip_count, 63, "O termo 'casa' deveria ter uma entrada de salto a cada 16 ocorrências")
+        self.assertEqual(self.index.dic_index["verde"].skip_count, 0, "O termo 'verde' não é frequente o suficiente para ter uma tabela de saltos")
+        for term in ["casa", "verde"]:
+            self.assertEqual(list(self.index.get_posting_cursor(term)), list(self.index.get_occurrence_list(term)),
+                             f"O cursor deveria percorrer as mesmas ocorrências do termo '{term}'")
+
+        #sem a lista no cache de ocorrências, o cursor usa a tabela de saltos
+        self.index.posting_cache.clear()
+        cursor = self.index.get_posting_cursor("casa")
+        self.assertEqual(cursor.next(), TermOccurrence(3, cursor.term_id, 4), "Primeira ocorrência inesperada")
+        for target_doc_id, int_expected_doc_id in [(4, 6), (6, 6), (1000, 1002), (1001, 1002), (2997, 2997)]:
+            occur = cursor.advance(target_doc_id)
+            self.assertEqual(occur.doc_id, int_expected_doc_id, f"advance({target_doc_id}) deveria parar no documento {int_expected_doc_id}")
+            self.assertEqual(cursor.peek(), occur, "advance não deveria consumir a ocorrência encontrada")
+        self.assertEqual(cursor.next().doc_id, 2997)
+        self.assertIsNone(cursor.next(), "O cursor deveria estar no final da lista")
+        self.assertIsNone(cursor.advance(5000), "Não existe documento após o último")
+        self.assertEqual(cursor.remaining, 0, "Não deveriam restar ocorrências no cursor esgotado")
+        #apenas as partes necessárias devem ser decodificadas
+        self.assertLess(cursor.postings_decoded, len(arr_doc_ids)/2, "advance deveria pular as partes intermediárias da lista")
+        self.assertIsNone(self.index.get_posting_cursor("inexistente").advance(1), "Um termo inexistente não possui ocorrências")
+        #advance além do último documento a partir do meio da lista esgota o cursor
+        self.index.posting_cache.clear()
+        cursor = self.index.get_posting_cursor("casa")
+        cursor.advance(1000)
+        self.assertEqual(cursor.remaining, len(arr_doc_ids) - 333)
+        self.assertIsNone(cursor.advance(10**9))
+        self.assertEqual(cursor.remaining, 0, "Não deveriam restar ocorrências no cursor esgotado")
+        self.assertIsNone(cursor.next())
+        self.assertEqual(cursor.remaining_arrays()[0].tolist(), [])
+
+        try:
+            idx_lido = Index.read("cursor_test.idx")
+            self.assertEqual(idx_lido.dic_index["casa"].skip_count, 63, "A tabela de saltos deveria ser lida do arquivo")
+            self.assertEqual(idx_lido.dic_index["verde"].skip_count, 0)
+            cursor = idx_lido.get_posting_cursor("casa")
+            self.assertEqual(cursor.advance(2000).doc_id, 2001)
+            self.assertEqual(cursor.remaining, len(arr_doc_ids) - 666)
+            self.assertLess(cursor.postings_decoded, len(arr_doc_ids)/2, "O índice lido deveria usar a tabela de saltos")
+            self.assertEqual(list(idx_lido.get_posting_cursor("casa")), list(self.index.get_occurrence_list("casa")))
+            #lookup procura vários doc_ids de uma vez, decodificando apenas as partes que podem contê-los
+            cursor = idx_lido.get_posting_cursor("casa")
+            arr_found, arr_term_freqs = cursor.lookup(np.array([6, 7, 2001, 2002, 5000]))
+            self.assertListEqual(arr_found.tolist(), [True, False, True, False, False])
+            self.assertListEqual(arr_term_freqs.tolist(), [6 % 7 + 1, 2001 % 7 + 1])
+            self.assertEqual(cursor.postings_decoded, 32, "Apenas os blocos dos doc_ids 6 e 2001 deveriam ser decodificados")
+            self.assertEqual(cursor.remaining, 0)
+        finally:
+            idx_lido = cursor = None
+            os.remove("cursor_test.idx")
+
+    def test_posting_cache(self):
+        #cada entrada ocupa 8 bytes por ocorrência; custo igual ao tamanho: a prioridade é a quantidade de acertos
+        cache = PostingCache(64)
+        arr_a, arr_b, arr_c = np.zeros(2, dtype=POSTING_DTYPE), np.zeros(4, dtype=POSTING_DTYPE), np.zeros(4, dtype=POSTING_DTYPE)
+        cache.put("a", arr_a, arr_a.nbytes)
+        cache.put("b", arr_b, arr_b.nbytes)
+        for _ in range(3):
+            self.assertIs(cache.get("b"), arr_b, "A lista b deveria estar no cache")
+        self.assertFalse(arr_b.flags.writeable, "Os arrays guardados no cache deveriam ser somente leitura")
+        #não há espaço para c: sai a entrada de menor prioridade (a, menos acessada), mesmo sendo a menor
+        cache.put("c", arr_c, arr_c.nbytes)
+        self.assertNotIn("a", cache, "A entrada menos acessada deveria ser removida")
+        self.assertIn("b", cache, "A lista mais acessada deveria permanecer no cache")
+        self.assertEqual(cache.int_used_bytes, 64)
+        cache.put("d", np.zeros(9, dtype=POSTING_DTYPE), 72)
+        self.assertNotIn("d", cache, "Listas maiores que o cache não deveriam ser guardadas")
+        self.assertEqual((cache.hits, cache.evictions), (3, 1))
+        #as prioridades desatualizadas de cada acerto não podem acumular no heap
+        for _ in range(10000):
+            cache.get("b")
+        self.assertLessEqual(len(cache.heap_priorities), PostingCache.HEAP_COMPACT_MIN+1, "O heap deveria ser reconstruído")
+        cache.put("e", arr_a, arr_a.nbytes)
+        self.assertIn("b", cache, "A lista mais acessada deveria permanecer no cache após a reconstrução do heap")
+        self.assertNotIn("c", cache)
+
+        #acertos concorrentes: nenhum incremento perdido e um contador distinto por prioridade no heap
+        int_hits, int_entry_hits = cache.hits, cache.dic_entries["b"][1]
+        float_switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            lst_threads = [threading.Thread(target=lambda: [cache.get("b") for _ in range(2000)]) for _ in range(8)]
+            for thread in lst_threads:
+                thread.start()
+            for thread in lst_threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(float_switch_interval)
+        self.assertEqual(cache.hits - int_hits, 16000)
+        self.assertEqual(cache.dic_entries["b"][1] - int_entry_hits, 16000)
+        lst_counters = [int_counter for _, int_counter, _ in cache.heap_priorities]
+        self.assertEqual(len(lst_counters), len(set(lst_counters)), "Os contadores do heap deveriam ser distintos")
+
+        self.index = FileIndex()
+        for doc_id in range(1, 40):
+            self.index.index("casa", doc_id, 1)
+            if doc_id % 2 == 0:
+                self.index.index("verde", doc_id, 2)
+            if doc_id % 10 == 0:
+                self.index.index("prédio", doc_id, 1)
+        self.index.finish_indexing()
+        arr_postings = self.index.get_postings("verde")
+        self.assertIs(self.index.get_postings("verde"), arr_postings, "A lista decodificada deveria vir do cache")
+        self.assertEqual(self.index.get_occurrence_list("verde"), list(self.index.get_posting_cursor("verde")))
+
+        #pré-carregamento dos termos com mais documentos
+        self.index.posting_cache.clear()
+        self.index.warm_posting_cache(2)
+        self.assertIn(self.index.dic_index["casa"].term_id, self.index.posting_cache)
+        self.assertIn(self.index.dic_index["verde"].term_id, self.index.posting_cache)
+        self.assertNotIn(self.index.dic_index["prédio"].term_id, self.index.posting_cache, "Apenas os 2 termos mais frequentes deveriam ser carregados")
+        self.assertListEqual(self.index.get_postings("casa")["doc_id"].tolist(), list(range(1, 40)))
+
+    def test_concurrent_reads(self):
+        rng = np.random.default_rng(5)
+        self.index = FileIndex(posting_cache_bytes=4096)
+        for doc_id in range(1, 3001):
+            for term_id in np.unique(rng.zipf(1.5, 20)).tolist():
+                self.index.index(f"termo{term_id}", doc_id, term_id % 5 + 1)
+        int_min_doc_count = FileIndex.SKIP_MIN_DOC_COUNT
+        FileIndex.SKIP_MIN_DOC_COUNT = 200
+        try:
+            self.index.finish_indexing()
+        finally:
+            FileIndex.SKIP_MIN_DOC_COUNT = int_min_doc_count
+
+        lst_terms = self.index.vocabulary + ["inexistente"]
+        dic_expected = {term:[(occur.doc_id, occur.term_freq) for occur in self.index.get_occurrence_list(term)] for term in lst_terms}
+        #as threads devem abrir o mapeamento e preencher o cache (pequeno, com remoções) ao mesmo tempo
+        self.index.close_postings()
+        self.index.posting_cache.clear()
+
+        lst_errors = []
+        def query_terms(seed):
+            thread_rng = np.random.default_rng(seed)
+            try:
+                for _ in range(300):
+                    term = lst_terms[int(thread_rng.integers(len(lst_terms)))]
+                    int_operation = int(thread_rng.integers(3))
+                    if int_operation == 0:
+                        lst_response = [(occur.doc_id, occur.term_freq) for occur in self.index.get_occurrence_list(term)]
+                    elif int_operation == 1:
+                        lst_response = [(occur.doc_id, occur.term_freq) for occur in self.index.get_posting_cursor(term)]
+                    else:
+                        #avança até metade da lista e percorre o restante
+                        cursor = self.index.get_posting_cursor(term)
+                        lst_response = dic_expected[term][:len(dic_expected[term])//2]
+                        if len(lst_response) < len(dic_expected[term]):
+                            cursor.advance(dic_expected[term][len(lst_response)][0])
+                            lst_response = lst_response + [(occur.doc_id, occur.term_freq) for occur in cursor]
+                    if lst_response != dic_expected[term]:
+                        lst_errors.append(f"Ocorrências inesperadas do termo {term}")
+            except Exception as error:
+                lst_errors.append(repr(error))
+
+        #trocas de thread mais frequentes aumentam as intercalações entre as leituras
+        float_switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            lst_threads = [threading.Thread(target=query_terms, args=(seed,)) for seed in range(8)]
+            for thread in lst_threads:
+                thread.start()
+            for thread in lst_threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(float_switch_interval)
+        self.assertListEqual(lst_errors, [], "As leituras concorrentes deveriam retornar o mesmo que as leituras sequenciais")
+        self.assertGreater(self.index.posting_cache.evictions, 0, "O teste deveria forçar remoções no cache")
+
+    def test_vbyte(self):
+        arr_values = [0,1,127,128,16383,16384,2**21,2**28-1,2**28,2**32-1]
+        buffer = vbyte_encode(arr_values)
+        self.assertEqual(len(buffer), 1+1+1+2+2+3+4+4+5+5, "Quantidade de bytes inesperada na codificação Variable Byte")
+        self.assertListEqual(vbyte_decode(buffer).tolist(), arr_values, "A decodificação deveria retornar os valores originais")
+
+        arr_doc_ids = [3,10,11,500,100000]
+        arr_freqs = [1,200,1,3,70000]
+        arr_postings = decode_postings(encode_postings(arr_doc_ids, arr_freqs))
+        self.assertListEqual(arr_postings["doc_id"].tolist(), arr_doc_ids, "doc_ids inesperados após a decodificação das ocorrências")
+        self.assertListEqual(arr_postings["term_freq"].tolist(), arr_freqs, "Frequências inesperadas após a decodificação das ocorrências")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -38,6 +38,38 @@ class StructureTest(unittest.TestCase):
         self.occur_list_test(idx_novo)
 
 
+    def test_read_lexicon(self):
+        self.index.write("teste_idx.idx")
+        idx_novo = Index.read("teste_idx.idx")
+
+        #o léxico deve ser consultado diretamente no arquivo, por busca binária
+        self.assertIsInstance(idx_novo.dic_index, Lexicon, "O índice lido deveria usar o léxico mapeado em memória")
+        self.assertCountEqual(self.index.vocabulary, idx_novo.vocabulary, "O vocabulário lido deveria ser igual ao gravado")
+        for term in self.index.vocabulary:
+            self.assertEqual(self.index.get_term_id(term), idx_novo.get_term_id(term), f"O id do termo {term} mudou após a leitura")
+            self.assertEqual(self.index.document_count_with_term(term), idx_novo.dic_index[term].doc_count_with_term, f"Quantidade de documentos inesperada para o termo {term}")
+        self.assertNotIn("cinza", idx_novo.dic_index, "Cinza não está indexado")
+
+    def test_doc_id_map(self):
+        #sem título, o documento 200 fica ao final; os demais seguem a ordem dos títulos
+        doc_id_map = DocIdMap.create([100, 300, 200, 300], {300:"abacaxi", 100:"zebra"})
+        self.assertListEqual(doc_id_map.to_external([0, 1, 2]), [300, 100, 200], "Os ids internos deveriam seguir a ordem dos títulos")
+        self.assertEqual(doc_id_map.to_internal(200), 2)
+        self.assertEqual(doc_id_map.to_external(1), 100)
+        self.assertNotIn(150, doc_id_map)
+        with self.assertRaises(KeyError):
+            doc_id_map.to_internal(150)
+
+        #o mapeamento é gravado e lido junto com o índice
+        self.index.doc_id_map = DocIdMap([50, 10, 30, 20])
+        self.index.write("teste_idx.idx")
+        idx_novo = Index.read("teste_idx.idx")
+        self.assertListEqual(idx_novo.doc_id_map.to_external([1, 2, 3]), [10, 30, 20], "O mapeamento lido deveria ser o gravado")
+        self.assertEqual(idx_novo.doc_id_map.to_internal(20), 3)
+        self.index.doc_id_map = None
+        self.index.write("teste_idx.idx")
+        self.assertIsNone(Index.read("teste_idx.idx").doc_id_map, "Um índice gravado sem mapeamento não deveria ler o de uma gravação anterior")
+
     def test_document_count(self):
         self.assertEqual(3,self.index.document_count)
 
@@ -53,6 +85,31 @@ class StructureTest(unittest.TestCase):
         self.assertEqual(1,self.index.document_count_with_term("verde"), f"Verde apareceu em dois documentos")
         self.assertEqual(0,self.index.document_count_with_term("cinza"), f"Cinza não está indexado, deveria retornar zero")
 
+    def test_posting_cursor(self):
+        cursor = self.index.get_posting_cursor("vermelho")
+        self.assertEqual(len(cursor), 3, "O cursor de vermelho deveria ter três ocorrências")
+        self.assertEqual(cursor.remaining, 3)
+        self.assertEqual((cursor.peek().doc_id, cursor.peek().term_freq), (1, 3), "peek deveria retornar a primeira ocorrência sem avançar")
+        self.assertEqual(cursor.next().doc_id, 1)
+        self.assertEqual(cursor.remaining, 2)
+        self.assertEqual(cursor.advance(3).doc_id, 3, "advance(3) deveria parar no documento 3")
+        self.assertEqual(cursor.remaining, 1, "advance não deveria consumir a ocorrência encontrada")
+        self.assertEqual(cursor.next().doc_id, 3)
+        self.assertIsNone(cursor.peek(), "O cursor deveria estar no final da lista")
+        self.assertEqual(cursor.remaining, 0)
+
+        self.assertListEqual([(occur.doc_id, occur.term_freq) for occur in self.index.get_posting_cursor("casa")], [(1,10),(2,3)],
+                             "O cursor de casa deveria percorrer as suas ocorrências em ordem de doc_id")
+        cursor_cinza = self.index.get_posting_cursor("cinza")
+        self.assertEqual((len(cursor_cinza), cursor_cinza.peek()), (0, None), "Cinza não está indexado, o cursor deveria ser vazio")
+
+    def test_get_occurrence_lists(self):
+        dic_occurrences = self.index.get_occurrence_lists(["vermelho", "cinza", "casa"])
+        self.assertCountEqual(dic_occurrences.keys(), ["vermelho", "cinza", "casa"])
+        self.assertEqual(len(dic_occurrences["cinza"]), 0, "Cinza não está indexado, deveria ter uma lista vazia")
+        for term in ["vermelho", "casa"]:
+            self.assertListEqual(list(dic_occurrences[term]), list(self.index.get_posting_cursor(term)), f"Ocorrências inesperadas do termo {term}")
+
     def occur_list_test(self, index):
         dict_expected_index = {"casa":{1:10, 2:3},
                                 "verde":{1:1},
@@ -73,10 +130,23 @@ class StructureTest(unittest.TestCase):
     def test_get_occurrence_list(self):
         self.occur_list_test(self.index)
 
+class CompactStructureTest(StructureTest):
+    def setUp(self):
+        self.index = CompactHashIndex()
+        self.create_terms()
+
 class FileStructureTest(StructureTest):
     def setUp(self):
         self.index = FileIndex()
         self.create_terms()
 
+    def test_get_postings(self):
+        arr_postings = self.index.get_postings("vermelho")
+        self.assertListEqual(arr_postings["doc_id"].tolist(), [1,2,3], "As ocorrências de vermelho deveriam estar ordenadas por documento")
+        self.assertListEqual(arr_postings["term_freq"].tolist(), [3,1,1], "Frequências inesperadas para o termo vermelho")
+        #o arquivo deve ser mapeado em memória uma única vez
+        self.assertIs(self.index.open_postings(), self.index.open_postings(), "O arquivo de ocorrências deveria ser mapeado apenas uma vez")
+        self.assertEqual(len(self.index.get_postings("xuxu")), 0, "O termo xuxu não existe, deveria retornar um array vazio")
+
 if __name__ == "__main__":
     unittest.main()
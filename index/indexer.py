@@ -1,15 +1,89 @@
 from nltk.stem.snowball import SnowballStemmer
-from bs4 import BeautifulSoup
+from html.parser import HTMLParser
 from tqdm import tqdm
 import string
 from nltk.tokenize import word_tokenize
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Tuple, Union
 import os
+import re
+
+
+class RegexTokenizer:
+    """
+    Tokenizador rápido: separa o texto (já em minúsculas e sem acentos, ver
+    Cleaner.preprocess_text) em sequências de letras e dígitos por meio de uma única
+    expressão regular compilada, descartando toda a pontuação de uma só vez.
+    """
+    TOKEN_REGEX = re.compile(r"[^\W_]+")
+
+    def tokenize(self, text: str) -> List[str]:
+        return RegexTokenizer.TOKEN_REGEX.findall(text)
+
+
+class NLTKTokenizer:
+    """Tokenizador do NLTK (word_tokenize), mais lento, baseado no modelo Punkt"""
+    def __init__(self, language: str = "portuguese"):
+        self.language = language
+
+    def tokenize(self, text: str) -> List[str]:
+        return word_tokenize(text, language=self.language)
+
+
+class HTMLTextExtractor(HTMLParser):
+    """
+    Extrai o texto de um HTML à medida que ele é lido, sem construir a árvore do documento.
+    O conteúdo de <script> e <style> é ignorado e as entidades (ex.: &amp;) são convertidas.
+    """
+    SKIP_TAGS = {"script", "style"}
+    # quantidade de caracteres lidos do arquivo (ou da string) a cada passo
+    READ_SIZE = 65536
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.lst_chunks = []
+        self.int_skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in HTMLTextExtractor.SKIP_TAGS:
+            self.int_skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in HTMLTextExtractor.SKIP_TAGS and self.int_skip_depth > 0:
+            self.int_skip_depth -= 1
+
+    def handle_data(self, data):
+        if self.int_skip_depth == 0:
+            self.lst_chunks.append(data)
+
+    def iter_text(self, html_doc) -> Iterator[str]:
+        """Gera os trechos de texto de html_doc (uma string ou um arquivo aberto)"""
+        if isinstance(html_doc, str):
+            it_html = (html_doc[pos:pos+HTMLTextExtractor.READ_SIZE]
+                       for pos in range(0, len(html_doc), HTMLTextExtractor.READ_SIZE))
+        else:
+            it_html = iter(lambda: html_doc.read(HTMLTextExtractor.READ_SIZE), "")
+
+        for html_piece in it_html:
+            self.feed(html_piece)
+            yield from self.pop_chunks()
+        self.close()
+        yield from self.pop_chunks()
+
+    def pop_chunks(self) -> List[str]:
+        lst_chunks = self.lst_chunks
+        self.lst_chunks = []
+        return lst_chunks
 
 
 class Cleaner:
+    # quantidade padrão de palavras cujo resultado de preprocess_word é memorizado
+    WORD_CACHE_SIZE = 200000
+
     def __init__(self, stop_words_file: str, language: str,
                  perform_stop_words_removal: bool, perform_accents_removal: bool,
-                 perform_stemming: bool):
+                 perform_stemming: bool, word_cache_size: int = WORD_CACHE_SIZE, tokenizer=None):
         self.set_stop_words = self.read_stop_words(stop_words_file)
 
         self.stemmer = SnowballStemmer(language)
@@ -24,9 +98,41 @@ class Cleaner:
         self.perform_accents_removal = perform_accents_removal
         self.perform_stemming = perform_stemming
 
+        # qualquer objeto com o método tokenize(texto) -> lista de palavras
+        self.tokenizer = tokenizer if tokenizer is not None else RegexTokenizer()
+
+        self.word_cache_size = word_cache_size
+        self.create_word_cache()
+
+    def create_word_cache(self):
+        """
+        Cria a memorização (LRU, com no máximo word_cache_size palavras; None para ilimitada)
+        de preprocess_word em preprocess_word_cached. Como o mesmo Cleaner é usado na
+        indexação (HTMLIndexer) e na consulta (QueryRunner), ambos compartilham a memorização
+        e normalizam as palavras da mesma forma. Deve ser chamado novamente caso as flags
+        do Cleaner sejam alteradas.
+        """
+        self.preprocess_word_cached = lru_cache(maxsize=self.word_cache_size)(self.preprocess_word)
+
+    def word_cache_info(self):
+        """Acertos, faltas, capacidade e tamanho atual da memorização de preprocess_word"""
+        return self.preprocess_word_cached.cache_info()
+
+    def __getstate__(self):
+        # a memorização não é serializável (ex.: ao enviar o Cleaner para outro processo)
+        dic_state = self.__dict__.copy()
+        del dic_state["preprocess_word_cached"]
+        return dic_state
+
+    def __setstate__(self, dic_state):
+        self.__dict__.update(dic_state)
+        self.create_word_cache()
+
+    def html_to_text_chunks(self, html_doc) -> Iterator[str]:
+        return HTMLTextExtractor().iter_text(html_doc)
+
     def html_to_plain_text(self, html_doc: str) -> str:
-        soup = BeautifulSoup(html_doc, 'html.parser')
-        return soup.get_text()
+        return "".join(self.html_to_text_chunks(html_doc))
 
     @staticmethod
     def read_stop_words(str_file) -> set:
@@ -37,6 +143,9 @@ class Cleaner:
                 [set_stop_words.add(word) for word in arr_words]
         return set_stop_words
 
+    def tokenize(self, text: str) -> List[str]:
+        return self.tokenizer.tokenize(text)
+
     def is_stop_word(self, term: str):
         return term in self.set_stop_words
 
@@ -57,7 +166,10 @@ class Cleaner:
         return term
 
     def preprocess_text(self, text: str) -> str or None:
-        return self.remove_accents(text.lower())
+        text = text.lower()
+        if self.perform_accents_removal:
+            text = self.remove_accents(text)
+        return text
         
 class HTMLIndexer:
     cleaner = Cleaner(stop_words_file="stopwords.txt",
@@ -69,37 +181,103 @@ class HTMLIndexer:
     def __init__(self, index):
         self.index = index
 
-    def text_word_count(self, plain_text: str):
+    @staticmethod
+    def iter_word_text(text_chunks: Iterable[str]) -> Iterator[str]:
+        """
+        Reagrupa os trechos de texto de forma que nenhuma palavra fique dividida entre dois
+        trechos: o final de cada trecho após o último espaço é adiado para o próximo.
+        """
+        str_pending = ""
+        for chunk in text_chunks:
+            chunk = str_pending + chunk
+            int_cut = max(chunk.rfind(" "), chunk.rfind("\n"), chunk.rfind("\t"), chunk.rfind("\r")) + 1
+            str_pending = chunk[int_cut:]
+            if int_cut > 0:
+                yield chunk[:int_cut]
+        if str_pending:
+            yield str_pending
+
+    def text_word_count(self, plain_text: Union[str, Iterable[str]]):
+        """
+        Conta as palavras (já preprocessadas) de plain_text, que pode ser o texto completo ou
+        um iterável de trechos de texto (ex.: Cleaner.html_to_text_chunks), consumido aos poucos.
+        """
         dic_word_count = {}
-        plain_text = self.cleaner.preprocess_text(plain_text)
-        words = word_tokenize(plain_text)
-        for word in words:
-            word = self.cleaner.preprocess_word(word) 
-            if word is not None:      
-                
-                if word in dic_word_count.keys():  
-                    dic_word_count[word] += 1
-                else:
-                    dic_word_count[word] = 1
-                
-               
+        if isinstance(plain_text, str):
+            plain_text = [plain_text]
+        for text in HTMLIndexer.iter_word_text(plain_text):
+            text = self.cleaner.preprocess_text(text)
+            words = self.cleaner.tokenize(text)
+            for word in words:
+                word = self.cleaner.preprocess_word_cached(word)
+                if word is not None:      
+                    
+                    if word in dic_word_count.keys():  
+                        dic_word_count[word] += 1
+                    else:
+                        dic_word_count[word] = 1
                     
         return dic_word_count
 
+    def doc_word_count(self, text_html: str):
+        # o texto do documento é processado à medida que é extraído do HTML
+        return self.text_word_count(self.cleaner.html_to_text_chunks(text_html))
+
     def index_text(self, doc_id: int, text_html: str):
-        plain_text = self.cleaner.html_to_plain_text(text_html)
-        words = self.text_word_count(plain_text)
+        words = self.doc_word_count(text_html)
         [self.index.index(word, doc_id, words[word]) for word in words]  
-        
-    
-    def index_text_dir(self, path: str):
-        for str_sub_dir in tqdm(os.listdir(path)):
+
+    @staticmethod
+    def list_doc_files(path: str) -> List[Tuple[int, str]]:
+        """
+        Lista (doc_id, caminho) de cada documento dos subdiretórios de path, em ordem
+        (subdiretório, arquivo), para que o índice gerado não dependa da ordem de os.listdir.
+        """
+        lst_doc_files = []
+        for str_sub_dir in sorted(os.listdir(path)):
             path_sub_dir = f"{path}/{str_sub_dir}"
 
-            for file in os.listdir(path_sub_dir):
+            for file in sorted(os.listdir(path_sub_dir)):
                 path_file = f"{path}/{str_sub_dir}/{file}"
-                with open(path_file, encoding='utf-8') as file_content:
-                    doc_id = int(file.split(".")[0])
-                    self.index_text(doc_id, file_content)
+                doc_id = int(file.split(".")[0])
+                lst_doc_files.append((doc_id, path_file))
+        return lst_doc_files
+
+    def index_text_dir(self, path: str, num_workers: int = 1, chunk_size: int = 32, doc_id_map=None):
+        """
+        Indexa os documentos dos subdiretórios de path. Com num_workers > 1, a leitura,
+        limpeza e contagem de palavras de cada documento é feita por um pool de processos
+        (em lotes de chunk_size documentos); apenas este processo insere no índice, na
+        mesma ordem da indexação serial, por isso o índice gerado é idêntico.
+        Caso doc_id_map (DocIdMap, ex.: DocIdMap.create sobre os doc_ids de list_doc_files) seja
+        informado, os documentos são indexados com os doc_ids internos, na ordem deles, e o
+        mapeamento fica em index.doc_id_map (gravado junto ao índice por Index.write).
+        """
+        lst_doc_files = HTMLIndexer.list_doc_files(path)
+        if doc_id_map is not None:
+            lst_doc_files = sorted((doc_id_map.to_internal(doc_id), path_file) for doc_id, path_file in lst_doc_files)
+            self.index.doc_id_map = doc_id_map
+        if num_workers > 1:
+            with ProcessPoolExecutor(max_workers=num_workers, initializer=init_word_count_worker,
+                                     initargs=(self.cleaner,)) as executor:
+                self.index_doc_word_counts(executor.map(doc_file_word_count, lst_doc_files, chunksize=chunk_size),
+                                           len(lst_doc_files))
+        else:
+            self.index_doc_word_counts(map(doc_file_word_count, lst_doc_files), len(lst_doc_files))
                     
-        self.index.finish_indexing()  
\ No newline at end of file
+        self.index.finish_indexing()  
+
+    def index_doc_word_counts(self, it_doc_word_counts, int_total: int):
+        for doc_id, words in tqdm(it_doc_word_counts, total=int_total):
+            [self.index.index(word, doc_id, words[word]) for word in words]
+
+
+def init_word_count_worker(cleaner: Cleaner):
+    # os processos do pool devem usar o mesmo Cleaner do processo que indexa
+    HTMLIndexer.cleaner = cleaner
+
+
+def doc_file_word_count(doc_file: Tuple[int, str]):
+    doc_id, path_file = doc_file
+    with open(path_file, encoding='utf-8') as file_content:
+        return doc_id, HTMLIndexer(None).doc_word_count(file_content)
@@ -23,6 +23,97 @@ class IndexerTest(unittest.TestCase):
                 self.assertTrue(occur.doc_id in dic_expected,f"O docid número {occur.doc_id} não deveria existir ou não deveria indexar o termo 'cas'")
                 self.assertEqual(dic_expected[occur.doc_id].term_freq,occur.term_freq, f"A frequencia do termo 'cas' no documento {occur.doc_id} deveria ser {occur.term_freq}")
     
+    def test_html_text_extractor(self):
+        html_doc = "<html><head><style>p {color: red}</style><script>var casa = 1;</script></head>" \
+                   "<body><p>Casa &amp; <b>verde</b>zinha</p><p>ser ou n&atilde;o ser</p></body></html>"
+        self.assertEqual(HTMLIndexer.cleaner.html_to_plain_text(html_doc), "Casa & verdezinhaser ou não ser",
+                         "O texto extraído deveria ignorar script/style e converter as entidades")
+
+        #com trechos pequenos, palavras ficam divididas entre trechos e devem ser reagrupadas
+        HTMLTextExtractor.READ_SIZE = 7
+        try:
+            lst_chunks = list(HTMLIndexer.cleaner.html_to_text_chunks(html_doc))
+        finally:
+            HTMLTextExtractor.READ_SIZE = 65536
+        self.assertGreater(len(lst_chunks), 1, "O texto deveria ser gerado em vários trechos")
+        html_indexer = HTMLIndexer(None)
+        self.assertDictEqual(html_indexer.text_word_count(iter(lst_chunks)), html_indexer.text_word_count("".join(lst_chunks)),
+                             "A contagem de palavras por trechos deveria ser igual à do texto completo")
+
+    def test_word_cache(self):
+        cleaner = Cleaner(stop_words_file="stopwords.txt", language="portuguese",
+                          perform_stop_words_removal=True, perform_accents_removal=True,
+                          perform_stemming=True, word_cache_size=2)
+        for word in ["casas", "casas", "verde", "casas", "ser", "verde"]:
+            self.assertEqual(cleaner.preprocess_word_cached(word), cleaner.preprocess_word(word), f"A palavra {word} foi normalizada de forma diferente com a memorização")
+        cache_info = cleaner.word_cache_info()
+        #com capacidade 2, "verde" é removida ao inserir "ser"
+        self.assertEqual(cache_info.hits, 2, "Quantidade inesperada de acertos na memorização")
+        self.assertEqual(cache_info.misses, 4, "Quantidade inesperada de faltas na memorização")
+        self.assertEqual(cache_info.currsize, 2, "A memorização não deveria ultrapassar a capacidade configurada")
+
+    def test_tokenizer_parity(self):
+        #compara os termos obtidos com o tokenizador rápido e com o do NLTK na coleção de teste
+        fast_cleaner = HTMLIndexer.cleaner
+        nltk_cleaner = Cleaner(stop_words_file="stopwords.txt", language="portuguese",
+                               perform_stop_words_removal=True, perform_accents_removal=True,
+                               perform_stemming=True, tokenizer=NLTKTokenizer("portuguese"))
+        set_fast_vocab = set()
+        set_nltk_vocab = set()
+        int_diff_docs = 0
+        for doc_id, path_file in HTMLIndexer.list_doc_files("index/docs_test"):
+            with open(path_file, encoding='utf-8') as file_content:
+                plain_text = fast_cleaner.html_to_plain_text(file_content)
+            HTMLIndexer.cleaner = fast_cleaner
+            dic_fast = HTMLIndexer(None).text_word_count(plain_text)
+            HTMLIndexer.cleaner = nltk_cleaner
+            dic_nltk = HTMLIndexer(None).text_word_count(plain_text)
+            HTMLIndexer.cleaner = fast_cleaner
+            if dic_fast != dic_nltk:
+                int_diff_docs += 1
+                print(f"Documento {doc_id}: apenas no rápido: {set(dic_fast)-set(dic_nltk)} apenas no NLTK: {set(dic_nltk)-set(dic_fast)}")
+            set_fast_vocab |= set(dic_fast)
+            set_nltk_vocab |= set(dic_nltk)
+
+        print(f"Documentos com contagens diferentes: {int_diff_docs}")
+        print(f"Termos apenas no tokenizador rápido: {set_fast_vocab-set_nltk_vocab}")
+        print(f"Termos apenas no NLTK: {set_nltk_vocab-set_fast_vocab}")
+        float_jaccard = len(set_fast_vocab & set_nltk_vocab)/max(1, len(set_fast_vocab | set_nltk_vocab))
+        self.assertGreaterEqual(float_jaccard, 0.9, f"Os vocabulários dos dois tokenizadores deveriam ser semelhantes (Jaccard: {float_jaccard:.2f})")
+
+    def test_parallel_indexer(self):
+        #a indexação paralela deve gerar exatamente o mesmo índice da serial
+        obj_index = FileIndex()
+        HTMLIndexer(obj_index).index_text_dir("index/docs_test")
+        obj_index.write("serial_test.idx")
+
+        obj_parallel_index = FileIndex()
+        HTMLIndexer(obj_parallel_index).index_text_dir("index/docs_test", num_workers=2, chunk_size=1)
+        obj_parallel_index.write("parallel_test.idx")
+
+        with open("serial_test.idx","rb") as serial_file, open("parallel_test.idx","rb") as parallel_file:
+            self.assertEqual(serial_file.read(), parallel_file.read(), "O índice gerado em paralelo deveria ser idêntico ao gerado serialmente")
+
+    def test_dense_doc_ids(self):
+        #com um DocIdMap, os documentos são indexados com doc_ids internos densos (0..n-1)
+        obj_index = FileIndex()
+        HTMLIndexer(obj_index).index_text_dir("index/docs_test")
+        #gravado antes de outra indexação, que usa os mesmos arquivos temporários
+        obj_index.write("sparse_test.idx")
+        obj_index = Index.read("sparse_test.idx")
+        lst_doc_ids = [doc_id for doc_id, _ in HTMLIndexer.list_doc_files("index/docs_test")]
+        doc_id_map = DocIdMap.create(lst_doc_ids, {100102:"a", 111:"b"})
+        obj_dense_index = FileIndex()
+        HTMLIndexer(obj_dense_index).index_text_dir("index/docs_test", doc_id_map=doc_id_map)
+
+        self.assertIs(obj_dense_index.doc_id_map, doc_id_map)
+        self.assertListEqual(sorted(obj_dense_index.set_documents), list(range(len(lst_doc_ids))), "Os doc_ids internos deveriam ser densos")
+        self.assertListEqual(doc_id_map.to_external([0, 1]), [100102, 111], "Os doc_ids internos deveriam seguir a ordem das chaves")
+        for term in obj_index.vocabulary:
+            lst_expected = sorted((occur.doc_id, occur.term_freq) for occur in obj_index.get_occurrence_list(term))
+            lst_dense = sorted((doc_id_map.to_external(occur.doc_id), occur.term_freq) for occur in obj_dense_index.get_occurrence_list(term))
+            self.assertListEqual(lst_dense, lst_expected, f"As ocorrências do termo {term} deveriam ser as mesmas, traduzidos os doc_ids")
+
     def test_wiki_idx(self):
         wiki_idx = Index.read("wiki.idx")
 
@@ -4,6 +4,7 @@ from index.structure import *
 from datetime import datetime
 import math
 import tracemalloc
+import gc
 import unittest
 from random import randrange,seed
 
@@ -60,6 +61,39 @@ class FilePerformanceTest(PerformanceTest):
     def setUp(self):
         self.index = FileIndex()
 
+class CompactPerformanceTest(PerformanceTest):
+    def setUp(self):
+        self.index = CompactHashIndex()
+        self.perfomance = CheckPerformance()
+
+class MemoryComparisonTest(unittest.TestCase):
+    NUM_DOCS = 200
+    NUM_TERM_PER_DOC = 500
+
+    def measure_index_memory(self, index_class) -> int:
+        #indexa as mesmas ocorrências (mesma semente) e retorna a memória alocada pelo índice
+        vocabulary = PerformanceTest.create_vocabulary(self)
+        seed(10)
+        gc.collect()
+        tracemalloc.start()
+        index = index_class()
+        count = 0
+        for doc_i in range(MemoryComparisonTest.NUM_DOCS):
+            for term_j in range(MemoryComparisonTest.NUM_TERM_PER_DOC):
+                str_term = vocabulary[randrange(0,len(vocabulary))]
+                index.index(str_term, doc_i, (count%10)+1)
+                count+=1
+        int_memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return int_memory
+
+    def test_memory_comparison(self):
+        int_hash_memory = self.measure_index_memory(HashIndex)
+        int_compact_memory = self.measure_index_memory(CompactHashIndex)
+        print(f"HashIndex: {int_hash_memory/1024/1024:.2f} MB")
+        print(f"CompactHashIndex: {int_compact_memory/1024/1024:.2f} MB ({int_hash_memory/int_compact_memory:.1f}x menor)")
+        self.assertLess(int_compact_memory, int_hash_memory, "O CompactHashIndex deveria ocupar menos memória que o HashIndex")
+
 def test():
     for i in range(10):
         clear_output(wait=True)
@@ -0,0 +1,159 @@
+from index.structure import *
+import shutil
+import threading
+import unittest
+
+
+class SegmentedIndexTest(unittest.TestCase):
+    STR_DIR = "segmented_test_idx"
+
+    # (doc_id, {termo: frequência})
+    LST_DOCS = [(1, {"casa":10, "vermelho":3, "verde":1}),
+                (2, {"vermelho":1, "casa":3}),
+                (3, {"vermelho":1, "azul":2}),
+                (10, {"casa":1, "azul":1}),
+                (7, {"verde":4, "amarelo":1}),
+                (5, {"casa":2, "amarelo":2, "azul":1})]
+
+    def setUp(self):
+        shutil.rmtree(SegmentedIndexTest.STR_DIR, ignore_errors=True)
+
+    def tearDown(self):
+        shutil.rmtree(SegmentedIndexTest.STR_DIR, ignore_errors=True)
+
+    def index_docs(self, obj_index, lst_docs):
+        for doc_id, dic_word_count in lst_docs:
+            for term, term_freq in dic_word_count.items():
+                obj_index.index(term, doc_id, term_freq)
+
+    def check_same_index(self, obj_index, obj_expected_index):
+        self.assertEqual(obj_index.document_count, obj_expected_index.document_count, "Quantidade de documentos inesperada")
+        self.assertListEqual(sorted(int(doc_id) for doc_id in obj_index.set_documents), sorted(obj_expected_index.set_documents))
+        for term in obj_expected_index.vocabulary:
+            arr_doc_ids, arr_term_freqs = obj_index.get_occurrence_arrays(term)
+            arr_expected_doc_ids, arr_expected_term_freqs = obj_expected_index.get_occurrence_arrays(term)
+            self.assertListEqual(arr_doc_ids.tolist(), arr_expected_doc_ids.tolist(), f"Ocorrências inesperadas do termo {term}")
+            self.assertListEqual(arr_term_freqs.tolist(), arr_expected_term_freqs.tolist(), f"Frequências inesperadas do termo {term}")
+            self.assertEqual(obj_index.document_count_with_term(term), obj_expected_index.document_count_with_term(term))
+            self.assertListEqual([occur.doc_id for occur in obj_index.get_posting_cursor(term)], arr_expected_doc_ids.tolist())
+
+    def test_segments(self):
+        obj_index = SegmentedIndex(SegmentedIndexTest.STR_DIR, flush_doc_count=2, merge_factor=10)
+        obj_expected_index = HashIndex()
+        self.index_docs(obj_index, SegmentedIndexTest.LST_DOCS)
+        self.index_docs(obj_expected_index, SegmentedIndexTest.LST_DOCS)
+
+        #os documentos ainda não gravados (segmento em memória) também devem ser consultados
+        self.assertEqual(len(obj_index.lst_segments), 2, "A cada 2 documentos um novo segmento deveria ser gravado")
+        self.check_same_index(obj_index, obj_expected_index)
+        self.assertEqual(obj_index.get_term_id("azul"), 3, "Os term_ids deveriam ser atribuídos na ordem de inclusão dos termos")
+
+        obj_index.close()
+        self.assertEqual(len(obj_index.lst_segments), 3)
+        self.check_same_index(Index.read(SegmentedIndexTest.STR_DIR), obj_expected_index)
+
+    def test_delete_and_update(self):
+        obj_index = SegmentedIndex(SegmentedIndexTest.STR_DIR, flush_doc_count=2, merge_factor=10)
+        self.index_docs(obj_index, SegmentedIndexTest.LST_DOCS)
+        int_generation = obj_index.generation
+
+        self.assertTrue(obj_index.delete_document(2))
+        #o documento 5 ainda está em memória: é gravado antes de ser removido
+        self.assertTrue(obj_index.delete_document(5))
+        self.assertFalse(obj_index.delete_document(42), "O documento 42 não existe")
+        #reindexar o documento 1 substitui a versão anterior
+        self.index_docs(obj_index, [(1, {"roxo":2, "casa":1})])
+        self.assertGreater(obj_index.generation, int_generation, "As alterações deveriam mudar generation")
+
+        lst_expected_docs = [(doc_id, dic_word_count) for doc_id, dic_word_count in SegmentedIndexTest.LST_DOCS if doc_id not in (1, 2, 5)]
+        obj_expected_index = HashIndex()
+        self.index_docs(obj_expected_index, lst_expected_docs + [(1, {"roxo":2, "casa":1})])
+        self.check_same_index(obj_index, obj_expected_index)
+        self.assertEqual(obj_index.document_count_with_term("vermelho"), 1)
+
+        obj_index.close()
+        obj_read_index = Index.read(SegmentedIndexTest.STR_DIR)
+        self.check_same_index(obj_read_index, obj_expected_index)
+        self.assertEqual(obj_read_index.get_term_id("roxo"), obj_index.get_term_id("roxo"), "Os term_ids deveriam ser mantidos ao reabrir o índice")
+
+    def test_update_memory_document(self):
+        #o documento 1 ainda está em memória ao ser reindexado: a versão anterior deve ser removida
+        obj_index = SegmentedIndex(SegmentedIndexTest.STR_DIR, flush_doc_count=10, merge_factor=10)
+        self.index_docs(obj_index, [(1, {"casa":2, "verde":1}), (2, {"casa":1}), (1, {"casa":5})])
+
+        obj_expected_index = HashIndex()
+        self.index_docs(obj_expected_index, [(2, {"casa":1}), (1, {"casa":5})])
+        self.check_same_index(obj_index, obj_expected_index)
+        self.assertEqual(obj_index.document_count_with_term("verde"), 0)
+
+        obj_index.close()
+        self.check_same_index(Index.read(SegmentedIndexTest.STR_DIR), obj_expected_index)
+
+    def test_write_dense_term_ids(self):
+        #termos sem ocorrências não são gravados e os term_ids gravados continuam densos
+        obj_index = SegmentedIndex(SegmentedIndexTest.STR_DIR, flush_doc_count=10, merge_factor=10)
+        self.index_docs(obj_index, [(1, {"casa":1, "roxo":1}), (2, {"casa":2, "azul":1})])
+        obj_index.delete_document(1)
+        str_file = path.join(SegmentedIndexTest.STR_DIR, "completo.idx")
+        obj_index.write(str_file)
+
+        obj_read_index = Index.read(str_file)
+        self.assertListEqual(sorted(obj_read_index.vocabulary), ["azul", "casa"])
+        self.assertListEqual(sorted(obj_read_index.get_term_id(term) for term in obj_read_index.vocabulary), [0, 1])
+        self.assertLess(obj_read_index.get_term_id("casa"), obj_read_index.get_term_id("azul"), "A ordem dos term_ids deveria ser mantida")
+        obj_index.close()
+
+    def test_merge(self):
+        obj_index = SegmentedIndex(SegmentedIndexTest.STR_DIR, flush_doc_count=1, merge_factor=2)
+        self.index_docs(obj_index, SegmentedIndexTest.LST_DOCS)
+        obj_index.delete_document(3)
+        obj_index.close()
+
+        obj_expected_index = HashIndex()
+        self.index_docs(obj_expected_index, [(doc_id, dic_word_count) for doc_id, dic_word_count in SegmentedIndexTest.LST_DOCS if doc_id != 3])
+        #6 segmentos de 1 documento: as camadas são intercaladas até restarem poucos segmentos
+        self.assertLessEqual(len(obj_index.lst_segments), 2, f"Os segmentos deveriam ter sido intercalados: {[segment.doc_count for segment in obj_index.lst_segments]}")
+        self.assertEqual(sum(segment.doc_count for segment in obj_index.lst_segments), 5,
+                         "As ocorrências do documento removido deveriam ser descartadas na intercalação")
+        self.check_same_index(obj_index, obj_expected_index)
+
+        set_files = set(os.listdir(SegmentedIndexTest.STR_DIR))
+        self.assertSetEqual({str_file for str_file in set_files if str_file.startswith("seg_")},
+                            {segment.str_file_name for segment in obj_index.lst_segments},
+                            "Os arquivos dos segmentos intercalados deveriam ser removidos")
+        self.check_same_index(Index.read(SegmentedIndexTest.STR_DIR), obj_expected_index)
+
+    def test_concurrent_merge(self):
+        #consultas feitas durante as intercalações (em outra thread) devem ver todos os documentos
+        obj_index = SegmentedIndex(SegmentedIndexTest.STR_DIR, flush_doc_count=1, merge_factor=2)
+        obj_expected_index = HashIndex()
+        for doc_id in range(200):
+            dic_word_count = {f"t{doc_id % 7}":1 + doc_id % 3, "comum":1}
+            self.index_docs(obj_index, [(doc_id, dic_word_count)])
+            self.index_docs(obj_expected_index, [(doc_id, dic_word_count)])
+            self.assertEqual(obj_index.document_count_with_term("comum"), doc_id+1)
+        obj_index.close()
+        self.assertLess(len(obj_index.lst_segments), 10)
+        self.check_same_index(obj_index, obj_expected_index)
+
+    def test_read_during_flush(self):
+        #durante a gravação de um segmento, as leituras (em outra thread) não aguardam a gravação e veem cada documento uma única vez
+        lst_counts = []
+
+        class ReadingSegmentedIndex(SegmentedIndex):
+            def write_segment(self, lst_segments):
+                reader = threading.Thread(target=lambda: lst_counts.append((self.document_count, self.document_count_with_term("casa"))))
+                reader.start()
+                reader.join(timeout=5)
+                lst_counts.append(None if reader.is_alive() else lst_counts.pop())
+                return super().write_segment(lst_segments)
+
+        obj_index = ReadingSegmentedIndex(SegmentedIndexTest.STR_DIR, flush_doc_count=2, merge_factor=10, background_merge=False)
+        self.index_docs(obj_index, SegmentedIndexTest.LST_DOCS)
+        obj_index.close()
+        #o segmento congelado é gravado depois que o primeiro termo do documento seguinte foi indexado
+        self.assertListEqual(lst_counts, [(3, 2), (5, 3), (6, 4)], "Contagens lidas durante as gravações dos segmentos")
+
+
+if __name__ == "__main__":
+    unittest.main()
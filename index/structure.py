@@ -1,18 +1,58 @@
 from IPython.display import clear_output
-from typing import List, Set, Union
+from typing import Iterator, List, Set, Tuple, Union
 from abc import abstractmethod
+from collections.abc import Mapping
+from contextlib import nullcontext
 from functools import total_ordering
 from os import path
 import os
+import json
+import glob
 import pickle
+import heapq
+import mmap
+import struct
 import gc
 import sys
+import tempfile
+import threading
+import numpy as np
+from array import array
+
+# formato binário do índice gravado por Index.write (ver a documentação do método)
+INDEX_MAGIC = b"RIIDX\0\0\0"
+INDEX_VERSION = 2
+# assinatura, versão, #termos, #documentos, posição do léxico, posição e tamanho dos termos,
+# posição dos documentos, posição e tamanho das ocorrências e tamanho dos blocos das tabelas de saltos
+INDEX_HEADER = struct.Struct("<8sIIIQQQQQQI")
+LEXICON_DTYPE = np.dtype([("term_offset", "<u8"), ("term_length", "<u4"), ("term_id", "<u4"),
+                          ("doc_count", "<u4"), ("postings_offset", "<u8"), ("postings_length", "<u8"),
+                          ("skip_offset", "<u8"), ("skip_count", "<u4")])
+# versão 1 (sem tabelas de saltos), ainda lida por Index.read
+INDEX_HEADER_V1 = struct.Struct("<8sIIIQQQQQQ")
+LEXICON_DTYPE_V1 = np.dtype([("term_offset", "<u8"), ("term_length", "<u4"), ("term_id", "<u4"),
+                             ("doc_count", "<u4"), ("postings_offset", "<u8"), ("postings_length", "<u8")])
+
+
+def unpack_index_header(buffer) -> Tuple[tuple, np.dtype]:
+    """
+    Cabeçalho (campos de INDEX_HEADER) e dtype do léxico de um índice gravado por Index.write.
+    Nos índices da versão 1, o tamanho dos blocos das tabelas de saltos é 0 (não há tabelas).
+    """
+    int_version = struct.unpack_from("<I", buffer, len(INDEX_MAGIC))[0]
+    if int_version == INDEX_VERSION:
+        return INDEX_HEADER.unpack_from(buffer, 0), LEXICON_DTYPE
+    if int_version == 1:
+        return INDEX_HEADER_V1.unpack_from(buffer, 0) + (0,), LEXICON_DTYPE_V1
+    raise ValueError(f"Versão do índice não suportada: {int_version} (esperada: {INDEX_VERSION})")
 
 
 class Index:
     def __init__(self):
         self.dic_index = {}
         self.set_documents = set()
+        # mapeamento dos doc_ids externos para os internos (densos), caso atribuídos na indexação
+        self.doc_id_map = None
 
     def index(self, term: str, doc_id: int, term_freq: int):
         if term not in self.dic_index:
@@ -55,18 +95,161 @@ class Index:
     def finish_indexing(self):
         pass
 
+    def iter_postings_batches(self, int_batch_postings: int = 1000000) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Percorre as ocorrências de todo o índice em lotes de termos. Cada lote é uma tupla
+        (term_ids, doc_count_with_term de cada termo, doc_ids, term_freqs), em que as
+        ocorrências dos termos estão concatenadas (na ordem dos termos) nos dois últimos arrays.
+        """
+        lst_term_ids, lst_doc_counts, lst_doc_ids, lst_term_freqs = [], [], [], []
+        int_postings = 0
+        for str_term in self.dic_index:
+            arr_doc_ids, arr_term_freqs = self.get_occurrence_arrays(str_term)
+            if len(arr_doc_ids) == 0:
+                continue
+            lst_term_ids.append(self.get_term_id(str_term))
+            lst_doc_counts.append(len(arr_doc_ids))
+            lst_doc_ids.append(arr_doc_ids)
+            lst_term_freqs.append(arr_term_freqs)
+            int_postings += len(arr_doc_ids)
+            if int_postings >= int_batch_postings:
+                yield np.array(lst_term_ids, dtype=np.int64), np.array(lst_doc_counts, dtype=np.int64), np.concatenate(lst_doc_ids), np.concatenate(lst_term_freqs)
+                lst_term_ids, lst_doc_counts, lst_doc_ids, lst_term_freqs = [], [], [], []
+                int_postings = 0
+        if lst_term_ids:
+            yield np.array(lst_term_ids, dtype=np.int64), np.array(lst_doc_counts, dtype=np.int64), np.concatenate(lst_doc_ids), np.concatenate(lst_term_freqs)
+
+    def get_occurrence_arrays(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Ocorrências do termo como arrays (doc_ids, term_freqs), ordenadas pelo doc_id"""
+        lst_occur = self.get_occurrence_list(term)
+        if isinstance(lst_occur, OccurrenceList):
+            arr_doc_ids = np.asarray(lst_occur.doc_ids, dtype=np.int64)
+            arr_term_freqs = np.asarray(lst_occur.term_freqs, dtype=np.int64)
+        else:
+            arr_doc_ids = np.array([occur.doc_id for occur in lst_occur], dtype=np.int64)
+            arr_term_freqs = np.array([occur.term_freq for occur in lst_occur], dtype=np.int64)
+        if len(arr_doc_ids) > 1 and (np.diff(arr_doc_ids) < 0).any():
+            arr_order = np.argsort(arr_doc_ids, kind="stable")
+            arr_doc_ids, arr_term_freqs = arr_doc_ids[arr_order], arr_term_freqs[arr_order]
+        return arr_doc_ids, arr_term_freqs
+
+    def get_occurrence_lists(self, terms) -> dict:
+        """
+        Ocorrências (OccurrenceList, sobre arrays) de vários termos de uma vez, para que sejam
+        compartilhadas por várias consultas. Termos inexistentes possuem listas vazias.
+        """
+        dic_occurrences = {}
+        for term in terms:
+            term_id = self.get_term_id(term) if term in self.dic_index else None
+            dic_occurrences[term] = OccurrenceList(term_id, *self.get_occurrence_arrays(term))
+        return dic_occurrences
+
+    def get_posting_cursor(self, term: str) -> "PostingCursor":
+        """
+        Cursor (PostingCursor) sobre as ocorrências do termo. Nos índices em memória as
+        ocorrências já estão disponíveis e o cursor apenas as percorre.
+        """
+        term_id = self.get_term_id(term) if term in self.dic_index else None
+        return ArrayPostingCursor(term_id, *self.get_occurrence_arrays(term))
+
+    def get_postings_block(self, term: str) -> bytes:
+        """Retorna as ocorrências do termo no formato compactado de encode_postings"""
+        return encode_postings(*self.get_occurrence_arrays(term))
+
     def write(self, arq_index: str):
+        """
+        Grava o índice no formato binário versionado (INDEX_VERSION), composto por:
+            cabeçalho (INDEX_HEADER): assinatura, versão, quantidade de termos e de
+                documentos e a posição de cada um dos blocos abaixo
+            léxico: um registro (LEXICON_DTYPE) por termo, ordenado pelo termo em UTF-8,
+                com term_id, doc_count_with_term, posição/tamanho das suas ocorrências e
+                posição/quantidade de entradas da sua tabela de saltos
+            termos: os termos em UTF-8 concatenados, referenciados pelo léxico
+            documentos: os doc_ids indexados (inteiros de 4 bytes, ordenados)
+            ocorrências: os blocos compactados de cada termo (ver encode_postings) seguidos das
+                tabelas de saltos (encode_skip_table) dos termos com pelo menos
+                FileIndex.SKIP_MIN_DOC_COUNT documentos, como em FileIndex.finish_indexing
+        Todos os inteiros são little-endian. Como o léxico é ordenado, Index.read pode
+        mapeá-lo em memória e localizar os termos por busca binária (ver Lexicon).
+        Termos sem ocorrências (ex.: todas removidas de um SegmentedIndex) não são gravados e os
+        term_ids gravados são renumerados (mantendo a ordem) para continuarem densos (0..n-1),
+        já que os arrays indexados pelo term_id (ex.: IndexPreComputedVals) têm um elemento por termo.
+        Caso o índice possua um DocIdMap (doc_ids internos densos), ele é gravado em
+        "{arq_index}.docids.npy" (ver DocIdMap.write). Os arquivos "{arq_index}.<nome>.npy" de um
+        índice gravado anteriormente com o mesmo nome são removidos.
+        """
+        lst_terms = sorted((str_term for str_term in self.dic_index.keys() if self.document_count_with_term(str_term) > 0),
+                           key=lambda str_term: str_term.encode("utf-8"))
+        arr_term_ids = np.array([self.get_term_id(str_term) for str_term in lst_terms], dtype=np.int64)
+        arr_lexicon = np.zeros(len(lst_terms), dtype=LEXICON_DTYPE)
+        arr_lexicon["term_id"] = np.argsort(np.argsort(arr_term_ids, kind="stable"), kind="stable")
+        terms_blob = bytearray()
+        for i, str_term in enumerate(lst_terms):
+            term_bytes = str_term.encode("utf-8")
+            arr_lexicon[i]["term_offset"] = len(terms_blob)
+            arr_lexicon[i]["term_length"] = len(term_bytes)
+            terms_blob += term_bytes
+        arr_doc_ids = np.array(sorted(self.set_documents), dtype="<u4")
+
+        int_lexicon_pos = INDEX_HEADER.size
+        int_terms_pos = int_lexicon_pos + arr_lexicon.nbytes
+        int_docs_pos = int_terms_pos + len(terms_blob)
+        int_postings_pos = int_docs_pos + arr_doc_ids.nbytes
         with open(arq_index, 'wb') as idx_file:
-            pickle.dump(self,idx_file)
-                
-        
-    
+            idx_file.seek(int_terms_pos)
+            idx_file.write(terms_blob)
+            idx_file.write(arr_doc_ids.tobytes())
+
+            lst_skip_tables = []
+            for i, str_term in enumerate(lst_terms):
+                block = self.get_postings_block(str_term)
+                arr_lexicon[i]["postings_offset"] = idx_file.tell() - int_postings_pos
+                arr_lexicon[i]["postings_length"] = len(block)
+                arr_lexicon[i]["doc_count"] = self.document_count_with_term(str_term)
+                idx_file.write(block)
+                if arr_lexicon[i]["doc_count"] >= FileIndex.SKIP_MIN_DOC_COUNT:
+                    arr_postings = decode_postings(block)
+                    lst_skip_tables.append((i, encode_skip_table(arr_postings["doc_id"], arr_postings["term_freq"],
+                                                                 FileIndex.SKIP_BLOCK_SIZE)))
+
+            # as tabelas ficam após todos os blocos, para que eles continuem contíguos
+            for i, arr_skips in lst_skip_tables:
+                arr_lexicon[i]["skip_offset"] = idx_file.tell() - int_postings_pos
+                arr_lexicon[i]["skip_count"] = len(arr_skips)
+                idx_file.write(arr_skips.tobytes())
+            int_postings_length = idx_file.tell() - int_postings_pos
+
+            idx_file.seek(0)
+            idx_file.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(lst_terms), len(arr_doc_ids),
+                                             int_lexicon_pos, int_terms_pos, len(terms_blob),
+                                             int_docs_pos, int_postings_pos, int_postings_length,
+                                             FileIndex.SKIP_BLOCK_SIZE))
+            idx_file.write(arr_lexicon.tobytes())
+
+        # valores derivados de um índice gravado anteriormente com o mesmo nome (o mapeamento de
+        # doc_ids e os valores de IndexPreComputedVals) não correspondem ao novo índice
+        for str_file in glob.glob(f"{glob.escape(arq_index)}.*.npy"):
+            os.remove(str_file)
+        if getattr(self, "doc_id_map", None) is not None:
+            self.doc_id_map.write(arq_index)
 
     @staticmethod
     def read(arq_index: str):
-        sys.path.append('index')
+        """
+        Abre um índice gravado por Index.write como um FileIndex somente leitura, sem
+        carregar o léxico nem as ocorrências (ambos são mapeados em memória).
+        Índices gravados com pickle (versões anteriores) ainda são lidos. Caso arq_index seja
+        um diretório, abre o índice segmentado (SegmentedIndex) gravado nele.
+        """
+        if path.isdir(arq_index):
+            return SegmentedIndex(arq_index)
         with open(arq_index, 'rb') as idx_file:
-            return pickle.load(idx_file)
+            magic = idx_file.read(len(INDEX_MAGIC))
+            if magic != INDEX_MAGIC:
+                sys.path.append('index')
+                idx_file.seek(0)
+                return pickle.load(idx_file)
+        return FileIndex.open_index_file(arq_index)
 
     def __str__(self):
         arr_index = []
@@ -114,6 +297,293 @@ class TermOccurrence:
         return str(self)
 
 
+# layout de uma ocorrência gravada por TermOccurrence.write (usado nas execuções intermediárias):
+# três inteiros big-endian de 4 bytes
+OCCURRENCE_DTYPE = np.dtype([("doc_id", ">u4"), ("term_id", ">u4"), ("term_freq", ">u4")])
+
+
+# layout de uma ocorrência decodificada do arquivo final compactado
+POSTING_DTYPE = np.dtype([("doc_id", np.uint32), ("term_freq", np.uint32)])
+# tabela de saltos de um termo: por bloco de ocorrências, o último doc_id e a posição (em bytes,
+# a partir do início do bloco compactado do termo) em que o bloco termina
+SKIP_DTYPE = np.dtype([("last_doc_id", "<u4"), ("postings_end", "<u8")])
+
+
+def vbyte_sizes(arr_values) -> np.ndarray:
+    """Quantidade de bytes de cada inteiro codificado por vbyte_encode"""
+    arr_values = np.asarray(arr_values, dtype=np.uint64)
+    arr_num_bytes = np.ones(len(arr_values), dtype=np.int64)
+    for int_bits in (7, 14, 21, 28):
+        arr_num_bytes += arr_values >= (1 << int_bits)
+    return arr_num_bytes
+
+
+def vbyte_encode(arr_values) -> bytes:
+    """
+    Codifica inteiros sem sinal em Variable Byte: 7 bits por byte, do grupo mais
+    significativo para o menos significativo, com o bit mais alto ligado apenas no
+    último byte de cada inteiro.
+    """
+    arr_values = np.asarray(arr_values, dtype=np.uint64)
+    arr_num_bytes = vbyte_sizes(arr_values)
+    arr_ends = np.cumsum(arr_num_bytes) - 1
+    arr_bytes = np.zeros(int(arr_ends[-1]) + 1 if len(arr_ends) else 0, dtype=np.uint8)
+
+    # k-ésimo grupo de 7 bits (a partir do menos significativo) de cada inteiro que o possui
+    for k in range(5):
+        arr_has_group = arr_num_bytes > k
+        if not arr_has_group.any():
+            break
+        arr_groups = (arr_values[arr_has_group] >> np.uint64(7*k)) & np.uint64(0x7f)
+        arr_bytes[arr_ends[arr_has_group] - k] = arr_groups
+    arr_bytes[arr_ends] |= 0x80
+    return arr_bytes.tobytes()
+
+
+def vbyte_decode(buffer) -> np.ndarray:
+    """Decodifica (de forma vetorizada) uma sequência de inteiros gerada por vbyte_encode."""
+    arr_bytes = np.frombuffer(buffer, dtype=np.uint8)
+    if len(arr_bytes) == 0:
+        return np.empty(0, dtype=np.uint32)
+    arr_ends = np.flatnonzero(arr_bytes & 0x80)
+    arr_starts = np.empty_like(arr_ends)
+    arr_starts[0] = 0
+    arr_starts[1:] = arr_ends[:-1] + 1
+
+    arr_values = (arr_bytes & 0x7f).astype(np.uint64)
+    if len(arr_ends) != len(arr_bytes):
+        # há inteiros com mais de um byte: desloca cada grupo conforme sua distância até o último byte
+        arr_group = np.repeat(np.arange(len(arr_ends)), arr_ends - arr_starts + 1)
+        arr_shifts = (7*(arr_ends[arr_group] - np.arange(len(arr_bytes)))).astype(np.uint64)
+        arr_values = np.add.reduceat(arr_values << arr_shifts, arr_starts)
+    return arr_values.astype(np.uint32)
+
+
+def encode_postings(arr_doc_ids, arr_term_freqs) -> bytes:
+    """
+    Codifica as ocorrências de um termo (ordenadas por doc_id) intercalando o intervalo
+    (gap) entre doc_ids consecutivos e a frequência do termo, ambos em Variable Byte.
+    """
+    arr_doc_ids = np.asarray(arr_doc_ids, dtype=np.int64)
+    arr_values = np.empty(2*len(arr_doc_ids), dtype=np.uint64)
+    arr_values[0::2] = np.diff(arr_doc_ids, prepend=0)
+    arr_values[1::2] = arr_term_freqs
+    return vbyte_encode(arr_values)
+
+
+def encode_skip_table(arr_doc_ids, arr_term_freqs, int_block_size: int) -> np.ndarray:
+    """
+    Tabela de saltos (SKIP_DTYPE) do bloco gerado por encode_postings, com uma entrada a cada
+    int_block_size ocorrências (a última entrada pode ter menos ocorrências).
+    """
+    arr_doc_ids = np.asarray(arr_doc_ids, dtype=np.int64)
+    arr_sizes = vbyte_sizes(np.diff(arr_doc_ids, prepend=0)) + vbyte_sizes(arr_term_freqs)
+    arr_block_ends = np.arange(int_block_size-1, len(arr_doc_ids)+int_block_size-1, int_block_size)
+    arr_block_ends[-1] = len(arr_doc_ids)-1
+    arr_skips = np.empty(len(arr_block_ends), dtype=SKIP_DTYPE)
+    arr_skips["last_doc_id"] = arr_doc_ids[arr_block_ends]
+    arr_skips["postings_end"] = np.cumsum(arr_sizes)[arr_block_ends]
+    return arr_skips
+
+
+def decode_postings(buffer) -> np.ndarray:
+    """Inverso de encode_postings: retorna um array estruturado (POSTING_DTYPE)."""
+    arr_values = vbyte_decode(buffer)
+    arr_postings = np.empty(len(arr_values)//2, dtype=POSTING_DTYPE)
+    arr_postings["doc_id"] = np.cumsum(arr_values[0::2], dtype=np.uint64)
+    arr_postings["term_freq"] = arr_values[1::2]
+    return arr_postings
+
+
+class OccurrenceList:
+    """
+    Lista de ocorrências de um termo representada por arrays (doc_ids e term_freqs).
+    Os objetos TermOccurrence são criados apenas quando a lista é percorrida ou indexada,
+    assim quem precisa apenas dos arrays (ex.: modelos de ranking) não paga essa alocação.
+    """
+    def __init__(self, term_id: int, doc_ids, term_freqs):
+        self.term_id = term_id
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return OccurrenceList(self.term_id, self.doc_ids[position], self.term_freqs[position])
+        return TermOccurrence(int(self.doc_ids[position]), self.term_id, int(self.term_freqs[position]))
+
+    def __iter__(self):
+        for doc_id, term_freq in zip(self.doc_ids.tolist(), self.term_freqs.tolist()):
+            yield TermOccurrence(doc_id, self.term_id, term_freq)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, OccurrenceList)):
+            return len(self) == len(other) and all(occur == other_occur for occur, other_occur in zip(self, other))
+        return False
+
+    def __str__(self):
+        return str(list(self))
+
+    def __repr__(self):
+        return str(self)
+
+
+class PostingCursor:
+    """
+    Cursor sobre o bloco compactado (encode_postings) de um termo. Com uma tabela de saltos
+    (encode_skip_table), o bloco é decodificado por partes: advance pula, sem decodificar,
+    as partes cujo último doc_id é menor que o doc_id procurado. Sem a tabela, todo o bloco
+    é decodificado no primeiro acesso.
+
+    O tamanho do cursor (len) é a quantidade total de ocorrências do termo (sem decodificá-las)
+    e remaining é a quantidade que ainda não foi percorrida.
+    """
+    def __init__(self, term_id: int, buffer, doc_count: int, arr_skips: np.ndarray = None, int_block_size: int = None,
+                 on_full_decode=None):
+        self.term_id = term_id
+        # chamado com (doc_ids, term_freqs) quando remaining_arrays decodifica toda a lista
+        self.on_full_decode = on_full_decode
+        self.buffer = buffer
+        self.doc_count = doc_count
+        if arr_skips is None or len(arr_skips) == 0:
+            self.arr_last_doc_ids = np.array([np.iinfo(np.int64).max], dtype=np.int64)
+            self.arr_postings_ends = np.array([len(buffer)], dtype=np.int64)
+            self.int_block_size = doc_count
+        else:
+            self.arr_last_doc_ids = arr_skips["last_doc_id"].astype(np.int64)
+            self.arr_postings_ends = arr_skips["postings_end"].astype(np.int64)
+            self.int_block_size = int_block_size
+        # quantidade de ocorrências decodificadas até o momento
+        self.postings_decoded = 0
+        self.int_block = -1
+        # quantidade de ocorrências anteriores ao bloco atual (todas, ao final da lista)
+        self.int_block_start = 0
+        self.int_position = 0
+        self.arr_doc_ids = np.empty(0, dtype=np.int64)
+        self.arr_term_freqs = np.empty(0, dtype=np.int64)
+
+    def load_block(self, int_block: int):
+        int_start = int(self.arr_postings_ends[int_block-1]) if int_block > 0 else 0
+        arr_values = vbyte_decode(self.buffer[int_start:int(self.arr_postings_ends[int_block])])
+        # o primeiro intervalo do bloco é relativo ao último doc_id do bloco anterior
+        int_base_doc_id = int(self.arr_last_doc_ids[int_block-1]) if int_block > 0 else 0
+        self.arr_doc_ids = np.cumsum(arr_values[0::2], dtype=np.int64) + int_base_doc_id
+        self.arr_term_freqs = arr_values[1::2]
+        self.int_block = int_block
+        self.int_block_start = int_block*self.int_block_size
+        self.int_position = 0
+        self.postings_decoded += len(self.arr_doc_ids)
+
+    def peek(self) -> TermOccurrence:
+        """Ocorrência atual (sem avançar) ou None ao final da lista"""
+        while self.int_position == len(self.arr_doc_ids):
+            if self.int_block+1 == len(self.arr_postings_ends):
+                return None
+            self.load_block(self.int_block+1)
+        return TermOccurrence(int(self.arr_doc_ids[self.int_position]), self.term_id,
+                              int(self.arr_term_freqs[self.int_position]))
+
+    def next(self) -> TermOccurrence:
+        """Retorna a ocorrência atual e avança para a próxima; None ao final da lista"""
+        occur = self.peek()
+        if occur is not None:
+            self.int_position += 1
+        return occur
+
+    def advance(self, target_doc_id: int) -> TermOccurrence:
+        """
+        Avança até a primeira ocorrência com doc_id >= target_doc_id e a retorna (sem
+        consumi-la: ela também é a próxima retornada por next); None caso não exista.
+        """
+        if self.int_block < 0 or self.int_position == len(self.arr_doc_ids) or self.arr_doc_ids[-1] < target_doc_id:
+            int_block = int(np.searchsorted(self.arr_last_doc_ids, target_doc_id))
+            int_block = max(int_block, self.int_block+1)
+            if int_block == len(self.arr_postings_ends):
+                # final da lista: nenhuma ocorrência restante
+                self.arr_doc_ids = np.empty(0, dtype=np.int64)
+                self.arr_term_freqs = np.empty(0, dtype=np.int64)
+                self.int_block = len(self.arr_postings_ends)-1
+                self.int_block_start = self.doc_count
+                self.int_position = 0
+                return None
+            self.load_block(int_block)
+        self.int_position += int(np.searchsorted(self.arr_doc_ids[self.int_position:], target_doc_id))
+        return self.peek()
+
+    def lookup(self, arr_doc_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Procura de uma vez os doc_ids (ordenados e não menores que a ocorrência atual) no restante
+        da lista, decodificando apenas os blocos da tabela de saltos que podem contê-los. Retorna a
+        máscara dos doc_ids encontrados e a frequência do termo em cada um deles. O cursor para na
+        primeira ocorrência com doc_id >= último doc_id procurado, como em advance.
+        """
+        arr_doc_ids = np.asarray(arr_doc_ids, dtype=np.int64)
+        arr_found = np.zeros(len(arr_doc_ids), dtype=bool)
+        lst_term_freqs = []
+        arr_blocks = np.searchsorted(self.arr_last_doc_ids, arr_doc_ids)
+        # os doc_ids estão ordenados: os de cada bloco são consecutivos
+        arr_block_starts = np.flatnonzero(np.diff(arr_blocks, prepend=-1))
+        for int_start, int_end in zip(arr_block_starts.tolist(), np.append(arr_block_starts[1:], len(arr_doc_ids)).tolist()):
+            int_block = int(arr_blocks[int_start])
+            if int_block == len(self.arr_postings_ends):
+                self.advance(int(arr_doc_ids[int_start]))
+                break
+            if int_block != self.int_block:
+                self.load_block(int_block)
+            arr_block_doc_ids = self.arr_doc_ids[self.int_position:]
+            arr_positions = np.searchsorted(arr_block_doc_ids, arr_doc_ids[int_start:int_end])
+            arr_in_block = arr_positions < len(arr_block_doc_ids)
+            arr_in_block[arr_in_block] = arr_block_doc_ids[arr_positions[arr_in_block]] == arr_doc_ids[int_start:int_end][arr_in_block]
+            arr_found[int_start:int_end] = arr_in_block
+            lst_term_freqs.append(self.arr_term_freqs[self.int_position:][arr_positions[arr_in_block]])
+            self.int_position += int(arr_positions[-1])
+        arr_term_freqs = np.concatenate(lst_term_freqs).astype(np.int64) if lst_term_freqs else np.empty(0, dtype=np.int64)
+        return arr_found, arr_term_freqs
+
+    @property
+    def remaining(self) -> int:
+        return self.doc_count - self.int_block_start - self.int_position
+
+    def remaining_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Consome as ocorrências restantes, retornando-as como arrays (doc_ids, term_freqs)"""
+        bol_full_decode = self.int_block < 0
+        lst_doc_ids, lst_term_freqs = [], []
+        while self.peek() is not None:
+            lst_doc_ids.append(self.arr_doc_ids[self.int_position:])
+            lst_term_freqs.append(self.arr_term_freqs[self.int_position:])
+            self.int_position = len(self.arr_doc_ids)
+        if len(lst_doc_ids) == 1:
+            arr_doc_ids, arr_term_freqs = lst_doc_ids[0], np.asarray(lst_term_freqs[0], dtype=np.int64)
+        else:
+            arr_doc_ids = np.concatenate(lst_doc_ids) if lst_doc_ids else np.empty(0, dtype=np.int64)
+            arr_term_freqs = np.concatenate(lst_term_freqs).astype(np.int64) if lst_term_freqs else np.empty(0, dtype=np.int64)
+        if bol_full_decode and self.on_full_decode is not None:
+            self.on_full_decode(arr_doc_ids, arr_term_freqs)
+        return arr_doc_ids, arr_term_freqs
+
+    def __len__(self):
+        return self.doc_count
+
+    def __iter__(self):
+        occur = self.next()
+        while occur is not None:
+            yield occur
+            occur = self.next()
+
+
+class ArrayPostingCursor(PostingCursor):
+    """PostingCursor sobre ocorrências já disponíveis em arrays (doc_ids ordenados e term_freqs)"""
+    def __init__(self, term_id: int, arr_doc_ids: np.ndarray, arr_term_freqs: np.ndarray):
+        super().__init__(term_id, b"", len(arr_doc_ids))
+        # um único bloco, já carregado
+        self.int_block = 0
+        self.arr_doc_ids = arr_doc_ids
+        self.arr_term_freqs = arr_term_freqs
+        self.postings_decoded = len(arr_doc_ids)
+
+
 # HashIndex é subclasse de Index
 class HashIndex(Index):
     def get_term_id(self, term: str):
@@ -131,39 +601,410 @@ class HashIndex(Index):
         return self.dic_index[term]
 
     def document_count_with_term(self, term: str) -> int:
-        return len(self.get_occurrence_list(term))
+        if term not in self.dic_index:
+            return 0
+        return len(self.dic_index[term])
+
+
+class TermPostings:
+    """
+    Entrada do CompactHashIndex: as ocorrências de um termo em colunas (doc_ids e
+    term_freqs) de inteiros sem sinal de 4 bytes, com o term_id armazenado uma única vez.
+    """
+    __slots__ = ("term_id", "doc_ids", "term_freqs")
+
+    def __init__(self, term_id: int):
+        self.term_id = term_id
+        self.doc_ids = array('I')
+        self.term_freqs = array('I')
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def __getstate__(self):
+        return (self.term_id, self.doc_ids, self.term_freqs)
+
+    def __setstate__(self, state):
+        self.term_id, self.doc_ids, self.term_freqs = state
+
+
+# CompactHashIndex armazena as ocorrências como arrays em vez de um TermOccurrence por (termo, documento)
+class CompactHashIndex(HashIndex):
+    def get_term_id(self, term: str):
+        return self.dic_index[term].term_id
+
+    def create_index_entry(self, termo_id: int) -> TermPostings:
+        return TermPostings(termo_id)
+
+    def add_index_occur(self, entry_dic_index: TermPostings, doc_id: int, term_id: int, term_freq: int):
+        entry_dic_index.doc_ids.append(doc_id)
+        entry_dic_index.term_freqs.append(term_freq)
+
+    def get_occurrence_list(self, term: str) -> List:
+        if term not in self.dic_index:
+            return []
+        entry = self.dic_index[term]
+        return OccurrenceList(entry.term_id, entry.doc_ids, entry.term_freqs)
+
+    def document_count_with_term(self, term: str) -> int:
+        if term not in self.dic_index:
+            return 0
+        return len(self.dic_index[term])
+
+
+class PostingCache:
+    """
+    Cache das ocorrências decodificadas (arrays) dos termos, limitado a int_max_bytes.
+    A remoção segue a política GreedyDual-Size-Frequency: a prioridade de uma entrada é
+    L + acertos*custo/tamanho, em que o custo é o tamanho do bloco compactado (proporcional
+    ao trabalho de lê-lo e decodificá-lo) e L é a prioridade da última entrada removida.
+    Assim, listas muito acessadas permanecem, mesmo longas, e entradas que deixam de ser
+    acessadas envelhecem à medida que L cresce. Os arrays guardados são somente leitura.
+
+    Pode ser usado por várias threads: get, put e clear alteram o dicionário, o heap e os
+    contadores sempre com a mesma trava (mantida apenas durante essas operações, e não durante a
+    leitura e a decodificação das listas, feitas fora do cache).
+
+    Cada acerto inclui uma nova prioridade no heap e as anteriores só são descartadas ao serem
+    removidas; para que o heap não cresça indefinidamente (ex.: um cache que nunca enche), ele é
+    reconstruído a partir das entradas atuais quando passa de HEAP_COMPACT_FACTOR vezes a
+    quantidade de entradas.
+    """
+    HEAP_COMPACT_FACTOR = 2
+    # tamanho mínimo do heap para a reconstrução (evita reconstruções frequentes com poucas entradas)
+    HEAP_COMPACT_MIN = 1024
+
+    def __init__(self, int_max_bytes: int):
+        self.lock = threading.Lock()
+        self.int_max_bytes = int_max_bytes
+        self.int_used_bytes = 0
+        # chave -> [prioridade, acertos, custo, array]
+        self.dic_entries = {}
+        # (prioridade, contador, chave); entradas desatualizadas são ignoradas ao remover
+        self.heap_priorities = []
+        self.int_counter = 0
+        self.float_inflation = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def priority(self, entry) -> float:
+        return self.float_inflation + entry[1]*entry[2]/max(1, entry[3].nbytes)
+
+    def push(self, key, entry):
+        # chamado com a trava: o contador desfaz os empates de prioridade no heap
+        entry[0] = self.priority(entry)
+        self.int_counter += 1
+        heapq.heappush(self.heap_priorities, (entry[0], self.int_counter, key))
+
+    def get(self, key) -> np.ndarray:
+        with self.lock:
+            entry = self.dic_entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry[1] += 1
+            self.push(key, entry)
+            if len(self.heap_priorities) > max(PostingCache.HEAP_COMPACT_MIN, PostingCache.HEAP_COMPACT_FACTOR*len(self.dic_entries)):
+                self.rebuild_heap()
+            return entry[3]
+
+    def rebuild_heap(self):
+        """Recria o heap com uma prioridade (a atual) por entrada. Chamado com a trava."""
+        lst_priorities = []
+        for key, entry in list(self.dic_entries.items()):
+            self.int_counter += 1
+            lst_priorities.append((entry[0], self.int_counter, key))
+        heapq.heapify(lst_priorities)
+        self.heap_priorities = lst_priorities
+
+    def put(self, key, arr_values: np.ndarray, int_cost: int):
+        if arr_values.nbytes > self.int_max_bytes:
+            return
+        arr_values.setflags(write=False)
+        with self.lock:
+            if key in self.dic_entries:
+                return
+            while self.int_used_bytes + arr_values.nbytes > self.int_max_bytes:
+                if not self.heap_priorities:
+                    self.rebuild_heap()
+                float_priority, _, evicted_key = heapq.heappop(self.heap_priorities)
+                evicted_entry = self.dic_entries.get(evicted_key)
+                if evicted_entry is None or evicted_entry[0] != float_priority:
+                    continue
+                self.float_inflation = float_priority
+                del self.dic_entries[evicted_key]
+                self.int_used_bytes -= evicted_entry[3].nbytes
+                self.evictions += 1
+            entry = [0.0, 1, int_cost, arr_values]
+            self.push(key, entry)
+            self.dic_entries[key] = entry
+            self.int_used_bytes += arr_values.nbytes
+
+    def clear(self):
+        with self.lock:
+            self.dic_entries = {}
+            self.heap_priorities = []
+            self.int_used_bytes = 0
+            self.float_inflation = 0.0
+
+    def __contains__(self, key) -> bool:
+        return key in self.dic_entries
+
+    def __len__(self):
+        return len(self.dic_entries)
 
 
 class TermFilePosition:
-    def __init__(self, term_id: int, term_file_start_pos: int = None, doc_count_with_term: int = None):
+    def __init__(self, term_id: int, term_file_start_pos: int = None, doc_count_with_term: int = None,
+                 term_file_length: int = None, skip_file_start_pos: int = None, skip_count: int = 0):
         self.term_id = term_id
 
         # a serem definidos após a indexação
+        # posição (em bytes) e tamanho do bloco compactado com as ocorrências do termo
         self.term_file_start_pos = term_file_start_pos
+        self.term_file_length = term_file_length
         self.doc_count_with_term = doc_count_with_term
+        # posição e quantidade de entradas da tabela de saltos (apenas termos frequentes a possuem)
+        self.skip_file_start_pos = skip_file_start_pos
+        self.skip_count = skip_count
 
     def __str__(self):
-        return f"term_id: {self.term_id}, doc_count_with_term: {self.doc_count_with_term}, term_file_start_pos: {self.term_file_start_pos}"
+        return f"term_id: {self.term_id}, doc_count_with_term: {self.doc_count_with_term}, term_file_start_pos: {self.term_file_start_pos}, term_file_length: {self.term_file_length}"
 
     def __repr__(self):
         return str(self)
 
 
+class DocIdMap:
+    """
+    Mapeamento entre os doc_ids externos (ex.: os nomes dos arquivos da Wikipédia, esparsos) e os
+    doc_ids internos do índice, densos (0..n-1): arr_external_ids[doc_id interno] = doc_id externo.
+    Com doc_ids densos, os arrays indexados pelo doc_id (ex.: IndexPreComputedVals.document_norm)
+    têm um elemento por documento e, quando documentos semelhantes recebem ids próximos (ex.:
+    ordenados pelo título), os intervalos entre doc_ids compactados por encode_postings diminuem.
+    Os doc_ids externos são localizados por busca binária (arr_order ordena os ids externos).
+    """
+    def __init__(self, arr_external_ids):
+        self.arr_external_ids = np.asarray(arr_external_ids, dtype=np.int64)
+        self.arr_order = np.argsort(self.arr_external_ids, kind="stable")
+        self.arr_sorted_external_ids = self.arr_external_ids[self.arr_order]
+
+    @staticmethod
+    def create(lst_external_ids, dic_sort_keys: Mapping = None) -> "DocIdMap":
+        """
+        Atribui os doc_ids internos na ordem de dic_sort_keys[doc_id externo] (ex.: os títulos de
+        read_titles), com os documentos sem chave ao final; empates, ou a ordem sem chaves, seguem
+        o doc_id externo.
+        """
+        lst_doc_ids = sorted(set(lst_external_ids))
+        if dic_sort_keys is not None:
+            lst_doc_ids.sort(key=lambda doc_id: (doc_id not in dic_sort_keys, dic_sort_keys.get(doc_id, "")))
+        return DocIdMap(lst_doc_ids)
+
+    @staticmethod
+    def read_titles(str_file: str) -> dict:
+        """Lê um arquivo com uma linha "doc_id;título" por documento (ex.: titlePerDoc.dat)"""
+        dic_titles = {}
+        with open(str_file, encoding="utf-8") as titles_file:
+            for str_line in titles_file:
+                str_doc_id, _, str_title = str_line.rstrip("\n").partition(";")
+                if str_doc_id.strip():
+                    dic_titles[int(str_doc_id)] = str_title.casefold()
+        return dic_titles
+
+    def to_external(self, internal_ids):
+        """doc_id(s) externo(s) de um doc_id interno ou de uma lista/array de doc_ids internos"""
+        if np.isscalar(internal_ids):
+            return int(self.arr_external_ids[internal_ids])
+        return self.arr_external_ids[np.asarray(internal_ids, dtype=np.int64)].tolist()
+
+    def to_internal(self, external_id: int) -> int:
+        int_position = int(np.searchsorted(self.arr_sorted_external_ids, external_id))
+        if int_position >= len(self.arr_sorted_external_ids) or self.arr_sorted_external_ids[int_position] != external_id:
+            raise KeyError(external_id)
+        return int(self.arr_order[int_position])
+
+    def __contains__(self, external_id) -> bool:
+        int_position = int(np.searchsorted(self.arr_sorted_external_ids, external_id))
+        return int_position < len(self.arr_sorted_external_ids) and self.arr_sorted_external_ids[int_position] == external_id
+
+    def __len__(self):
+        return len(self.arr_external_ids)
+
+    def write(self, arq_index: str):
+        np.save(f"{arq_index}.docids.npy", self.arr_external_ids)
+
+    @staticmethod
+    def read(arq_index: str) -> "DocIdMap":
+        """Lê o mapeamento gravado junto ao índice arq_index, ou None caso ele não exista"""
+        str_file = f"{arq_index}.docids.npy"
+        if not path.exists(str_file):
+            return None
+        return DocIdMap(np.load(str_file, mmap_mode="r"))
+
+
+class Lexicon(Mapping):
+    """
+    Léxico (termo -> TermFilePosition) de um índice gravado por Index.write. Os registros
+    ficam no arquivo mapeado em memória e são localizados por busca binária; cada
+    TermFilePosition é criado apenas quando o termo é consultado.
+    """
+    def __init__(self, arq_index: str):
+        with open(arq_index, 'rb') as idx_file:
+            self.index_mmap = mmap.mmap(idx_file.fileno(), 0, access=mmap.ACCESS_READ)
+        header, lexicon_dtype = unpack_index_header(self.index_mmap)
+        (_, _, int_term_count, _, int_lexicon_pos, int_terms_pos, int_terms_length,
+         _, self.int_postings_pos, _, _) = header
+        self.arr_lexicon = np.frombuffer(self.index_mmap, dtype=lexicon_dtype,
+                                         count=int_term_count, offset=int_lexicon_pos)
+        # índices da versão 1 não possuem tabelas de saltos
+        self.bol_skips = "skip_count" in lexicon_dtype.names
+        self.arr_term_offsets = self.arr_lexicon["term_offset"]
+        self.arr_term_lengths = self.arr_lexicon["term_length"]
+        self.terms_blob = memoryview(self.index_mmap)[int_terms_pos:int_terms_pos+int_terms_length]
+
+    def term_bytes(self, int_position: int) -> bytes:
+        int_start = int(self.arr_term_offsets[int_position])
+        return bytes(self.terms_blob[int_start:int_start+int(self.arr_term_lengths[int_position])])
+
+    def find(self, term: str) -> int:
+        """Busca binária pelo termo; retorna a sua posição no léxico ou -1 caso não exista."""
+        term_bytes = term.encode("utf-8")
+        int_low, int_high = 0, len(self.arr_lexicon)
+        while int_low < int_high:
+            int_middle = (int_low + int_high) // 2
+            if self.term_bytes(int_middle) < term_bytes:
+                int_low = int_middle + 1
+            else:
+                int_high = int_middle
+        if int_low < len(self.arr_lexicon) and self.term_bytes(int_low) == term_bytes:
+            return int_low
+        return -1
+
+    def __getitem__(self, term: str) -> TermFilePosition:
+        int_position = self.find(term) if isinstance(term, str) else -1
+        if int_position < 0:
+            raise KeyError(term)
+        return self.position_at(int_position)
+
+    def position_at(self, int_position: int) -> TermFilePosition:
+        record = self.arr_lexicon[int_position]
+        term_position = TermFilePosition(int(record["term_id"]),
+                                         self.int_postings_pos + int(record["postings_offset"]),
+                                         int(record["doc_count"]),
+                                         int(record["postings_length"]))
+        if self.bol_skips and record["skip_count"] > 0:
+            term_position.skip_file_start_pos = self.int_postings_pos + int(record["skip_offset"])
+            term_position.skip_count = int(record["skip_count"])
+        return term_position
+
+    def __contains__(self, term) -> bool:
+        return isinstance(term, str) and self.find(term) >= 0
+
+    def __iter__(self):
+        for int_position in range(len(self.arr_lexicon)):
+            yield self.term_bytes(int_position).decode("utf-8")
+
+    def items(self):
+        # percorre o léxico em ordem, sem uma busca binária por termo
+        for int_position in range(len(self.arr_lexicon)):
+            yield self.term_bytes(int_position).decode("utf-8"), self.position_at(int_position)
+
+    def values(self):
+        for int_position in range(len(self.arr_lexicon)):
+            yield self.position_at(int_position)
+
+    def __len__(self):
+        return len(self.arr_lexicon)
+
+
 class FileIndex(Index):
+    """
+    Leitura concorrente: após finish_indexing (ou ao ser aberto por Index.read), o índice pode
+    ser consultado por várias threads ao mesmo tempo. O léxico (dic_index) não é mais alterado,
+    o arquivo de ocorrências é mapeado em memória uma única vez (somente leitura) e compartilhado
+    por todas as threads e cada cursor (PostingCursor) tem o seu próprio estado. As únicas travas
+    são a da abertura do mapeamento (apenas na primeira leitura) e a do cache de ocorrências
+    (PostingCache), mantida apenas enquanto as suas entradas são consultadas ou alteradas: a
+    decodificação das listas é feita fora dela.
+    Indexar, chamar finish_indexing ou close_postings durante as leituras não é suportado.
+
+    As execuções (runs) e o arquivo final de ocorrências são gravados em um diretório próprio
+    de cada instância (criado por tempfile.mkdtemp dentro de str_work_dir ou, caso não seja
+    informado, do diretório temporário do sistema): instâncias indexadas ao mesmo tempo não
+    sobrescrevem (nem removem) os arquivos umas das outras.
+    """
     TMP_OCCURRENCES_LIMIT = 1000000
+    # quantidade máxima de execuções (runs) intercaladas de uma só vez
+    MERGE_FAN_IN = 64
+    # tamanho, em bytes, de uma ocorrência gravada por TermOccurrence.write
+    OCCURRENCE_SIZE = 12
+    # quantidade de ocorrências lidas de cada execução por vez durante a intercalação
+    RUN_READ_RECORDS = 4096
+    # termos com pelo menos SKIP_MIN_DOC_COUNT documentos recebem uma tabela de saltos,
+    # com uma entrada a cada SKIP_BLOCK_SIZE ocorrências
+    SKIP_MIN_DOC_COUNT = 1024
+    SKIP_BLOCK_SIZE = 128
+    # memória (em bytes) do cache de ocorrências decodificadas (PostingCache)
+    POSTING_CACHE_BYTES = 64*1024*1024
 
-    def __init__(self):
+    def __init__(self, merge_fan_in: int = MERGE_FAN_IN, posting_cache_bytes: int = POSTING_CACHE_BYTES,
+                 str_work_dir: str = None):
         super().__init__()
 
         self.lst_occurrences_tmp = [None]*FileIndex.TMP_OCCURRENCES_LIMIT
         self.idx_file_counter = 0
         self.str_idx_file_name = "occur_idx_file"
+        # diretório dos arquivos desta instância (criado na gravação da primeira execução)
+        self.str_work_dir = str_work_dir
+        self.str_instance_dir = None
+        # execuções ordenadas ainda não intercaladas
+        self.lst_run_file_names = []
+        self.merge_fan_in = max(2, merge_fan_in)
+        # tamanho dos blocos das tabelas de saltos gravadas por finish_indexing
+        self.skip_block_size = FileIndex.SKIP_BLOCK_SIZE
+        # arquivo final de ocorrências mapeado em memória (aberto na primeira leitura)
+        self.postings_mmap = None
+        self.postings_buffer = None
+        self.posting_cache = PostingCache(posting_cache_bytes)
+        self.open_postings_lock = threading.Lock()
         
 
         # metodos auxiliares para verifica o tamanho da lst_occurrences_tmp
         self.idx_tmp_occur_last_element  = -1
         self.idx_tmp_occur_first_element = 0
 
+    @staticmethod
+    def open_index_file(arq_index: str, posting_cache_bytes: int = POSTING_CACHE_BYTES) -> "FileIndex":
+        """Abre, somente para leitura, um índice gravado no formato de Index.write"""
+        with open(arq_index, 'rb') as idx_file:
+            header, _ = unpack_index_header(idx_file.read(INDEX_HEADER.size))
+            (_, _, _, int_doc_count, _, _, _, int_docs_pos, _, _, int_skip_block_size) = header
+
+        # não usa o __init__ para não alocar a lista de ocorrências temporárias
+        obj_index = FileIndex.__new__(FileIndex)
+        obj_index.dic_index = Lexicon(arq_index)
+        obj_index.set_documents = np.frombuffer(obj_index.dic_index.index_mmap, dtype="<u4",
+                                                count=int_doc_count, offset=int_docs_pos)
+        obj_index.lst_occurrences_tmp = []
+        obj_index.idx_file_counter = 0
+        obj_index.str_idx_file_name = arq_index
+        obj_index.str_work_dir = None
+        obj_index.str_instance_dir = None
+        obj_index.lst_run_file_names = []
+        obj_index.merge_fan_in = FileIndex.MERGE_FAN_IN
+        obj_index.skip_block_size = int_skip_block_size or FileIndex.SKIP_BLOCK_SIZE
+        obj_index.postings_mmap = None
+        obj_index.postings_buffer = None
+        obj_index.posting_cache = PostingCache(posting_cache_bytes)
+        obj_index.open_postings_lock = threading.Lock()
+        obj_index.doc_id_map = DocIdMap.read(arq_index)
+        obj_index.idx_tmp_occur_last_element  = -1
+        obj_index.idx_tmp_occur_first_element = 0
+        return obj_index
+
     def get_term_id(self, term: str):
         return self.dic_index[term].term_id
 
@@ -207,104 +1048,773 @@ class FileIndex(Index):
         return TermOccurrence(doc_id, term_id, term_freq)
 
     def save_tmp_occurrences(self):
-
-        # Ordena pelo term_id, doc_id
+        """
+        Ordena as ocorrências em memória por (term_id, doc_id) e grava-as em um novo
+        arquivo de execução (run) independente. As execuções são combinadas apenas uma
+        vez, em finish_indexing, por meio de uma intercalação de k vias.
+        """
         #    Para eficiência, todo o código deve ser feito com o garbage collector desabilitado gc.disable()
         gc.disable()
+        try:
+            lst_occurrences = self.lst_occurrences_tmp[self.idx_tmp_occur_first_element:self.idx_tmp_occur_last_element+1]
+            lst_occurrences.sort(key=lambda occur: (occur.term_id, occur.doc_id))
 
-        """comparar sempre a primeira posição
-        da lista com a primeira posição do arquivo usando os métodos next_from_list e next_from_file
-        e use o método write do TermOccurrence para armazenar cada ocorrencia do novo índice ordenado"""
-        self.lst_occurrences_tmp = sorted(self.lst_occurrences_tmp, key=lambda x: (x is None,x))
+            str_run_file_name = self.next_idx_file_name()
+            with open(str_run_file_name, "wb") as run_file:
+                for occur in lst_occurrences:
+                    occur.write(run_file)
 
-        oldFilename = self.str_idx_file_name
+            self.idx_tmp_occur_last_element  = -1
+            self.idx_tmp_occur_first_element = 0
+            self.lst_run_file_names.append(str_run_file_name)
+            self.str_idx_file_name = str_run_file_name
+        finally:
+            gc.enable()
 
-        if oldFilename == "occur_idx_file":
-            #Cria o arquivo se nao existir
-            file = open(oldFilename, "wb") 
-            file.close()
+    def next_idx_file_name(self) -> str:
+        if self.str_instance_dir is None:
+            self.str_instance_dir = tempfile.mkdtemp(prefix="occur_idx_", dir=self.str_work_dir)
+        str_file_name = path.join(self.str_instance_dir, f"occur_idx_file_{self.idx_file_counter}.idx")
+        self.idx_file_counter += 1
+        return str_file_name
 
-        newFileName = f"occur_idx_file_{ self.idx_file_counter}.idx"
-        
-        with open(oldFilename,"rb") as idx_new:
-            with open(newFileName,"wb") as idx_new_file:
-                file = self.next_from_file(idx_new)
-                list = self.next_from_list()
-                while file or list:
-                    if(file):
-                        if(list):
-                            if(file<list):
-                                file.write(idx_new_file)
-                                file = self.next_from_file(idx_new)
-                            else:
-                                list.write(idx_new_file)
-                                list = self.next_from_list()
-                        else:
-                             file.write(idx_new_file)
-                             file = self.next_from_file(idx_new)
-                    else:
-                        if(list):
-                            list.write(idx_new_file)
-                            list = self.next_from_list()
-                    
-                self.idx_tmp_occur_last_element  = -1
-                self.idx_tmp_occur_first_element = 0 
-        gc.enable()
-        idx_new_file.close()
-        idx_new.close()
-        self.idx_file_counter+=1
-        self.str_idx_file_name = newFileName
+    @staticmethod
+    def read_run_records(run_file):
+        """
+        Gera os registros (de OCCURRENCE_SIZE bytes) de um arquivo de execução junto com
+        a chave de ordenação (term_id, doc_id) em bytes big-endian, que pode ser comparada
+        diretamente sem decodificar os inteiros.
+        """
+        while True:
+            buffer = run_file.read(FileIndex.OCCURRENCE_SIZE * FileIndex.RUN_READ_RECORDS)
+            if not buffer:
+                return
+            for pos in range(0, len(buffer), FileIndex.OCCURRENCE_SIZE):
+                record = buffer[pos:pos+FileIndex.OCCURRENCE_SIZE]
+                yield record[4:8] + record[0:4], record
+
+    def merge_runs(self, lst_run_file_names: List[str], str_out_file_name: str):
+        """
+        Intercala (k vias, usando um heap) as execuções ordenadas em lst_run_file_names
+        no arquivo str_out_file_name. As execuções intercaladas são removidas.
+        """
+        lst_run_files = [open(str_run_file_name, "rb") for str_run_file_name in lst_run_file_names]
+        try:
+            with open(str_out_file_name, "wb") as out_file:
+                lst_readers = [FileIndex.read_run_records(run_file) for run_file in lst_run_files]
+                for _, record in heapq.merge(*lst_readers, key=lambda key_record: key_record[0]):
+                    out_file.write(record)
+        finally:
+            for run_file in lst_run_files:
+                run_file.close()
+
+        for str_run_file_name in lst_run_file_names:
+            os.remove(str_run_file_name)
+
+    def reduce_runs(self, int_max_runs: int) -> List[str]:
+        """
+        Faz passadas intermediárias de intercalação, cada uma combinando grupos de até
+        merge_fan_in execuções, até restarem no máximo int_max_runs execuções.
+        """
+        lst_runs = self.lst_run_file_names
+        while len(lst_runs) > int_max_runs:
+            lst_next_runs = []
+            int_group_size = min(self.merge_fan_in, len(lst_runs))
+            for i in range(0, len(lst_runs), int_group_size):
+                lst_group = lst_runs[i:i+int_group_size]
+                if len(lst_group) == 1:
+                    lst_next_runs.append(lst_group[0])
+                    continue
+                str_merged_file_name = self.next_idx_file_name()
+                self.merge_runs(lst_group, str_merged_file_name)
+                lst_next_runs.append(str_merged_file_name)
+            lst_runs = lst_next_runs
+
+        self.lst_run_file_names = lst_runs
+        return lst_runs
+
+    def merge_all_runs(self) -> str:
+        """
+        Intercala todas as execuções em um único arquivo (no formato de TermOccurrence.write).
+        Caso existam mais execuções do que merge_fan_in, são feitas passadas intermediárias.
+        """
+        if len(self.lst_run_file_names) == 0:
+            str_empty_file_name = self.next_idx_file_name()
+            open(str_empty_file_name, "wb").close()
+            self.lst_run_file_names = [str_empty_file_name]
+
+        self.reduce_runs(1)
+        self.str_idx_file_name = self.lst_run_file_names[0]
+        return self.str_idx_file_name
+
+    def write_term_postings(self, idx_file, int_term_id: int, term_records: bytearray, dic_positions_per_id,
+                            lst_skip_tables: List = None):
+        arr_occurrences = np.frombuffer(term_records, dtype=OCCURRENCE_DTYPE)
+        block = encode_postings(arr_occurrences["doc_id"], arr_occurrences["term_freq"])
+
+        term_position = dic_positions_per_id[int_term_id]
+        term_position.term_file_start_pos = idx_file.tell()
+        term_position.term_file_length = len(block)
+        term_position.doc_count_with_term = len(arr_occurrences)
+        idx_file.write(block)
+
+        if lst_skip_tables is not None and len(arr_occurrences) >= self.SKIP_MIN_DOC_COUNT:
+            arr_skips = encode_skip_table(arr_occurrences["doc_id"], arr_occurrences["term_freq"], self.skip_block_size)
+            term_position.skip_count = len(arr_skips)
+            lst_skip_tables.append((term_position, arr_skips))
 
     def finish_indexing(self):
-        if len(self.lst_occurrences_tmp) > 0:
+        """
+        Intercala as execuções restantes (no máximo merge_fan_in, após as passadas
+        intermediárias) diretamente no arquivo final, em que as ocorrências de cada termo
+        formam um bloco compactado (ver encode_postings) sem o term_id, já que o arquivo
+        é agrupado por termo. A posição e o tamanho de cada bloco ficam em TermFilePosition.
+        Os termos frequentes (SKIP_MIN_DOC_COUNT) recebem também uma tabela de saltos
+        (encode_skip_table), gravada após todas as ocorrências para que os blocos continuem
+        contíguos (ver iter_postings_batches).
+        """
+        self.close_postings()
+        self.posting_cache.clear()
+        if self.get_tmp_occur_size() > 0:
             self.save_tmp_occurrences()
+        lst_runs = self.reduce_runs(self.merge_fan_in)
 
-        # Sugestão: faça a navegação e obetenha um mapeamento
-        # id_termo -> obj_termo armazene-o em dic_ids_por_termo
-        # obj_termo é a instancia TermFilePosition correspondente ao id_termo
-        dic_ids_por_termo = {}
-        for str_term, obj_term in self.dic_index.items():
-            dic_ids_por_termo[obj_term.term_id] = str_term
-  
-        with open(self.str_idx_file_name, 'rb') as idx_file:
-            # navega nas ocorrencias para atualizar cada termo em dic_ids_por_termo
-            # apropriadamente
-            file = self.next_from_file(idx_file)
-            size_of_occur = 0;
+        # mapeamento id_termo -> TermFilePosition correspondente
+        dic_positions_per_id = {}
+        for obj_term in self.dic_index.values():
+            dic_positions_per_id[obj_term.term_id] = obj_term
 
-            while file:   
+        str_final_file_name = self.next_idx_file_name()
+        self.skip_block_size = self.SKIP_BLOCK_SIZE
+        lst_skip_tables = []
+        lst_run_files = [open(str_run_file_name, "rb") for str_run_file_name in lst_runs]
+        try:
+            with open(str_final_file_name, "wb") as idx_file:
+                lst_readers = [FileIndex.read_run_records(run_file) for run_file in lst_run_files]
+                last_term_key = None
+                term_records = bytearray()
+                for key, record in heapq.merge(*lst_readers, key=lambda key_record: key_record[0]):
+                    if key[0:4] != last_term_key:
+                        if last_term_key is not None:
+                            self.write_term_postings(idx_file, int.from_bytes(last_term_key, byteorder="big"),
+                                                     term_records, dic_positions_per_id, lst_skip_tables)
+                        last_term_key = key[0:4]
+                        term_records = bytearray()
+                    term_records += record
+                if last_term_key is not None:
+                    self.write_term_postings(idx_file, int.from_bytes(last_term_key, byteorder="big"),
+                                             term_records, dic_positions_per_id, lst_skip_tables)
 
-                term = dic_ids_por_termo[file.term_id]          
-                
-                if self.dic_index[term].doc_count_with_term is None:
-                    self.dic_index[term].doc_count_with_term = 0
+                for term_position, arr_skips in lst_skip_tables:
+                    term_position.skip_file_start_pos = idx_file.tell()
+                    idx_file.write(arr_skips.tobytes())
+        finally:
+            for run_file in lst_run_files:
+                run_file.close()
 
-                if self.dic_index[term].term_file_start_pos is None:
-                    self.dic_index[term].term_file_start_pos = size_of_occur
+        for str_run_file_name in lst_runs:
+            os.remove(str_run_file_name)
+        self.lst_run_file_names = []
+        self.str_idx_file_name = str_final_file_name
 
-                self.dic_index[term].doc_count_with_term += 1
+    def open_postings(self) -> memoryview:
+        """
+        Mapeia em memória o arquivo final de ocorrências (uma única vez) e retorna uma
+        visão (memoryview) sobre os seus bytes. Depois de aberto, o mapeamento é apenas lido,
+        sem trava; a trava garante que threads concorrentes na primeira leitura o abram uma só vez.
+        """
+        postings_buffer = self.postings_buffer
+        if postings_buffer is not None:
+            return postings_buffer
+        with self.open_postings_lock:
+            if self.postings_buffer is None:
+                with open(self.str_idx_file_name, 'rb') as idx_file:
+                    if os.fstat(idx_file.fileno()).st_size == 0:
+                        self.postings_buffer = memoryview(b"")
+                    else:
+                        self.postings_mmap = mmap.mmap(idx_file.fileno(), 0, access=mmap.ACCESS_READ)
+                        self.postings_buffer = memoryview(self.postings_mmap)
+            return self.postings_buffer
 
-                size_of_occur += 12              
-                file = self.next_from_file(idx_file)         
+    def close_postings(self):
+        if self.postings_buffer is not None:
+            self.postings_buffer.release()
+            self.postings_buffer = None
+        if self.postings_mmap is not None:
+            self.postings_mmap.close()
+            self.postings_mmap = None
 
+    def get_postings(self, term: str) -> np.ndarray:
+        """
+        Decodifica o bloco compactado do termo, lido do arquivo mapeado em memória
+        ([term_file_start_pos, term_file_start_pos+term_file_length)), em um array
+        estruturado (POSTING_DTYPE) com doc_id e term_freq. Os arrays decodificados ficam no
+        cache de ocorrências (posting_cache) e são somente leitura.
+        """
+        if term not in self.dic_index:
+            return np.empty(0, dtype=POSTING_DTYPE)
+        term_position = self.dic_index[term]
+        arr_postings = self.posting_cache.get(term_position.term_id)
+        if arr_postings is None:
+            arr_postings = self.decode_term_postings(term_position)
+            self.posting_cache.put(term_position.term_id, arr_postings, term_position.term_file_length)
+        return arr_postings
+
+    def decode_term_postings(self, term_position: TermFilePosition) -> np.ndarray:
+        int_start = term_position.term_file_start_pos
+        return decode_postings(self.open_postings()[int_start:int_start+term_position.term_file_length])
+
+    def get_occurrence_lists(self, terms) -> dict:
+        """Mesmo que Index.get_occurrence_lists, mas lendo os blocos na ordem em que estão no arquivo"""
+        lst_terms = [term for term in terms if term in self.dic_index]
+        dic_positions = {term:self.dic_index[term] for term in lst_terms}
+        dic_occurrences = {term:[] for term in terms if term not in dic_positions}
+        for term in sorted(lst_terms, key=lambda term: dic_positions[term].term_file_start_pos):
+            arr_postings = self.get_postings(term)
+            dic_occurrences[term] = OccurrenceList(dic_positions[term].term_id, arr_postings["doc_id"], arr_postings["term_freq"])
+        return dic_occurrences
+
+    def warm_posting_cache(self, int_top_n: int):
+        """
+        Carrega no cache de ocorrências os int_top_n termos com mais documentos (até o limite
+        de memória do cache), lendo os seus blocos na ordem em que estão no arquivo.
+        """
+        if isinstance(self.dic_index, Lexicon):
+            arr_positions = np.argsort(-self.dic_index.arr_lexicon["doc_count"].astype(np.int64), kind="stable")[:int_top_n]
+            lst_term_positions = [self.dic_index.position_at(int(int_position)) for int_position in arr_positions]
+        else:
+            lst_term_positions = sorted(self.dic_index.values(), key=lambda term_position: -term_position.doc_count_with_term)[:int_top_n]
+        for term_position in sorted(lst_term_positions, key=lambda term_position: term_position.term_file_start_pos):
+            if term_position.term_id not in self.posting_cache:
+                self.posting_cache.put(term_position.term_id, self.decode_term_postings(term_position),
+                                       term_position.term_file_length)
 
     def get_occurrence_list(self, term: str) -> List:
+        if term not in self.dic_index:
+            return []
+        arr_postings = self.get_postings(term)
+        return OccurrenceList(self.dic_index[term].term_id, arr_postings["doc_id"], arr_postings["term_freq"])
 
-        occurList = []
-        
-        if term in self.dic_index.keys():
-            
-            with open(self.str_idx_file_name, 'rb') as idx_file:
-                idx_file.seek(self.dic_index[term].term_file_start_pos)
-                #print(f"Numero de ocorrencias: {self.dic_index[term].doc_count_with_term}")
-                file = self.next_from_file(idx_file)
-                while file:
-                    
-                    if self.dic_index[term].doc_count_with_term == len(occurList):                    
-                        break
-                    occurList.append(file)
-                    file = self.next_from_file(idx_file)            
-        return occurList
+    def get_posting_cursor(self, term: str) -> PostingCursor:
+        """
+        Cursor (PostingCursor) sobre as ocorrências do termo. Se as ocorrências estiverem no cache,
+        o cursor percorre o array guardado. Caso contrário, termos sem tabela de saltos são
+        decodificados (e guardados no cache) de uma só vez; os com tabela de saltos são
+        decodificados por partes, e guardados no cache apenas se forem lidos por completo.
+        """
+        if term not in self.dic_index:
+            return ArrayPostingCursor(None, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+        term_position = self.dic_index[term]
+        arr_postings = self.posting_cache.get(term_position.term_id)
+        if arr_postings is None and not term_position.skip_count:
+            arr_postings = self.decode_term_postings(term_position)
+            self.posting_cache.put(term_position.term_id, arr_postings, term_position.term_file_length)
+        if arr_postings is not None:
+            return ArrayPostingCursor(term_position.term_id, arr_postings["doc_id"], arr_postings["term_freq"])
+
+        def cache_postings(arr_doc_ids, arr_term_freqs):
+            arr_postings = np.empty(len(arr_doc_ids), dtype=POSTING_DTYPE)
+            arr_postings["doc_id"] = arr_doc_ids
+            arr_postings["term_freq"] = arr_term_freqs
+            self.posting_cache.put(term_position.term_id, arr_postings, term_position.term_file_length)
+
+        postings_buffer = self.open_postings()
+        int_start = term_position.term_file_start_pos
+        arr_skips = np.frombuffer(postings_buffer, dtype=SKIP_DTYPE, count=term_position.skip_count,
+                                  offset=term_position.skip_file_start_pos)
+        return PostingCursor(term_position.term_id, postings_buffer[int_start:int_start+term_position.term_file_length],
+                             term_position.doc_count_with_term, arr_skips, self.skip_block_size, cache_postings)
+
+    def iter_postings_batches(self, int_batch_bytes: int = 8*1024*1024) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Mesmo que Index.iter_postings_batches, mas lendo o arquivo de ocorrências de forma
+        sequencial: blocos consecutivos somando até int_batch_bytes são decodificados de uma só vez.
+        """
+        lst_term_positions = sorted(self.dic_index.values(), key=lambda term_position: term_position.term_file_start_pos)
+        if not lst_term_positions:
+            return
+        postings_buffer = self.open_postings()
+
+        lst_batch = []
+        int_batch_start = int_batch_end = 0
+        for term_position in lst_term_positions + [None]:
+            bol_contiguous = term_position is not None and term_position.term_file_start_pos == int_batch_end
+            if lst_batch and (not bol_contiguous or int_batch_end - int_batch_start >= int_batch_bytes):
+                yield self.decode_postings_batch(lst_batch, postings_buffer[int_batch_start:int_batch_end])
+                lst_batch = []
+            if term_position is None:
+                break
+            if not lst_batch:
+                int_batch_start = term_position.term_file_start_pos
+            lst_batch.append((term_position.term_id, term_position.doc_count_with_term))
+            int_batch_end = term_position.term_file_start_pos + term_position.term_file_length
+
+    @staticmethod
+    def decode_postings_batch(lst_batch: List[Tuple[int, int]], buffer) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        arr_values = vbyte_decode(buffer)
+        arr_gaps = arr_values[0::2].astype(np.int64)
+        arr_doc_counts = np.array([int_doc_count for _, int_doc_count in lst_batch], dtype=np.int64)
+
+        # a soma acumulada dos intervalos é reiniciada no início de cada termo
+        arr_doc_ids = np.cumsum(arr_gaps)
+        arr_term_starts = np.cumsum(arr_doc_counts) - arr_doc_counts
+        arr_doc_ids -= np.repeat(arr_doc_ids[arr_term_starts] - arr_gaps[arr_term_starts], arr_doc_counts)
+        arr_term_ids = np.array([int_term_id for int_term_id, _ in lst_batch], dtype=np.int64)
+        return arr_term_ids, arr_doc_counts, arr_doc_ids, arr_values[1::2].astype(np.int64)
+
+    def get_postings_block(self, term: str) -> bytes:
+        # o bloco já está compactado no arquivo, basta copiá-lo
+        term_position = self.dic_index[term]
+        int_start = term_position.term_file_start_pos
+        return bytes(self.open_postings()[int_start:int_start+term_position.term_file_length])
 
     def document_count_with_term(self, term: str) -> int:
-        return len(self.get_occurrence_list(term))
+        # já registrado no TermFilePosition: não é preciso ler as ocorrências
+        if term not in self.dic_index:
+            return 0
+        return self.dic_index[term].doc_count_with_term
+
+    def __getstate__(self):
+        # o mapeamento em memória não pode ser serializado; é reaberto na primeira leitura
+        dic_state = self.__dict__.copy()
+        dic_state["postings_mmap"] = None
+        dic_state["postings_buffer"] = None
+        dic_state["posting_cache"] = PostingCache(self.posting_cache.int_max_bytes)
+        del dic_state["open_postings_lock"]
+        return dic_state
+
+    def __setstate__(self, dic_state):
+        self.__dict__.update(dic_state)
+        self.open_postings_lock = threading.Lock()
+
+
+class IndexSegment:
+    """
+    Segmento de um SegmentedIndex: um índice com léxico e ocorrências próprios (gravado por
+    Index.write e aberto como FileIndex ou, para os documentos ainda não gravados, um
+    CompactHashIndex em memória) e os doc_ids removidos dele (tombstones) desde então.
+    O array de removidos (arr_deleted, ordenado) é substituído, nunca alterado, para que
+    leituras concorrentes sempre vejam um array consistente. Caso lock seja informado (segmento
+    em memória, que ainda recebe ocorrências), as leituras do índice são feitas com a trava.
+    """
+    def __init__(self, index: Index, str_file_name: str = None, arr_deleted: np.ndarray = None, lock=None):
+        self.index = index
+        self.str_file_name = str_file_name
+        self.arr_deleted = np.empty(0, dtype=np.int64) if arr_deleted is None else np.asarray(arr_deleted, dtype=np.int64)
+        self.lock = lock
+
+    def reading(self):
+        return self.lock if self.lock is not None else nullcontext()
+
+    def freeze(self):
+        """O segmento deixa de receber ocorrências: as leituras seguintes dispensam a trava"""
+        if self.lock is not None:
+            with self.lock:
+                self.lock = None
+
+    @property
+    def doc_count(self) -> int:
+        """Quantidade de documentos gravados no segmento, incluindo os removidos"""
+        with self.reading():
+            return len(self.index.set_documents)
+
+    @property
+    def live_doc_count(self) -> int:
+        return self.doc_count - len(self.arr_deleted)
+
+    @staticmethod
+    def sorted_contains(arr_values: np.ndarray, value: int) -> bool:
+        int_position = int(np.searchsorted(arr_values, value))
+        return int_position < len(arr_values) and int(arr_values[int_position]) == value
+
+    def contains_document(self, doc_id: int) -> bool:
+        """Se o documento está no segmento e não foi removido"""
+        with self.reading():
+            docs = self.index.set_documents
+            bol_contains = IndexSegment.sorted_contains(docs, doc_id) if isinstance(docs, np.ndarray) else doc_id in docs
+        return bol_contains and not IndexSegment.sorted_contains(self.arr_deleted, doc_id)
+
+    def delete_document(self, doc_id: int):
+        arr_deleted = self.arr_deleted
+        self.arr_deleted = np.insert(arr_deleted, np.searchsorted(arr_deleted, doc_id), doc_id)
+
+    def live_documents(self) -> np.ndarray:
+        """doc_ids (ordenados) dos documentos não removidos"""
+        with self.reading():
+            docs = self.index.set_documents
+            arr_docs = np.asarray(docs, dtype=np.int64) if isinstance(docs, np.ndarray) else np.array(sorted(docs), dtype=np.int64)
+        arr_deleted = self.arr_deleted
+        return arr_docs[np.isin(arr_docs, arr_deleted, invert=True)] if len(arr_deleted) else arr_docs
+
+    def get_occurrence_arrays(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        with self.reading():
+            if term not in self.index.dic_index:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+            arr_doc_ids, arr_term_freqs = self.index.get_occurrence_arrays(term)
+        arr_deleted = self.arr_deleted
+        if len(arr_deleted):
+            arr_live = np.isin(arr_doc_ids, arr_deleted, invert=True)
+            arr_doc_ids, arr_term_freqs = arr_doc_ids[arr_live], arr_term_freqs[arr_live]
+        return arr_doc_ids, arr_term_freqs
+
+    def document_count_with_term(self, term: str) -> int:
+        # sem remoções, a quantidade registrada no léxico do segmento é exata
+        if not len(self.arr_deleted):
+            with self.reading():
+                return self.index.document_count_with_term(term)
+        return len(self.get_occurrence_arrays(term)[0])
+
+
+class SegmentUnion(Index):
+    """
+    União (somente leitura) de segmentos (IndexSegment): cada consulta é distribuída entre os
+    segmentos e as ocorrências não removidas de cada um são concatenadas e ordenadas pelo doc_id.
+    dic_index (termo -> term_id) define os term_ids, os mesmos em todos os segmentos.
+    Gravada por Index.write, gera um único índice com as ocorrências de todos os segmentos.
+    """
+    def __init__(self, lst_segments: List[IndexSegment], dic_term_ids: dict):
+        self.lst_segments = list(lst_segments)
+        self.dic_index = dic_term_ids
+
+    def current_segments(self) -> Tuple[IndexSegment, ...]:
+        # cada leitura percorre uma cópia da lista: um conjunto consistente de segmentos
+        return tuple(self.lst_segments)
+
+    @property
+    def document_count(self) -> int:
+        return sum(segment.live_doc_count for segment in self.current_segments())
+
+    @property
+    def set_documents(self) -> np.ndarray:
+        # um documento está em no máximo um segmento sem ter sido removido
+        lst_docs = [segment.live_documents() for segment in self.current_segments()]
+        return np.sort(np.concatenate(lst_docs)) if lst_docs else np.empty(0, dtype=np.int64)
+
+    def get_term_id(self, term: str):
+        return self.dic_index[term]
+
+    def get_occurrence_arrays(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        lst_arrays = [arrays for arrays in (segment.get_occurrence_arrays(term) for segment in self.current_segments()) if len(arrays[0])]
+        if not lst_arrays:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        if len(lst_arrays) == 1:
+            return lst_arrays[0]
+        arr_doc_ids = np.concatenate([arr_doc_ids for arr_doc_ids, _ in lst_arrays])
+        arr_term_freqs = np.concatenate([arr_term_freqs for _, arr_term_freqs in lst_arrays])
+        arr_order = np.argsort(arr_doc_ids, kind="stable")
+        return arr_doc_ids[arr_order], arr_term_freqs[arr_order]
+
+    def get_occurrence_list(self, term: str) -> List:
+        if term not in self.dic_index:
+            return []
+        return OccurrenceList(self.dic_index[term], *self.get_occurrence_arrays(term))
+
+    def document_count_with_term(self, term: str) -> int:
+        if term not in self.dic_index:
+            return 0
+        return sum(segment.document_count_with_term(term) for segment in self.current_segments())
+
+    def warm_posting_cache(self, int_top_n: int):
+        for segment in self.current_segments():
+            if isinstance(segment.index, FileIndex):
+                segment.index.warm_posting_cache(int_top_n)
+
+
+class SegmentedIndex(SegmentUnion):
+    """
+    Índice incremental, gravado no diretório str_dir, formado por segmentos imutáveis
+    (IndexSegment, cada um no formato de Index.write, com léxico e ocorrências próprios) e
+    por um segmento em memória que recebe os novos documentos. Os documentos indexados podem
+    ser consultados imediatamente; ao atingir flush_doc_count documentos (ou ao chamar flush),
+    o segmento em memória é gravado como um novo segmento, sem reconstruir os demais.
+
+    Reindexar um doc_id já existente o substitui: a versão anterior é removida. A remoção
+    (delete_document) apenas marca o doc_id no segmento (tombstone); as ocorrências são
+    descartadas quando o segmento é intercalado. As ocorrências de um documento devem ser
+    indexadas em sequência (como faz o HTMLIndexer).
+
+    Intercalação em camadas (tiered): a camada de um segmento é a ordem de grandeza, na base
+    merge_factor, da sua quantidade de documentos em relação a flush_doc_count. Quando uma
+    camada acumula merge_factor segmentos, eles são intercalados em um único segmento da
+    camada seguinte; segmentos com mais de MAX_DELETED_RATIO de documentos removidos são
+    regravados sozinhos. As intercalações são feitas em uma thread, sem bloquear as consultas,
+    que continuam nos segmentos antigos até a troca.
+
+    As consultas leem snapshot, a tupla imutável (segmentos, segmento em memória), substituída
+    por uma única atribuição a cada alteração da lista de segmentos: cada leitura vê um conjunto
+    consistente de segmentos. Ao ser gravado, o segmento em memória é congelado e passa à lista
+    de segmentos (ainda sem arquivo); a gravação é feita fora de write_lock e, ao final, o
+    segmento congelado é trocado pelo segmento gravado.
+
+    Arquivos em str_dir: os segmentos (seg_<n>.idx), terms.txt (um termo por linha, na ordem
+    dos term_ids, compartilhados por todos os segmentos) e segments.json (segmentos atuais e
+    os seus doc_ids removidos). Os valores pré-computados (IndexPreComputedVals) são mantidos
+    com add_document, remove_document e update_norms, e generation permite saber quando o
+    índice foi alterado.
+    """
+    FLUSH_DOC_COUNT = 1000
+    MERGE_FACTOR = 10
+    MAX_DELETED_RATIO = 0.5
+    # memória do cache de ocorrências (PostingCache) de cada segmento gravado
+    SEGMENT_CACHE_BYTES = 8*1024*1024
+    MANIFEST_VERSION = 1
+
+    def __init__(self, str_dir: str, flush_doc_count: int = FLUSH_DOC_COUNT, merge_factor: int = MERGE_FACTOR,
+                 background_merge: bool = True, segment_cache_bytes: int = SEGMENT_CACHE_BYTES):
+        self.str_dir = str_dir
+        self.flush_doc_count = max(1, flush_doc_count)
+        self.merge_factor = max(2, merge_factor)
+        self.background_merge = background_merge
+        self.segment_cache_bytes = segment_cache_bytes
+        # serializa as alterações (as leituras do segmento em memória usam a trava do próprio segmento)
+        self.write_lock = threading.RLock()
+        self.generation = 0
+        self.lst_terms = []
+        self.int_saved_terms = 0
+        self.int_segment_counter = 0
+        self.set_merging = set()
+        self.merge_thread = None
+        self.merge_error = None
+        self.last_doc_id = None
+        os.makedirs(str_dir, exist_ok=True)
+        self.dic_index = {}
+        self.snapshot = ((), self.new_memory_segment())
+        self.load_manifest()
+
+    @property
+    def lst_segments(self) -> Tuple[IndexSegment, ...]:
+        return self.snapshot[0]
+
+    @property
+    def memory_segment(self) -> IndexSegment:
+        return self.snapshot[1]
+
+    def current_segments(self) -> Tuple[IndexSegment, ...]:
+        # uma única leitura de snapshot: os segmentos e o segmento em memória da mesma versão
+        tpl_segments, memory_segment = self.snapshot
+        return tpl_segments + (memory_segment,)
+
+    def new_memory_segment(self) -> IndexSegment:
+        return IndexSegment(CompactHashIndex(), lock=threading.Lock())
+
+    def file_path(self, str_file_name: str) -> str:
+        return path.join(self.str_dir, str_file_name)
+
+    def open_segment(self, str_file_name: str, arr_deleted: np.ndarray = None) -> IndexSegment:
+        return IndexSegment(FileIndex.open_index_file(self.file_path(str_file_name), self.segment_cache_bytes),
+                            str_file_name, arr_deleted)
+
+    def load_manifest(self):
+        if not path.exists(self.file_path("segments.json")):
+            return
+        with open(self.file_path("segments.json"), encoding="utf-8") as manifest_file:
+            dic_manifest = json.load(manifest_file)
+        if dic_manifest["version"] != SegmentedIndex.MANIFEST_VERSION:
+            raise ValueError(f"Versão do índice segmentado não suportada: {dic_manifest['version']}")
+        with open(self.file_path("terms.txt"), encoding="utf-8") as terms_file:
+            self.lst_terms = terms_file.read().split("\n")[:dic_manifest["term_count"]]
+        self.dic_index = {str_term:int_term_id for int_term_id, str_term in enumerate(self.lst_terms)}
+        self.int_saved_terms = len(self.lst_terms)
+        self.int_segment_counter = dic_manifest["segment_counter"]
+        self.snapshot = (tuple(self.open_segment(dic_segment["file"], np.array(dic_segment["deleted"], dtype=np.int64))
+                               for dic_segment in dic_manifest["segments"]), self.memory_segment)
+
+    def save_manifest(self):
+        """Grava os termos novos e, de forma atômica, a lista de segmentos e os seus doc_ids removidos"""
+        if self.int_saved_terms < len(self.lst_terms):
+            with open(self.file_path("terms.txt"), "a", encoding="utf-8") as terms_file:
+                terms_file.write("".join(f"{str_term}\n" for str_term in self.lst_terms[self.int_saved_terms:]))
+            self.int_saved_terms = len(self.lst_terms)
+        dic_manifest = {"version":SegmentedIndex.MANIFEST_VERSION, "term_count":self.int_saved_terms,
+                        "segment_counter":self.int_segment_counter,
+                        "segments":[{"file":segment.str_file_name, "deleted":segment.arr_deleted.tolist()}
+                                    for segment in self.lst_segments if segment.str_file_name is not None]}
+        str_tmp_file = self.file_path("segments.json.tmp")
+        with open(str_tmp_file, "w", encoding="utf-8") as manifest_file:
+            json.dump(dic_manifest, manifest_file)
+        os.replace(str_tmp_file, self.file_path("segments.json"))
+
+    def next_segment_file_name(self) -> str:
+        str_file_name = f"seg_{self.int_segment_counter:06d}.idx"
+        self.int_segment_counter += 1
+        return str_file_name
+
+    def write_segment(self, lst_segments: List[IndexSegment]) -> str:
+        """Grava as ocorrências não removidas dos segmentos em um novo arquivo de segmento"""
+        with self.write_lock:
+            str_file_name = self.next_segment_file_name()
+        dic_term_ids = {}
+        for segment in lst_segments:
+            with segment.reading():
+                for str_term in segment.index.dic_index:
+                    dic_term_ids[str_term] = self.dic_index[str_term]
+        SegmentUnion(lst_segments, dic_term_ids).write(self.file_path(str_file_name))
+        return str_file_name
+
+    def index(self, term: str, doc_id: int, term_freq: int):
+        frozen_segment = None
+        with self.write_lock:
+            if doc_id != self.last_doc_id:
+                # novo documento: congela o segmento em memória, se cheio ou se tiver a versão anterior do
+                # documento (para que ela também seja removida por um tombstone), e remove a versão anterior
+                set_memory_docs = self.memory_segment.index.set_documents
+                if len(set_memory_docs) >= self.flush_doc_count or doc_id in set_memory_docs:
+                    frozen_segment = self.freeze_memory_segment()
+                self.delete_sealed_document(doc_id)
+            self.last_doc_id = doc_id
+            if term not in self.dic_index:
+                self.dic_index[term] = len(self.lst_terms)
+                self.lst_terms.append(term)
+            memory_segment = self.memory_segment
+            with memory_segment.lock:
+                memory_segment.index.index(term, doc_id, term_freq)
+            self.generation += 1
+        self.write_frozen_segment(frozen_segment)
+
+    def delete_sealed_document(self, doc_id: int) -> bool:
+        bol_deleted = False
+        for segment in self.lst_segments:
+            if segment.contains_document(doc_id):
+                segment.delete_document(doc_id)
+                bol_deleted = True
+        return bol_deleted
+
+    def delete_document(self, doc_id: int) -> bool:
+        """Remove o documento (tombstone). Retorna se ele existia no índice."""
+        frozen_segment = None
+        with self.write_lock:
+            # o segmento em memória é congelado antes, para que a remoção também seja um tombstone
+            if doc_id in self.memory_segment.index.set_documents:
+                frozen_segment = self.freeze_memory_segment()
+            bol_deleted = self.delete_sealed_document(doc_id)
+            if bol_deleted:
+                self.last_doc_id = None
+                self.generation += 1
+                self.save_manifest()
+        self.write_frozen_segment(frozen_segment)
+        return bol_deleted
+
+    def freeze_memory_segment(self) -> IndexSegment:
+        """
+        Com write_lock: congela o segmento em memória, que passa à lista de segmentos até ser gravado
+        (write_frozen_segment), e cria um novo segmento em memória. Retorna o segmento congelado, ou
+        None caso o segmento em memória esteja vazio.
+        """
+        tpl_segments, memory_segment = self.snapshot
+        if len(memory_segment.index.set_documents) == 0:
+            return None
+        memory_segment.freeze()
+        self.snapshot = (tpl_segments + (memory_segment,), self.new_memory_segment())
+        self.last_doc_id = None
+        return memory_segment
+
+    def write_frozen_segment(self, frozen_segment: IndexSegment):
+        """Grava (fora de write_lock) o segmento congelado e o troca pelo segmento gravado"""
+        if frozen_segment is None:
+            return
+        with self.write_lock:
+            arr_deleted_before = frozen_segment.arr_deleted
+        str_file_name = self.write_segment([IndexSegment(frozen_segment.index, None, arr_deleted_before)])
+        self.replace_segments([frozen_segment], [arr_deleted_before], str_file_name)
+        self.start_merges()
+
+    def flush(self):
+        """Grava o segmento em memória como um novo segmento e inicia as intercalações necessárias"""
+        with self.write_lock:
+            frozen_segment = self.freeze_memory_segment()
+        self.write_frozen_segment(frozen_segment)
+
+    def finish_indexing(self):
+        self.flush()
+
+    def segment_tier(self, segment: IndexSegment) -> int:
+        int_tier = 0
+        int_limit = self.flush_doc_count*self.merge_factor
+        while segment.live_doc_count >= int_limit:
+            int_tier += 1
+            int_limit *= self.merge_factor
+        return int_tier
+
+    def find_merge(self) -> List[IndexSegment]:
+        """Segmentos a serem intercalados pela política em camadas, ou None"""
+        # segmentos congelados (ainda sem arquivo) só são intercalados depois de gravados
+        lst_candidates = [segment for segment in self.lst_segments
+                          if segment.str_file_name is not None and segment not in self.set_merging]
+        dic_tiers = {}
+        for segment in lst_candidates:
+            dic_tiers.setdefault(self.segment_tier(segment), []).append(segment)
+        for int_tier in sorted(dic_tiers):
+            if len(dic_tiers[int_tier]) >= self.merge_factor:
+                return sorted(dic_tiers[int_tier], key=lambda segment: segment.live_doc_count)[:self.merge_factor]
+        for segment in lst_candidates:
+            if len(segment.arr_deleted) > SegmentedIndex.MAX_DELETED_RATIO*segment.doc_count:
+                return [segment]
+        return None
+
+    def start_merges(self):
+        if not self.background_merge:
+            self.run_merges()
+            return
+        with self.write_lock:
+            if self.merge_thread is None:
+                self.merge_thread = threading.Thread(target=self.run_merges, daemon=True)
+                self.merge_thread.start()
+
+    def run_merges(self):
+        try:
+            while True:
+                with self.write_lock:
+                    lst_merge = self.find_merge()
+                    if lst_merge is None:
+                        self.merge_thread = None
+                        return
+                    self.set_merging.update(lst_merge)
+                    # remoções feitas durante a intercalação ainda precisam ser aplicadas ao novo segmento
+                    lst_deleted_before = [segment.arr_deleted for segment in lst_merge]
+                try:
+                    self.merge_segments(lst_merge, lst_deleted_before)
+                finally:
+                    with self.write_lock:
+                        self.set_merging.difference_update(lst_merge)
+        except Exception as error:
+            with self.write_lock:
+                self.merge_error = error
+                self.merge_thread = None
+
+    def merge_segments(self, lst_merge: List[IndexSegment], lst_deleted_before: List[np.ndarray]):
+        lst_snapshot = [IndexSegment(segment.index, segment.str_file_name, arr_deleted)
+                        for segment, arr_deleted in zip(lst_merge, lst_deleted_before)]
+        str_file_name = self.write_segment(lst_snapshot)
+        self.replace_segments(lst_merge, lst_deleted_before, str_file_name)
+        # leituras em andamento mantêm os segmentos antigos mapeados em memória
+        for segment in lst_merge:
+            os.remove(self.file_path(segment.str_file_name))
+
+    def replace_segments(self, lst_old: List[IndexSegment], lst_deleted_before: List[np.ndarray], str_file_name: str):
+        """
+        Troca os segmentos lst_old pelo segmento gravado em str_file_name, com as remoções feitas
+        nos segmentos antigos desde a gravação (lst_deleted_before: os removidos ao gravar)
+        """
+        with self.write_lock:
+            lst_deleted_after = [np.setdiff1d(segment.arr_deleted, arr_deleted)
+                                 for segment, arr_deleted in zip(lst_old, lst_deleted_before)]
+            new_segment = self.open_segment(str_file_name, np.unique(np.concatenate(lst_deleted_after)))
+            tpl_segments, memory_segment = self.snapshot
+            int_position = tpl_segments.index(lst_old[0])
+            lst_segments = [segment for segment in tpl_segments if segment not in lst_old]
+            lst_segments.insert(min(int_position, len(lst_segments)), new_segment)
+            self.snapshot = (tuple(lst_segments), memory_segment)
+            self.save_manifest()
+
+    def wait_merges(self):
+        """Aguarda o fim das intercalações em andamento; repassa o erro de uma intercalação que falhou"""
+        merge_thread = self.merge_thread
+        if merge_thread is not None:
+            merge_thread.join()
+        if self.merge_error is not None:
+            error, self.merge_error = self.merge_error, None
+            raise error
+
+    def close(self):
+        self.flush()
+        self.wait_merges()
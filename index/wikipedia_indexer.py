@@ -10,6 +10,9 @@ if __name__ == "__main__":
 
     obj_index = FileIndex()
     html_indexer = HTMLIndexer(obj_index)
-    html_indexer.index_text_dir("index/ri-tp-wiki-data-master")
+    # doc_ids internos densos, atribuídos na ordem dos títulos dos artigos
+    lst_doc_ids = [doc_id for doc_id, _ in HTMLIndexer.list_doc_files("index/ri-tp-wiki-data-master")]
+    doc_id_map = DocIdMap.create(lst_doc_ids, DocIdMap.read_titles("titlePerDoc.dat"))
+    html_indexer.index_text_dir("index/ri-tp-wiki-data-master", num_workers=os.cpu_count(), doc_id_map=doc_id_map)
     html_indexer.index.write('wiki.idx')
     
\ No newline at end of file
@@ -1,15 +1,88 @@
 from typing import List, Set,Mapping
-from nltk.tokenize import word_tokenize
+from collections import OrderedDict, namedtuple
 from util.time import CheckTime
-from query.ranking_models import RankingModel,VectorRankingModel, IndexPreComputedVals
-from index.structure import Index, TermOccurrence
-from index.indexer import Cleaner
+import time
+from query.ranking_models import RankingModel,VectorRankingModel,MaxScoreVectorRankingModel,BM25RankingModel,MaxScoreBM25RankingModel, IndexPreComputedVals, ExternalDocumentWeights
+from index.structure import Index, TermOccurrence, PostingCursor
+from index.indexer import Cleaner, HTMLIndexer
+
+QueryCacheInfo = namedtuple("QueryCacheInfo", ["hits", "misses", "evictions", "expirations", "maxsize", "currsize", "curr_docs"])
+
+class QueryResultCache:
+	"""
+		Cache LRU das respostas de consultas. A memória é limitada pela quantidade de respostas (maxsize)
+		e pela quantidade total de documentos guardados nelas (max_docs); ao ultrapassar qualquer um dos
+		limites, as respostas usadas há mais tempo são descartadas. Caso ttl (em segundos) seja informado,
+		respostas mais antigas que ttl são descartadas ao serem consultadas.
+	"""
+	def __init__(self, maxsize:int = 1024, max_docs:int = 1000000, ttl:float = None):
+		self.maxsize = maxsize
+		self.max_docs = max_docs
+		self.ttl = ttl
+		#chave -> (momento da inclusão, quantidade de documentos, resposta)
+		self.dic_entries = OrderedDict()
+		self.int_docs = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.expirations = 0
+
+	def get(self, key):
+		"""Retorna a resposta guardada para a chave ou None"""
+		entry = self.dic_entries.get(key)
+		if entry is not None and self.ttl is not None and time.monotonic() - entry[0] > self.ttl:
+			self.remove(key)
+			self.expirations += 1
+			entry = None
+		if entry is None:
+			self.misses += 1
+			return None
+		self.dic_entries.move_to_end(key)
+		self.hits += 1
+		return entry[2]
+
+	def put(self, key, int_docs:int, response):
+		if self.maxsize <= 0 or int_docs > self.max_docs:
+			return
+		if key in self.dic_entries:
+			self.remove(key)
+		self.dic_entries[key] = (time.monotonic(), int_docs, response)
+		self.int_docs += int_docs
+		while len(self.dic_entries) > self.maxsize or self.int_docs > self.max_docs:
+			self.remove(next(iter(self.dic_entries)))
+			self.evictions += 1
+
+	def remove(self, key):
+		_, int_docs, _ = self.dic_entries.pop(key)
+		self.int_docs -= int_docs
+
+	def clear(self):
+		self.dic_entries.clear()
+		self.int_docs = 0
+
+	def cache_info(self) -> QueryCacheInfo:
+		return QueryCacheInfo(self.hits, self.misses, self.evictions, self.expirations,
+								self.maxsize, len(self.dic_entries), self.int_docs)
+
+	def hit_ratio(self) -> float:
+		int_requests = self.hits + self.misses
+		return self.hits/int_requests if int_requests > 0 else 0.0
+
 
 class QueryRunner:
-	def __init__(self,ranking_model:RankingModel,index:Index, cleaner:Cleaner):
+	# quantidade máxima de respostas guardadas por padrão no cache de consultas
+	QUERY_CACHE_SIZE = 1024
+
+	def __init__(self,ranking_model:RankingModel,index:Index, cleaner:Cleaner,
+					cache_size:int = QUERY_CACHE_SIZE, cache_ttl:float = None):
 		self.ranking_model = ranking_model
 		self.index = index
 		self.cleaner = cleaner
+		self.query_cache = QueryResultCache(cache_size, ttl=cache_ttl)
+		#vazão (consultas por segundo) do último get_docs_term_batch
+		self.batch_qps = None
+		#índice e valores pré-computados das respostas guardadas no cache
+		self.cache_source = None
 
 
 	def get_relevance_per_query(self) -> Mapping[str,Set[int]]:
@@ -21,7 +94,7 @@ class QueryRunner:
 		dic_relevance_docs = {}
 		for arquiv in ["belo_horizonte","irlanda","sao_paulo"]:
 			with open(f"relevant_docs/{arquiv}.dat") as arq:
-				dic_relevance_docs[arquiv] = set(arq.readline().split(","))
+				dic_relevance_docs[arquiv] = set(int(doc_id) for doc_id in arq.readline().strip().split(",") if doc_id)
 		return dic_relevance_docs
 
 	def count_topn_relevant(self,n:int,respostas:List[int],doc_relevantes:Set[int]) -> int:
@@ -32,17 +105,20 @@ class QueryRunner:
 		"""
 		#print(f"Respostas: {respostas} doc_relevantes: {doc_relevantes}")
 		relevance_count = 0
-        
+		for doc_id in respostas[:n]:
+			if doc_id in doc_relevantes:
+				relevance_count += 1
 
 		return relevance_count
 
 	def compute_precision_recall(self, n:int, lst_docs:List[int],relevant_docs:Set[int]) -> (float,float):
 		
-		precision = None
-		recall = None
+		relevance_count = self.count_topn_relevant(n, lst_docs, relevant_docs)
+		precision = relevance_count/n
+		recall = relevance_count/len(relevant_docs) if relevant_docs else 0
 		return precision, recall
-    
-    def get_query_term_occurence(self, query:str) -> Mapping[str,TermOccurrence]:
+
+	def get_query_term_occurence(self, query:str) -> Mapping[str,TermOccurrence]:
 		"""
 			Preprocesse a consulta da mesma forma que foi preprocessado o texto do documento (use a classe Cleaner para isso).
 			E transforme a consulta em um dicionario em que a chave é o termo que ocorreu
@@ -52,8 +128,15 @@ class QueryRunner:
 		"""
 		#print(self.index)
 		map_term_occur = {}
-
-
+		for word in self.cleaner.tokenize(self.cleaner.preprocess_text(query)):
+			#usa a mesma memorização de preprocess_word da indexação
+			term = self.cleaner.preprocess_word_cached(word)
+			if term is None or term not in self.index.dic_index:
+				continue
+			if term in map_term_occur:
+				map_term_occur[term].term_freq += 1
+			else:
+				map_term_occur[term] = TermOccurrence(None, self.index.get_term_id(term), 1)
 
 		return map_term_occur
 
@@ -61,84 +144,184 @@ class QueryRunner:
 		"""
 			Retorna dicionario a lista de ocorrencia no indice de cada termo passado como parametro.
 			Caso o termo nao exista, este termo possuirá uma lista vazia
+			As listas são as do índice (Index.get_occurrence_list; no FileIndex, uma OccurrenceList sobre
+			os arrays decodificados), sem criar um TermOccurrence por ocorrência.
 		"""
+		dic_terms = {}
+		for term in terms:
+			dic_terms[term] = self.index.get_occurrence_list(term)
 
+		return dic_terms
 
+	def get_posting_cursor_per_term(self, terms:List) -> Mapping[str, PostingCursor]:
+		"""
+			Retorna, para cada termo, um cursor (PostingCursor) sobre as suas ocorrências no indice,
+			sem materializá-las. Caso o termo nao exista, o cursor não possui ocorrências.
+		"""
+		return {term:self.index.get_posting_cursor(term) for term in terms}
 
-		return dic_terms
-	def get_docs_term(self, query:str) -> List[int]:
+	def get_docs_term(self, query:str, k:int = None) -> (List[int], Mapping[int,float]):
 		"""
 			A partir do indice, retorna a lista de ids de documentos desta consulta
-			usando o modelo especificado pelo atributo ranking_model
+			usando o modelo especificado pelo atributo ranking_model.
+			Caso k seja informado, apenas os k documentos mais bem ranqueados são retornados.
 		"""
 		#Obtenha, para cada termo da consulta, sua ocorrencia por meio do método get_query_term_occurence
-		dic_query_occur = None
+		dic_query_occur = self.get_query_term_occurence(query)
 
-		#obtenha a lista de ocorrencia dos termos da consulta
-		dic_occur_per_term_query = None
+		#consultas repetidas (mesmos termos após o preprocessamento, modelo e k) são respondidas pelo cache
+		self.check_cache_source()
+		cache_key = self.get_cache_key(dic_query_occur, k)
+		response = self.query_cache.get(cache_key)
+		if response is not None:
+			return self.to_external_doc_ids(list(response[0]), response[1])
 
+		#obtenha a lista de ocorrencia dos termos da consulta
+		#(como cursores, sem materializar as ocorrências: o modelo de ranking as percorre diretamente)
+		dic_occur_per_term_query = self.get_posting_cursor_per_term(dic_query_occur)
 
 		#utilize o ranking_model para retornar o documentos ordenados considrando dic_query_occur e dic_occur_per_term_query
-		return None
+		return self.to_external_doc_ids(*self.rank_and_cache(cache_key, dic_query_occur, dic_occur_per_term_query, k))
+
+	def get_docs_term_batch(self, queries:List[str], k:int = None) -> List[tuple]:
+		"""
+			Responde um lote de consultas, retornando, na mesma ordem, o resultado de get_docs_term de cada uma.
+			As ocorrências de cada termo presente no lote são lidas uma única vez (Index.get_occurrence_lists,
+			na ordem em que estão no arquivo) e compartilhadas entre as consultas.
+			A vazão obtida (consultas por segundo) fica em batch_qps.
+		"""
+		float_start = time.perf_counter()
+		self.check_cache_source()
+		lst_responses = [None]*len(queries)
+		lst_pending = []
+		for i, query in enumerate(queries):
+			dic_query_occur = self.get_query_term_occurence(query)
+			cache_key = self.get_cache_key(dic_query_occur, k)
+			response = self.query_cache.get(cache_key)
+			if response is not None:
+				lst_responses[i] = (list(response[0]), response[1])
+			else:
+				lst_pending.append((i, cache_key, dic_query_occur))
+
+		#união dos termos das consultas que não estavam no cache
+		dic_terms = {}
+		for _, _, dic_query_occur in lst_pending:
+			dic_terms.update(dict.fromkeys(dic_query_occur))
+		dic_occur_per_term = self.index.get_occurrence_lists(dic_terms)
+
+		for i, cache_key, dic_query_occur in lst_pending:
+			#a mesma consulta pode aparecer mais de uma vez no lote
+			response = self.query_cache.get(cache_key)
+			if response is not None:
+				lst_responses[i] = (list(response[0]), response[1])
+				continue
+			dic_occur_per_term_query = {term:dic_occur_per_term[term] for term in dic_query_occur}
+			lst_responses[i] = self.rank_and_cache(cache_key, dic_query_occur, dic_occur_per_term_query, k)
+
+		lst_responses = [self.to_external_doc_ids(*response) for response in lst_responses]
+		float_elapsed = time.perf_counter() - float_start
+		self.batch_qps = len(queries)/float_elapsed if float_elapsed > 0 else float("inf")
+		return lst_responses
+
+	def to_external_doc_ids(self, lst_docs:List[int], dic_weights:Mapping[int,float]) -> (List[int], Mapping[int,float]):
+		"""
+			Caso o índice possua doc_ids internos (Index.doc_id_map), traduz a resposta para os doc_ids
+			externos: apenas os documentos retornados são traduzidos, e os pesos são acessados por uma
+			visão (ExternalDocumentWeights) que traduz cada doc_id consultado.
+			As respostas guardadas no cache e os modelos de ranking usam sempre os doc_ids internos.
+		"""
+		doc_id_map = getattr(self.index, "doc_id_map", None)
+		if doc_id_map is None:
+			return lst_docs, dic_weights
+		return doc_id_map.to_external(lst_docs), ExternalDocumentWeights(dic_weights, doc_id_map) if dic_weights is not None else None
+
+	def get_cache_key(self, dic_query_occur:Mapping[str,TermOccurrence], k:int) -> tuple:
+		return (tuple((term, occur.term_freq) for term, occur in dic_query_occur.items()), self.ranking_model, k)
+
+	def rank_and_cache(self, cache_key:tuple, dic_query_occur:Mapping[str,TermOccurrence],
+						dic_occur_per_term_query:Mapping[str,List[TermOccurrence]], k:int) -> (List[int], Mapping[int,float]):
+		lst_docs, dic_weights = self.ranking_model.get_ordered_docs(dic_query_occur, dic_occur_per_term_query, k=k)
+		self.query_cache.put(cache_key, len(lst_docs) + (len(dic_weights) if dic_weights is not None else 0), (list(lst_docs), dic_weights))
+		return lst_docs, dic_weights
+
+	def check_cache_source(self):
+		"""
+			Descarta as respostas do cache caso o índice ou os valores pré-computados usados pelo
+			modelo tenham sido trocados, alterados (ex.: documentos incluídos em um SegmentedIndex)
+			ou recarregados desde que elas foram calculadas.
+		"""
+		idx_pre_comp_vals = getattr(self.ranking_model, "idx_pre_comp_vals", None)
+		cache_source = (self.index, idx_pre_comp_vals, getattr(idx_pre_comp_vals, "generation", None),
+						getattr(self.index, "generation", None))
+		if self.cache_source is None or self.cache_source[0] is not cache_source[0] \
+				or self.cache_source[1] is not cache_source[1] or self.cache_source[2:] != cache_source[2:]:
+			self.invalidate_cache()
+			self.cache_source = cache_source
+
+	def invalidate_cache(self):
+		self.query_cache.clear()
 
 	@staticmethod
-	def runQuery(query:str, indice:Index, indice_pre_computado:IndexPreComputedVals , map_relevantes:Mapping[str,Set[int]]):
+	def runQuery(query:str, indice:Index, indice_pre_computado:IndexPreComputedVals , map_relevantes:Mapping[str,Set[int]], ranking_model:RankingModel = None):
 		"""
 			Para um daterminada consulta `query` é extraído do indice `index` os documentos mais relevantes, considerando 
 			um modelo informado pelo usuário. O `indice_pre_computado` possui valores précalculados que auxiliarão na tarefa. 
 			Além disso, para algumas consultas, é impresso a precisão e revocação nos top 5, 10, 20 e 50. Essas consultas estão
 			Especificadas em `map_relevantes` em que a chave é a consulta e o valor é o conjunto de ids de documentos relevantes
-			para esta consulta.
+			para esta consulta. Caso `ranking_model` não seja informado, é usado o modelo vetorial (com a poda
+			MaxScore, já que apenas os top 50 são usados).
 		"""
 		time_checker = CheckTime()
 
 		#PEça para usuario selecionar entre Booleano ou modelo vetorial para intanciar o QueryRunner
 		#apropriadamente. NO caso do booleano, vc deve pedir ao usuario se será um "and" ou "or" entre os termos.
 		#abaixo, existem exemplos fixos.
-		qr = QueryRunner(indice, VectorRankingModel(indice_pre_computado))
+		if ranking_model is None:
+			ranking_model = MaxScoreVectorRankingModel(indice_pre_computado)
+		qr = QueryRunner(ranking_model, indice, HTMLIndexer.cleaner)
 		time_checker.print_delta("Query Creation")
 
+		arr_top = [5,10,20,50]
 
 		#Utilize o método get_docs_term para obter a lista de documentos que responde esta consulta
-		resposta = None
-		time_checker.print_delta("anwered with {len(respostas)} docs")
+		#(apenas os top 50 são usados)
+		respostas,_ = qr.get_docs_term(query, k=max(arr_top))
+		time_checker.print_delta(f"anwered with {len(respostas)} docs")
 
 		#nesse if, vc irá verificar se o termo possui documentos relevantes associados a ele
 		#se possuir, vc deverá calcular a Precisao e revocação nos top 5, 10, 20, 50.
-		#O for que fiz abaixo é só uma sugestao e o metododo countTopNRelevants podera auxiliar no calculo da revocacao e precisao
-		if(True):
-			arr_top = [5,10,20,50]
-			revocacao = 0
-			precisao = 0
+		str_query_key = qr.cleaner.remove_accents(query.lower()).replace(" ","_")
+		if str_query_key in map_relevantes:
 			for n in arr_top:
-				revocacao = 0#substitua aqui pelo calculo da revocacao topN
-				precisao = 0#substitua aqui pelo calculo da revocacao topN
-				print("Precisao @{n}: {precisao}")
-				print("Recall @{n}: {revocacao}")
+				precisao, revocacao = qr.compute_precision_recall(n, respostas, map_relevantes[str_query_key])
+				print(f"Precisao @{n}: {precisao}")
+				print(f"Recall @{n}: {revocacao}")
 
 		#imprima aas top 10 respostas
+		print(f"Top 10: {respostas[:10]}")
 
 	@staticmethod
 	def main():
 		#leia o indice (base da dados fornecida)
-		index = None
+		index = Index.read("wiki.idx")
+		#pré-carrega as ocorrências dos termos mais frequentes, que aparecem em muitas consultas
+		index.warm_posting_cache(1000)
 
 		#Checagem se existe um documento (apenas para teste, deveria existir)
-		print(f"Existe o doc? index.hasDocId(105047)")
+		#com doc_ids internos (Index.doc_id_map), o doc_id externo é procurado no mapeamento
+		doc_id_map = getattr(index, "doc_id_map", None)
+		print(f"Existe o doc? {105047 in (doc_id_map if doc_id_map is not None else index.set_documents)}")
 
 		#Instancie o IndicePreCompModelo para pr ecomputar os valores necessarios para a query
 		print("Precomputando valores atraves do indice...");
 		check_time = CheckTime()
-        
-
-
-
+		idx_pre_com = IndexPreComputedVals(index, "wiki.idx")
 		check_time.print_delta("Precomputou valores")
 
 		#encontra os docs relevantes
-		map_relevance = None
+		map_relevance = QueryRunner(None, index, HTMLIndexer.cleaner).get_relevance_per_query()
 		
 		print("Fazendo query...")
 		#aquui, peça para o usuário uma query (voce pode deixar isso num while ou fazer um interface grafica se estiver bastante animado ;)
 		query = "São Paulo";
-		runQuery(query,idx, idxPreCom,mapRelevances);
+		QueryRunner.runQuery(query, index, idx_pre_com, map_relevance, MaxScoreBM25RankingModel(idx_pre_com))
@@ -1,50 +1,571 @@
-from asyncio.windows_events import NULL
 from typing import List
 from abc import abstractmethod
 from typing import List, Set,Mapping
-from index.structure import TermOccurrence
+from collections.abc import Mapping as MappingABC
+from index.structure import TermOccurrence, PostingCursor, ArrayPostingCursor
+import numpy as np
+import bisect
+import heapq
 import math
+import os
+import threading
 from enum import Enum
 
 class IndexPreComputedVals():
-    def __init__(self,index):
+    # variação máxima do idf de um termo (em relação ao usado nas normas) tolerada por update_norms
+    IDF_TOLERANCE = 0.01
+
+    def __init__(self,index, arq_vals:str = None, idf_tolerance:float = IDF_TOLERANCE, persist:bool = True):
+        """
+        Caso arq_vals seja informado, os valores são lidos (mapeados em memória) dos arquivos
+        "{arq_vals}.<nome>.npy" gravados anteriormente ou, se não existirem (ou não
+        corresponderem ao índice, ver index_fingerprint), são calculados e gravados nesses arquivos. Com persist=False,
+        os arquivos são apenas lidos: valores calculados não são gravados (ex.: processos que
+        compartilham os arquivos, que seriam gravados por todos ao mesmo tempo).
+        """
         self.index = index
-        self.precompute_vals()
+        self.idf_tolerance = idf_tolerance
+        # incrementado sempre que os valores são (re)calculados, lidos ou atualizados, para que quem
+        # guarda resultados derivados deles (ex.: QueryResultCache) saiba quando descartá-los
+        self.generation = 0
+        # termo de cada term_id (montado apenas quando necessário, ver terms_by_id)
+        self.lst_terms = None
+        if arq_vals is None or not self.load_vals(arq_vals):
+            self.precompute_vals()
+            if arq_vals is not None and persist:
+                self.save_vals(arq_vals)
+        self.avg_doc_length = float(np.sum(self.document_length))/self.doc_count if self.doc_count > 0 else 0.0
+
+    # arrays persistidos por save_vals e se são indexados pelo doc_id ("doc") ou pelo term_id ("term")
+    PERSISTED_ARRAYS = {"document_norm":"doc", "document_norm_sq":"doc", "document_length":"doc",
+                        "term_max_tf_norm":"term", "term_idf":"term", "term_doc_count":"term",
+                        "term_max_tf":"term", "term_min_doc_length":"term"}
+    # gravado junto aos arrays: identifica o índice a partir do qual foram calculados
+    FINGERPRINT_NAME = "fingerprint"
 
     def precompute_vals(self):
         """
         Inicializa os atributos por meio do indice (idx):
             doc_count: o numero de documentos que o indice possui
-            document_norm: A norma por documento (cada termo é presentado pelo seu peso (tfxidf))
+            document_norm: A norma por documento (cada termo é presentado pelo seu peso (tfxidf)),
+                em um array indexado pelo doc_id
+            document_norm_sq: o quadrado de document_norm, calculado com os idfs de term_idf
+            document_length: o tamanho (soma das frequências dos termos) de cada documento, em um
+                array (uint32) indexado pelo doc_id. A média (avg_doc_length) é calculada a partir dele
+            term_max_tf_norm: por term_id, o maior tf/norma entre os documentos do termo. Multiplicado
+                pelo idf e pelo peso do termo na consulta, é o maior valor que o termo pode somar
+                ao peso de um documento no modelo vetorial (usado na poda de MaxScoreVectorRankingModel)
+            term_doc_count: por term_id, a quantidade de documentos com o termo
+            term_max_tf e term_min_doc_length: por term_id, a maior frequência do termo e o menor
+                tamanho entre os documentos do termo (uint32), com os quais MaxScoreBM25RankingModel
+                calcula o limite superior do termo para quaisquer k1, b e tamanho médio
+            term_idf: por term_id, o idf usado no cálculo das normas. Após inclusões e remoções de
+                documentos (add_document e remove_document), update_norms atualiza apenas as normas
+                dos documentos dos termos cujo idf atual se afastou deste
+        As ocorrências são lidas em uma única passada, em lotes (Index.iter_postings_batches), e os
+        pesos de cada lote são calculados e somados por documento de forma vetorizada. Como
+        term_max_tf_norm depende das normas finais, os doc_ids e as frequências de cada lote são
+        mantidos em memória (uint32: 8 bytes por ocorrência) até o fim da passada.
+        """
+        self.doc_count = self.index.document_count
+        int_max_doc_id = max(self.index.set_documents) if self.doc_count > 0 else -1
+
+        arr_norm_sq = np.zeros(int_max_doc_id+1, dtype=np.float64)
+        arr_length = np.zeros(int_max_doc_id+1, dtype=np.float64)
+        self.term_doc_count = np.zeros(len(self.index.dic_index), dtype=np.int64)
+        self.term_idf = np.zeros(len(self.index.dic_index), dtype=np.float64)
+        self.term_max_tf = np.zeros(len(self.index.dic_index), dtype=np.uint32)
+        lst_batches = []
+        for arr_term_ids, arr_doc_counts, arr_doc_ids, arr_term_freqs in self.index.iter_postings_batches():
+            arr_idf = np.log2(self.doc_count/arr_doc_counts)
+            self.term_doc_count[arr_term_ids] = arr_doc_counts
+            self.term_idf[arr_term_ids] = arr_idf
+            self.term_max_tf[arr_term_ids] = np.maximum.reduceat(arr_term_freqs, np.cumsum(arr_doc_counts) - arr_doc_counts)
+            arr_tf_idf = (1 + np.log2(arr_term_freqs)) * np.repeat(arr_idf, arr_doc_counts)
+            arr_norm_sq += np.bincount(arr_doc_ids, weights=arr_tf_idf**2, minlength=len(arr_norm_sq))
+            arr_length += np.bincount(arr_doc_ids, weights=arr_term_freqs, minlength=len(arr_length))
+            lst_batches.append((arr_term_ids, arr_doc_counts, arr_doc_ids.astype(np.uint32), arr_term_freqs.astype(np.uint32)))
+
+        self.document_norm_sq = arr_norm_sq
+        self.document_norm = np.sqrt(arr_norm_sq)
+        self.document_length = arr_length.astype(np.uint32)
+
+        self.term_max_tf_norm = np.zeros(len(self.index.dic_index), dtype=np.float64)
+        self.term_min_doc_length = np.zeros(len(self.index.dic_index), dtype=np.uint32)
+        for arr_term_ids, arr_doc_counts, arr_doc_ids, arr_term_freqs in lst_batches:
+            arr_tf_norm = IndexPreComputedVals.tf_norm(1 + np.log2(arr_term_freqs, dtype=np.float64), self.document_norm[arr_doc_ids])
+            arr_term_starts = np.cumsum(arr_doc_counts) - arr_doc_counts
+            self.term_max_tf_norm[arr_term_ids] = np.maximum.reduceat(arr_tf_norm, arr_term_starts)
+            self.term_min_doc_length[arr_term_ids] = np.minimum.reduceat(self.document_length[arr_doc_ids], arr_term_starts)
+        self.generation += 1
+
+    @staticmethod
+    def tf_norm(arr_weights:np.ndarray, arr_norms:np.ndarray) -> np.ndarray:
+        """Peso/norma de cada ocorrência; 0 nos documentos de norma 0 (todos os termos com idf 0), que não pontuam"""
+        arr_tf_norm = np.zeros(len(arr_weights), dtype=np.float64)
+        np.divide(arr_weights, arr_norms, out=arr_tf_norm, where=arr_norms > 0)
+        return arr_tf_norm
+
+    def expected_sizes(self) -> Mapping[str, int]:
+        """Tamanho dos arrays indexados pelo doc_id ("doc") e pelo term_id ("term") para o índice atual"""
+        int_max_doc_id = max(self.index.set_documents) if self.index.document_count > 0 else -1
+        return {"doc":int(int_max_doc_id)+1, "term":len(self.index.dic_index)}
+
+    def index_fingerprint(self, arq_vals:str) -> np.ndarray:
+        """
+        Identifica o índice: quantidade de documentos e de termos, soma dos doc_ids e, caso arq_vals
+        seja o arquivo do índice, o seu tamanho e a sua data de modificação (em ns). Valores gravados
+        com outro fingerprint (ex.: índice regravado, copiado ou substituído) não são lidos.
+        """
+        docs = self.index.set_documents
+        int_doc_id_sum = int(np.sum(docs, dtype=np.int64)) if isinstance(docs, np.ndarray) else sum(docs)
+        lst_fingerprint = [self.index.document_count, len(self.index.dic_index), int_doc_id_sum, 0, 0]
+        if os.path.isfile(arq_vals):
+            stat_index = os.stat(arq_vals)
+            lst_fingerprint[3:] = [stat_index.st_size, stat_index.st_mtime_ns]
+        return np.array(lst_fingerprint, dtype=np.int64)
+
+    def save_vals(self, arq_vals:str):
+        # o fingerprint é gravado por último: arrays gravados pela metade nunca são lidos
+        str_fingerprint_file = f"{arq_vals}.{IndexPreComputedVals.FINGERPRINT_NAME}.npy"
+        if os.path.exists(str_fingerprint_file):
+            os.remove(str_fingerprint_file)
+        # os arrays podem ter sido ampliados além do necessário por add_document
+        dic_expected_size = self.expected_sizes()
+        for str_name, str_indexed_by in IndexPreComputedVals.PERSISTED_ARRAYS.items():
+            np.save(f"{arq_vals}.{str_name}.npy", getattr(self, str_name)[:dic_expected_size[str_indexed_by]])
+        np.save(str_fingerprint_file, self.index_fingerprint(arq_vals))
+
+    def load_vals(self, arq_vals:str) -> bool:
+        self.doc_count = self.index.document_count
+        str_fingerprint_file = f"{arq_vals}.{IndexPreComputedVals.FINGERPRINT_NAME}.npy"
+        if not os.path.exists(str_fingerprint_file) or not np.array_equal(np.load(str_fingerprint_file), self.index_fingerprint(arq_vals)):
+            return False
+        dic_expected_size = self.expected_sizes()
+        dic_arrays = {}
+        for str_name, str_indexed_by in IndexPreComputedVals.PERSISTED_ARRAYS.items():
+            str_file = f"{arq_vals}.{str_name}.npy"
+            if not os.path.exists(str_file):
+                return False
+            dic_arrays[str_name] = np.load(str_file, mmap_mode="r")
+            if len(dic_arrays[str_name]) != dic_expected_size[str_indexed_by]:
+                return False
+        for str_name, arr_vals in dic_arrays.items():
+            setattr(self, str_name, arr_vals)
+        self.generation += 1
+        return True
+
+    def ensure_capacity(self, int_doc_size:int, int_term_size:int):
+        """
+        Garante que os arrays possam ser alterados (os lidos por load_vals são somente leitura) e
+        comportem int_doc_size documentos e int_term_size termos. Os arrays crescem pelo menos ao
+        dobro, para que sucessivas inclusões de documentos não os copiem a cada vez.
+        """
+        dic_size = {"doc":int_doc_size, "term":int_term_size}
+        for str_name, str_indexed_by in IndexPreComputedVals.PERSISTED_ARRAYS.items():
+            arr_vals = getattr(self, str_name)
+            bol_grow = len(arr_vals) < dic_size[str_indexed_by]
+            if bol_grow or isinstance(arr_vals, np.memmap) or not arr_vals.flags.writeable:
+                int_size = max(dic_size[str_indexed_by], 2*len(arr_vals)) if bol_grow else len(arr_vals)
+                arr_new = np.zeros(int_size, dtype=arr_vals.dtype)
+                arr_new[:len(arr_vals)] = arr_vals
+                setattr(self, str_name, arr_new)
+
+    def terms_by_id(self) -> List[str]:
+        """Termo de cada term_id, montado novamente apenas quando o vocabulário cresce"""
+        if self.lst_terms is None or len(self.lst_terms) != len(self.index.dic_index):
+            self.lst_terms = [None]*len(self.index.dic_index)
+            for term in self.index.dic_index:
+                self.lst_terms[self.index.get_term_id(term)] = term
+        return self.lst_terms
+
+    def document_term_arrays(self, dic_term_freqs:Mapping[str,int]) -> (np.ndarray, np.ndarray):
+        arr_term_ids = np.fromiter((self.index.get_term_id(term) for term in dic_term_freqs), dtype=np.int64, count=len(dic_term_freqs))
+        arr_term_freqs = np.fromiter(dic_term_freqs.values(), dtype=np.float64, count=len(dic_term_freqs))
+        return arr_term_ids, arr_term_freqs
+
+    def add_document(self, doc_id:int, dic_term_freqs:Mapping[str,int]):
+        """
+        Inclui nos valores o documento doc_id, já indexado com as frequências dic_term_freqs
+        (termo -> frequência, ex.: HTMLIndexer.doc_word_count). A norma do documento usa os idfs
+        de term_idf (termos novos recebem o idf atual); as normas dos demais documentos só são
+        atualizadas por update_norms. Para substituir um documento, remova-o antes (remove_document).
+        """
+        arr_term_ids, arr_term_freqs = self.document_term_arrays(dic_term_freqs)
+        self.ensure_capacity(doc_id+1, len(self.index.dic_index))
+        self.doc_count += 1
+        self.term_doc_count[arr_term_ids] += 1
+        arr_new_terms = arr_term_ids[self.term_doc_count[arr_term_ids] == 1]
+        self.term_idf[arr_new_terms] = np.log2(self.doc_count)
+
+        arr_weights = 1 + np.log2(arr_term_freqs)
+        float_norm_sq = float(np.sum((arr_weights*self.term_idf[arr_term_ids])**2))
+        self.document_norm_sq[doc_id] = float_norm_sq
+        self.document_norm[doc_id] = np.sqrt(float_norm_sq)
+        self.document_length[doc_id] = int(np.sum(arr_term_freqs))
+        arr_tf_norm = IndexPreComputedVals.tf_norm(arr_weights, np.full(len(arr_weights), self.document_norm[doc_id]))
+        self.term_max_tf_norm[arr_term_ids] = np.maximum(self.term_max_tf_norm[arr_term_ids], arr_tf_norm)
+        self.term_max_tf[arr_term_ids] = np.maximum(self.term_max_tf[arr_term_ids], arr_term_freqs)
+        # remoções não alteram os limites de BM25, que continuam válidos (maior tf e menor tamanho)
+        self.term_min_doc_length[arr_term_ids] = np.where(self.term_doc_count[arr_term_ids] == 1, self.document_length[doc_id],
+                                                          np.minimum(self.term_min_doc_length[arr_term_ids], self.document_length[doc_id]))
+        self.avg_doc_length = (self.avg_doc_length*(self.doc_count-1) + self.document_length[doc_id])/self.doc_count
+        self.generation += 1
+
+    def remove_document(self, doc_id:int, dic_term_freqs:Mapping[str,int]):
+        """Retira dos valores o documento doc_id, que havia sido indexado com as frequências dic_term_freqs"""
+        arr_term_ids, _ = self.document_term_arrays(dic_term_freqs)
+        self.ensure_capacity(0, 0)
+        int_length = int(self.document_length[doc_id])
+        self.doc_count -= 1
+        self.term_doc_count[arr_term_ids] -= 1
+        self.document_norm_sq[doc_id] = 0
+        self.document_norm[doc_id] = 0
+        self.document_length[doc_id] = 0
+        self.avg_doc_length = (self.avg_doc_length*(self.doc_count+1) - int_length)/self.doc_count if self.doc_count > 0 else 0.0
+        self.generation += 1
+
+    def update_norms(self, idf_tolerance:float = None) -> int:
+        """
+        Atualiza as normas após inclusões e remoções de documentos. Apenas os termos cujo idf atual
+        difere do usado nas normas (term_idf) em mais de idf_tolerance (por padrão, o informado na
+        criação) são considerados: as ocorrências de cada um são lidas e a norma² dos seus documentos
+        recebe a diferença (1+log2(tf))² * (idf_atual² - idf_usado²). Assim, o custo é proporcional
+        às ocorrências dos termos alterados, e não à coleção. Os limites de term_max_tf_norm dos termos
+        alterados são recalculados; os dos demais são ampliados pela maior redução relativa das normas,
+        para que continuem sendo limites superiores. Retorna a quantidade de termos atualizados.
+        """
+        if idf_tolerance is None:
+            idf_tolerance = self.idf_tolerance
+        self.ensure_capacity(0, len(self.index.dic_index))
+        arr_doc_counts = self.term_doc_count[:len(self.index.dic_index)]
+        arr_idf = np.zeros(len(arr_doc_counts), dtype=np.float64)
+        arr_with_docs = arr_doc_counts > 0
+        arr_idf[arr_with_docs] = np.log2(self.doc_count/arr_doc_counts[arr_with_docs])
+        arr_changed = np.flatnonzero(np.abs(arr_idf - self.term_idf[:len(arr_idf)]) > idf_tolerance)
+        if len(arr_changed) == 0:
+            return 0
+
+        lst_terms = self.terms_by_id()
+        lst_doc_ids, lst_weights = [], []
+        for term_id in arr_changed.tolist():
+            arr_doc_ids, arr_term_freqs = self.index.get_occurrence_arrays(lst_terms[term_id])
+            lst_doc_ids.append(np.asarray(arr_doc_ids, dtype=np.int64))
+            lst_weights.append(1 + np.log2(np.asarray(arr_term_freqs, dtype=np.float64)))
+        arr_counts = np.array([len(arr_doc_ids) for arr_doc_ids in lst_doc_ids], dtype=np.int64)
+        arr_doc_ids = np.concatenate(lst_doc_ids)
+        arr_weights = np.concatenate(lst_weights)
+
+        arr_idf_sq_delta = arr_idf[arr_changed]**2 - self.term_idf[arr_changed]**2
+        arr_touched, arr_positions = np.unique(arr_doc_ids, return_inverse=True)
+        arr_norm_sq_delta = np.bincount(arr_positions, weights=arr_weights**2 * np.repeat(arr_idf_sq_delta, arr_counts),
+                                        minlength=len(arr_touched))
+        arr_old_norms = np.array(self.document_norm[arr_touched], dtype=np.float64)
+        self.document_norm_sq[arr_touched] = np.maximum(self.document_norm_sq[arr_touched] + arr_norm_sq_delta, 0)
+        self.document_norm[arr_touched] = np.sqrt(self.document_norm_sq[arr_touched])
+        self.term_idf[arr_changed] = arr_idf[arr_changed]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            arr_reduction = arr_old_norms/self.document_norm[arr_touched]
+            arr_reduction = arr_reduction[np.isfinite(arr_reduction)]
+            if len(arr_reduction) and arr_reduction.max() > 1:
+                self.term_max_tf_norm *= arr_reduction.max()
+            arr_tf_norm = IndexPreComputedVals.tf_norm(arr_weights, self.document_norm[arr_doc_ids])
+            arr_with_postings = arr_counts > 0
+            arr_term_starts = (np.cumsum(arr_counts) - arr_counts)[arr_with_postings]
+            self.term_max_tf_norm[arr_changed] = 0
+            if len(arr_term_starts):
+                self.term_max_tf_norm[arr_changed[arr_with_postings]] = np.maximum.reduceat(arr_tf_norm, arr_term_starts)
+        self.generation += 1
+        return len(arr_changed)
+
+def get_posting_arrays(lst_occurrences) -> (np.ndarray, np.ndarray):
+    """
+    Retorna os arrays (doc_ids, term_freqs) de uma lista de ocorrências. Listas do índice
+    (OccurrenceList) já são representadas por arrays; de um cursor (PostingCursor), são lidas
+    as ocorrências restantes; listas de TermOccurrence são convertidas.
+    """
+    if isinstance(lst_occurrences, PostingCursor):
+        arr_doc_ids, arr_term_freqs = lst_occurrences.remaining_arrays()
+        return np.asarray(arr_doc_ids, dtype=np.int64), np.asarray(arr_term_freqs, dtype=np.float64)
+    if hasattr(lst_occurrences, "doc_ids"):
+        return np.asarray(lst_occurrences.doc_ids, dtype=np.int64), np.asarray(lst_occurrences.term_freqs, dtype=np.float64)
+    arr_doc_ids = np.fromiter((occurrence.doc_id for occurrence in lst_occurrences), dtype=np.int64, count=len(lst_occurrences))
+    arr_term_freqs = np.fromiter((occurrence.term_freq for occurrence in lst_occurrences), dtype=np.float64, count=len(lst_occurrences))
+    return arr_doc_ids, arr_term_freqs
+
+
+def get_posting_cursor(lst_occurrences) -> PostingCursor:
+    """Cursor (PostingCursor) sobre uma lista de ocorrências; cursores são retornados sem alteração"""
+    if isinstance(lst_occurrences, PostingCursor):
+        return lst_occurrences
+    return ArrayPostingCursor(None, *get_posting_arrays(lst_occurrences))
+
+
+def accumulate_scores(lst_doc_ids:List[np.ndarray], lst_scores:List[np.ndarray]) -> (np.ndarray, np.ndarray):
+    """
+    Soma, por documento, os pesos das ocorrências de todos os termos. Retorna os documentos
+    alcançados (ordenados) e a soma de cada um. Quando os doc_ids são densos em relação à
+    quantidade de ocorrências, acumula em um array indexado pelo doc_id; caso contrário
+    (consultas pequenas), acumula apenas sobre os documentos distintos.
+    """
+    if not lst_doc_ids:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    arr_doc_ids = np.concatenate(lst_doc_ids)
+    arr_scores = np.concatenate(lst_scores)
+    if len(arr_doc_ids) == 0:
+        return arr_doc_ids, arr_scores
+
+    int_max_doc_id = int(arr_doc_ids.max())
+    if int_max_doc_id < 8*len(arr_doc_ids):
+        arr_accumulator = np.bincount(arr_doc_ids, weights=arr_scores, minlength=int_max_doc_id+1)
+        arr_touched = np.zeros(int_max_doc_id+1, dtype=bool)
+        arr_touched[arr_doc_ids] = True
+        arr_touched_docs = np.flatnonzero(arr_touched)
+        return arr_touched_docs, arr_accumulator[arr_touched_docs]
+
+    arr_touched_docs, arr_positions = np.unique(arr_doc_ids, return_inverse=True)
+    return arr_touched_docs, np.bincount(arr_positions, weights=arr_scores, minlength=len(arr_touched_docs))
+
+
+def get_doc_values(doc_values, arr_doc_ids:np.ndarray) -> np.ndarray:
+    """Obtém os valores (ex.: normas) de cada documento, seja doc_values um array indexado pelo doc_id ou um dicionário"""
+    if isinstance(doc_values, dict):
+        return np.array([doc_values[doc_id] for doc_id in arr_doc_ids.tolist()], dtype=np.float64)
+    return np.asarray(doc_values[arr_doc_ids], dtype=np.float64)
+
+
+class DocumentWeights(MappingABC):
+    """
+    Mapeamento doc_id -> peso sobre os arrays (doc_ids ordenados e pesos) calculados pelo
+    modelo, sem criar um dicionário com um item por documento.
+    """
+    def __init__(self, arr_doc_ids:np.ndarray, arr_weights:np.ndarray):
+        self.arr_doc_ids = arr_doc_ids
+        self.arr_weights = arr_weights
+
+    def find(self, doc_id) -> int:
+        int_position = int(np.searchsorted(self.arr_doc_ids, doc_id))
+        if int_position < len(self.arr_doc_ids) and self.arr_doc_ids[int_position] == doc_id:
+            return int_position
+        return -1
+
+    def __getitem__(self, doc_id) -> float:
+        int_position = self.find(doc_id)
+        if int_position < 0:
+            raise KeyError(doc_id)
+        return float(self.arr_weights[int_position])
+
+    def __contains__(self, doc_id) -> bool:
+        return self.find(doc_id) >= 0
+
+    def __iter__(self):
+        return iter(self.arr_doc_ids.tolist())
+
+    def __len__(self):
+        return len(self.arr_doc_ids)
+
+    def __str__(self):
+        return str(dict(zip(self.arr_doc_ids.tolist(), self.arr_weights.tolist())))
+
+    def __repr__(self):
+        return str(self)
+
+
+class ExternalDocumentWeights(MappingABC):
+    """
+    Pesos calculados sobre os doc_ids internos do índice (ex.: DocumentWeights) acessados pelos
+    doc_ids externos de um DocIdMap. Os doc_ids são traduzidos apenas quando consultados, sem
+    copiar os pesos.
+    """
+    def __init__(self, doc_weights:Mapping[int,float], doc_id_map):
+        self.doc_weights = doc_weights
+        self.doc_id_map = doc_id_map
+
+    def __getitem__(self, doc_id) -> float:
+        if doc_id not in self.doc_id_map:
+            raise KeyError(doc_id)
+        return self.doc_weights[self.doc_id_map.to_internal(doc_id)]
+
+    def __contains__(self, doc_id) -> bool:
+        return doc_id in self.doc_id_map and self.doc_id_map.to_internal(doc_id) in self.doc_weights
+
+    def __iter__(self):
+        for doc_id in self.doc_weights:
+            yield self.doc_id_map.to_external(doc_id)
+
+    def __len__(self):
+        return len(self.doc_weights)
+
+    def __str__(self):
+        return str(dict(self.items()))
+
+    def __repr__(self):
+        return str(self)
+
+
+class MaxScoreEvaluator():
+    """
+    Avaliação com a poda MaxScore. Recebe, por termo da consulta, um cursor (PostingCursor) sobre
+    as suas ocorrências, a função que calcula a contribuição das ocorrências ao peso (antes da
+    divisão por doc_divisors) a partir dos doc_ids e das frequências e um limite superior da
+    contribuição já dividida. O peso de um documento é a soma das contribuições (na ordem dos
+    termos recebidos) dividida por doc_divisors[doc_id] (caso informado).
+
+    Os termos são avaliados do maior para o menor limite superior. Enquanto a soma dos limites
+    dos termos restantes não for menor que o k-ésimo maior peso parcial (limiar), novos
+    documentos ainda podem entrar no top-k e todas as ocorrências do termo são lidas. A partir
+    daí, os termos restantes são apenas consultados (PostingCursor.lookup) para os candidatos cujo
+    peso parcial somado aos limites restantes ainda alcança o limiar: com a tabela de saltos, as
+    partes das listas sem candidatos não são decodificadas. Ao final, o peso dos candidatos é
+    recalculado na ordem original dos termos, de forma que o resultado seja idêntico ao da
+    avaliação exaustiva (inclusive nos empates).
+
+    Cada avaliação usa o seu próprio avaliador (com o seu k e as suas estatísticas), para que
+    consultas concorrentes em um mesmo modelo não interfiram umas nas outras.
+    """
+    # folga relativa nas comparações com o limiar para absorver erros de arredondamento
+    BOUND_SLACK = 1e-9
+
+    def __init__(self, k:int):
+        self.k = k
+        # estatísticas da última avaliação: ocorrências dos termos, somadas ao peso e decodificadas
+        self.postings_total = 0
+        self.postings_scored = 0
+        self.postings_decoded = 0
+
+    def threshold(self, arr_partial:np.ndarray) -> float:
+        if len(arr_partial) < self.k:
+            return -math.inf
+        return np.partition(arr_partial, len(arr_partial)-self.k)[len(arr_partial)-self.k]
+
+    def divide(self, arr_contributions:np.ndarray, doc_divisors, arr_doc_ids:np.ndarray) -> np.ndarray:
+        if doc_divisors is None:
+            return arr_contributions
+        return arr_contributions/get_doc_values(doc_divisors, arr_doc_ids)
+
+    def evaluate(self, lst_cursors:List[PostingCursor], contribution, lst_upper_bounds:List[float],
+                 doc_divisors = None) -> (np.ndarray, np.ndarray):
+        """
+        Retorna os candidatos (doc_ids ordenados) e os seus pesos. O top-k da avaliação
+        exaustiva está sempre entre eles. contribution(posição do termo, doc_ids, frequências)
+        retorna a contribuição de cada ocorrência.
         """
-        self.document_norm = {}
-        self.doc_count = self.index.document_count       
+        self.postings_total = sum(len(cursor) for cursor in lst_cursors)
+        self.postings_scored = 0
+        lst_decoded_before = [cursor.postings_decoded for cursor in lst_cursors]
+        if self.k <= 0 or len(lst_cursors) == 0:
+            self.postings_decoded = 0
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+
+        lst_order = sorted(range(len(lst_cursors)), key=lambda term: -lst_upper_bounds[term])
+        # limite superior da soma dos termos a partir de cada posição da ordem
+        arr_remaining_bounds = np.cumsum([lst_upper_bounds[term] for term in lst_order][::-1])[::-1]
+        arr_remaining_bounds = np.append(arr_remaining_bounds * (1+MaxScoreEvaluator.BOUND_SLACK), 0.0)
+        # por termo, as ocorrências lidas (todas ou apenas as dos candidatos) e as suas contribuições
+        lst_doc_ids = [None]*len(lst_cursors)
+        lst_contributions = [None]*len(lst_cursors)
+
+        # termos que ainda podem trazer novos documentos: todas as ocorrências são lidas
+        int_position = 0
+        float_threshold = -math.inf
+        arr_candidates = np.zeros(0, dtype=np.int64)
+        arr_partial = np.zeros(0, dtype=np.float64)
+        while int_position < len(lst_order) and arr_remaining_bounds[int_position] >= float_threshold:
+            term = lst_order[int_position]
+            arr_doc_ids, arr_term_freqs = get_posting_arrays(lst_cursors[term])
+            lst_doc_ids[term], lst_contributions[term] = arr_doc_ids, contribution(term, arr_doc_ids, arr_term_freqs)
+            arr_candidates, arr_partial = accumulate_scores([arr_candidates, arr_doc_ids],
+                                                            [arr_partial, self.divide(lst_contributions[term], doc_divisors, arr_doc_ids)])
+            self.postings_scored += len(arr_doc_ids)
+            float_threshold = self.threshold(arr_partial) * (1-MaxScoreEvaluator.BOUND_SLACK)
+            int_position += 1
 
-        tf_idf_dict = dict()
+        # termos restantes: apenas consultados para os candidatos que ainda alcançam o limiar
+        while int_position < len(lst_order):
+            arr_alive = arr_partial + arr_remaining_bounds[int_position] >= float_threshold
+            arr_candidates, arr_partial = arr_candidates[arr_alive], arr_partial[arr_alive]
+            term = lst_order[int_position]
+            arr_found, arr_term_freqs = lst_cursors[term].lookup(arr_candidates)
+            lst_doc_ids[term] = arr_candidates[arr_found]
+            lst_contributions[term] = contribution(term, lst_doc_ids[term], np.asarray(arr_term_freqs, dtype=np.float64))
+            arr_partial[arr_found] += self.divide(lst_contributions[term], doc_divisors, lst_doc_ids[term])
+            self.postings_scored += len(lst_doc_ids[term])
+            float_threshold = max(float_threshold, self.threshold(arr_partial) * (1-MaxScoreEvaluator.BOUND_SLACK))
+            int_position += 1
+        arr_alive = arr_partial >= float_threshold
+        arr_candidates = arr_candidates[arr_alive]
+        self.postings_decoded = sum(cursor.postings_decoded - int_before for cursor, int_before in zip(lst_cursors, lst_decoded_before))
 
-        for term in self.index.dic_index:          
-            for occurrence in self.index.get_occurrence_list(term): 
-                if occurrence.doc_id in tf_idf_dict.keys():
-                    tf_idf_dict[occurrence.doc_id].append(VectorRankingModel.tf_idf(self.doc_count, occurrence.term_freq, self.index.dic_index[term].doc_count_with_term))
-                else:
-                    tf_idf_dict[occurrence.doc_id] = [VectorRankingModel.tf_idf(self.doc_count, occurrence.term_freq, self.index.dic_index[term].doc_count_with_term)]
+        # peso exato dos candidatos, somando na mesma ordem da avaliação exaustiva
+        # (os candidatos finais foram consultados em todos os termos)
+        arr_scores = np.zeros(len(arr_candidates), dtype=np.float64)
+        for arr_doc_ids, arr_contributions in zip(lst_doc_ids, lst_contributions):
+            arr_found, arr_term_positions = MaxScoreEvaluator.lookup(arr_doc_ids, arr_candidates)
+            arr_scores[arr_found] += arr_contributions[arr_term_positions]
+        return arr_candidates, self.divide(arr_scores, doc_divisors, arr_candidates)
+
+    @staticmethod
+    def lookup(arr_doc_ids:np.ndarray, arr_candidates:np.ndarray) -> (np.ndarray, np.ndarray):
+        """
+        Busca binária dos candidatos na lista (ordenada) de doc_ids de um termo. Retorna a máscara
+        dos candidatos encontrados e a posição de cada um deles na lista do termo.
+        """
+        arr_positions = np.searchsorted(arr_doc_ids, arr_candidates)
+        arr_found = arr_positions < len(arr_doc_ids)
+        arr_found[arr_found] = arr_doc_ids[arr_positions[arr_found]] == arr_candidates[arr_found]
+        return arr_found, arr_positions[arr_found]
+
+
+class PruningStats():
+    """
+    Estatísticas acumuladas das avaliações com poda (MaxScoreEvaluator) de um modelo: consultas e
+    ocorrências dos termos, somadas ao peso e decodificadas. Somadas com trava, já que um mesmo
+    modelo pode avaliar consultas concorrentes.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.postings_total = 0
+        self.postings_scored = 0
+        self.postings_decoded = 0
+
+    def add(self, evaluator:MaxScoreEvaluator):
+        with self.lock:
+            self.queries += 1
+            self.postings_total += evaluator.postings_total
+            self.postings_scored += evaluator.postings_scored
+            self.postings_decoded += evaluator.postings_decoded
 
-        for doc_id, values in tf_idf_dict.items():
-            sum = 0
-            for tf_idf in values:
-                sum += tf_idf**2
-            self.document_norm[doc_id] = math.sqrt(sum)
 
 class RankingModel():
     @abstractmethod
     def get_ordered_docs(self,query:Mapping[str,TermOccurrence],
-                              docs_occur_per_term:Mapping[str,List[TermOccurrence]]) -> (List[int], Mapping[int,float]):
+                              docs_occur_per_term:Mapping[str,List[TermOccurrence]], k:int = None) -> (List[int], Mapping[int,float]):
         raise NotImplementedError("Voce deve criar uma subclasse e a mesma deve sobrepor este método")
 
-    def rank_document_ids(self,documents_weight):
-        doc_ids = list(documents_weight.keys())
-        doc_ids.sort(key= lambda x:-documents_weight[x])
-        return doc_ids
+    def rank_document_ids(self,documents_weight, k:int = None):
+        """
+        Ordena os documentos pelo peso (decrescente); empates são desfeitos pelo doc_id (crescente).
+        Caso k seja informado, apenas os k melhores são selecionados (com um heap, sem ordenar todos).
+        """
+        if k is None:
+            return sorted(documents_weight.keys(), key=lambda doc_id: (-documents_weight[doc_id], doc_id))
+        return heapq.nsmallest(k, documents_weight.keys(), key=lambda doc_id: (-documents_weight[doc_id], doc_id))
+
+    def rank_document_arrays(self, arr_doc_ids:np.ndarray, arr_weights:np.ndarray, k:int = None) -> List[int]:
+        """
+        Mesmo critério de rank_document_ids, sobre arrays. Com k, apenas os documentos com
+        peso maior ou igual ao k-ésimo maior peso (np.partition) são ordenados.
+        """
+        if k is not None and k < len(arr_doc_ids):
+            if k <= 0:
+                return []
+            float_kth_weight = np.partition(arr_weights, len(arr_weights)-k)[len(arr_weights)-k]
+            arr_candidates = arr_weights >= float_kth_weight
+            arr_doc_ids, arr_weights = arr_doc_ids[arr_candidates], arr_weights[arr_candidates]
+        arr_order = np.lexsort((arr_doc_ids, -arr_weights))
+        return arr_doc_ids[arr_order][:k].tolist()
 
 class OPERATOR(Enum):
   AND = 1
@@ -55,34 +576,81 @@ class BooleanRankingModel(RankingModel):
     def __init__(self,operator:OPERATOR):
         self.operator = operator
 
-    def intersection_all(self, map_lst_occurrences:Mapping[str,List[TermOccurrence]]) -> List[int]:
-        
-        set_lst = []
+    @staticmethod
+    def galloping_intersection(arr_small:np.ndarray, arr_large:np.ndarray) -> np.ndarray:
+        """
+        Interseção de duas listas ordenadas de doc_ids. Cada doc_id da menor lista é procurado na
+        maior a partir da posição do anterior, com passos que dobram de tamanho (busca exponencial)
+        seguidos de uma busca binária no último intervalo. Assim, apenas O(m log(n/m)) posições da
+        lista maior são lidas.
+        """
+        int_large_size = len(arr_large)
+        lst_doc_ids = []
+        int_position = 0
+        for doc_id in arr_small.tolist():
+            int_step = 1
+            while int_position+int_step < int_large_size and arr_large[int_position+int_step] < doc_id:
+                int_step *= 2
+            int_position = bisect.bisect_left(arr_large, doc_id, int_position+int_step//2,
+                                              min(int_position+int_step+1, int_large_size))
+            if int_position == int_large_size:
+                break
+            if arr_large[int_position] == doc_id:
+                lst_doc_ids.append(doc_id)
+        return np.array(lst_doc_ids, dtype=np.int64)
 
-        for  term, lst_occurrences in map_lst_occurrences.items():
-            set_ids = set()
-            for term_occurence in lst_occurrences:
-                set_ids.add(term_occurence.doc_id)
-            set_lst.append(set_ids)    
-                
-        return set.intersection(*set_lst) if set_lst else set()
+    @staticmethod
+    def cursor_intersection(arr_small:np.ndarray, cursor:PostingCursor) -> np.ndarray:
+        """
+        Interseção de uma lista ordenada de doc_ids com as ocorrências de um cursor, avançando o
+        cursor (PostingCursor.advance) até cada doc_id: partes da lista do cursor sem candidatos
+        são puladas pela sua tabela de saltos.
+        """
+        lst_doc_ids = []
+        for doc_id in arr_small.tolist():
+            occur = cursor.advance(doc_id)
+            if occur is None:
+                break
+            if occur.doc_id == doc_id:
+                lst_doc_ids.append(doc_id)
+        return np.array(lst_doc_ids, dtype=np.int64)
 
-    def union_all(self, map_lst_occurrences:Mapping[str,List[TermOccurrence]]) -> List[int]:
-        set_ids = set()
-        
-        for  term, lst_occurrences in map_lst_occurrences.items():
-            for term_occurence in lst_occurrences:
-                set_ids.add(term_occurence.doc_id)
+    def intersection_all(self, map_lst_occurrences:Mapping[str,List[TermOccurrence]]) -> np.ndarray:
+        """
+        Documentos (ordenados) presentes em todas as listas. As listas são intersectadas da menor
+        para a maior, de forma que o resultado parcial nunca seja maior que a menor lista.
+        As listas maiores recebidas como cursores são apenas avançadas até os candidatos.
+        """
+        lst_occurrences_by_size = sorted(map_lst_occurrences.values(), key=len)
+        if not lst_occurrences_by_size:
+            return np.zeros(0, dtype=np.int64)
+        arr_doc_ids = get_posting_arrays(lst_occurrences_by_size[0])[0]
+        for lst_occurrences in lst_occurrences_by_size[1:]:
+            if len(arr_doc_ids) == 0:
+                break
+            if isinstance(lst_occurrences, PostingCursor):
+                arr_doc_ids = BooleanRankingModel.cursor_intersection(arr_doc_ids, lst_occurrences)
+            else:
+                arr_doc_ids = BooleanRankingModel.galloping_intersection(arr_doc_ids, get_posting_arrays(lst_occurrences)[0])
+        return arr_doc_ids
 
-        return set_ids
+    def union_all(self, map_lst_occurrences:Mapping[str,List[TermOccurrence]]) -> np.ndarray:
+        """Documentos (ordenados) presentes em alguma das listas, por meio da intercalação (k-way merge) das listas"""
+        lst_doc_ids = []
+        for doc_id in heapq.merge(*(get_posting_arrays(lst_occurrences)[0].tolist() for lst_occurrences in map_lst_occurrences.values())):
+            if not lst_doc_ids or lst_doc_ids[-1] != doc_id:
+                lst_doc_ids.append(doc_id)
+        return np.array(lst_doc_ids, dtype=np.int64)
 
     def get_ordered_docs(self,query:Mapping[str,TermOccurrence],
-                              map_lst_occurrences:Mapping[str,List[TermOccurrence]]) -> (List[int], Mapping[int,float]):
+                              map_lst_occurrences:Mapping[str,List[TermOccurrence]], k:int = None) -> (List[int], Mapping[int,float]):
         """Considere que map_lst_occurrences possui as ocorrencias apenas dos termos que existem na consulta"""
         if self.operator == OPERATOR.AND:
-            return self.intersection_all(map_lst_occurrences),None
+            doc_ids = self.intersection_all(map_lst_occurrences)
         else:
-            return self.union_all(map_lst_occurrences),None
+            doc_ids = self.union_all(map_lst_occurrences)
+        #os documentos já estão ordenados pelo doc_id
+        return doc_ids[:k].tolist(),None
 
 #Atividade 2
 class VectorRankingModel(RankingModel):
@@ -106,37 +674,153 @@ class VectorRankingModel(RankingModel):
         return tf*idf
 
     def get_ordered_docs(self,query:Mapping[str,TermOccurrence],
-                              docs_occur_per_term:Mapping[str,List[TermOccurrence]]) -> (List[int], Mapping[int,float]):
-            documents_weight = {}
-            docs_with_term ={}
-            tf_idf_dict = dict()
-            dict_position = dict()
-           # for  term, TermOccurrence in query.items():
-            for  term, lst_occurrences in docs_occur_per_term.items():
-                docs_with_term[term] = len(lst_occurrences);
-                for occurrence in lst_occurrences: 
-                    if term in tf_idf_dict.keys():
-                        tf_idf_dict[term].append([VectorRankingModel.tf_idf(self.idx_pre_comp_vals.doc_count, occurrence.term_freq, docs_with_term[term]),occurrence.doc_id])
-                    else:
-                        tf_idf_dict[term] = []
-                        tf_idf_dict[term].append([VectorRankingModel.tf_idf(self.idx_pre_comp_vals.doc_count, occurrence.term_freq, docs_with_term[term]),occurrence.doc_id])
-                        
-            querryWeight = dict()
-            for  term, lst_occurrences in query.items():
-                if term in docs_with_term:
-                    querryWeight[term] =  [VectorRankingModel.tf_idf(self.idx_pre_comp_vals.doc_count, lst_occurrences.term_freq, docs_with_term[term])]
-                
-                
-            for key,values in tf_idf_dict.items():
-                for value in values:
-                    if value[1] in documents_weight:
-                        documents_weight[value[1]] = value[0]*querryWeight[key][0] +documents_weight[value[1]];
-                    else:
-                        documents_weight[value[1]] = value[0]*querryWeight[key][0]
-                        
-            for key,value in documents_weight.items():
-                documents_weight[key] /= self.idx_pre_comp_vals.document_norm[key];   
-                
+                              docs_occur_per_term:Mapping[str,List[TermOccurrence]], k:int = None) -> (List[int], Mapping[int,float]):
+            """
+            Avaliação termo a termo: os pesos tf-idf das ocorrências de cada termo são calculados
+            de uma vez (arrays), acumulados por documento (accumulate_scores) e normalizados
+            apenas nos documentos alcançados pela consulta.
+            """
+            doc_count = self.idx_pre_comp_vals.doc_count
+            lst_doc_ids = []
+            lst_scores = []
+            for term, lst_occurrences in docs_occur_per_term.items():
+                num_docs_with_term = len(lst_occurrences)
+                if term not in query or num_docs_with_term == 0:
+                    continue
+                arr_doc_ids, arr_term_freqs = get_posting_arrays(lst_occurrences)
+                query_weight = VectorRankingModel.tf_idf(doc_count, query[term].term_freq, num_docs_with_term)
+                idf = VectorRankingModel.idf(doc_count, num_docs_with_term)
+                lst_doc_ids.append(arr_doc_ids)
+                lst_scores.append((1 + np.log2(arr_term_freqs)) * (idf*query_weight))
+
+            arr_doc_ids, arr_scores = accumulate_scores(lst_doc_ids, lst_scores)
+            arr_scores /= get_doc_values(self.idx_pre_comp_vals.document_norm, arr_doc_ids)
+
             #retona a lista de doc ids ordenados de acordo com o TF IDF
-            return self.rank_document_ids(documents_weight),documents_weight
+            return self.rank_document_arrays(arr_doc_ids, arr_scores, k),DocumentWeights(arr_doc_ids, arr_scores)
+
+
+class MaxScoreVectorRankingModel(VectorRankingModel):
+    """
+    Modelo vetorial que, quando k é informado, avalia a consulta com a poda MaxScore (MaxScoreEvaluator), retornando o mesmo top-k da avaliação exaustiva.
+    O limite superior de cada termo vem de IndexPreComputedVals.term_max_tf_norm. As ocorrências recebidas como
+    cursores (PostingCursor, ex.: QueryRunner.get_posting_cursor_per_term) são decodificadas apenas quando necessário.
+    """
+    def __init__(self,idx_pre_comp_vals:IndexPreComputedVals):
+        super().__init__(idx_pre_comp_vals)
+        self.pruning_stats = PruningStats()
+
+    def get_ordered_docs(self,query:Mapping[str,TermOccurrence],
+                              docs_occur_per_term:Mapping[str,List[TermOccurrence]], k:int = None) -> (List[int], Mapping[int,float]):
+        if k is None:
+            return super().get_ordered_docs(query, docs_occur_per_term)
+
+        doc_count = self.idx_pre_comp_vals.doc_count
+        lst_cursors, lst_term_weights, lst_upper_bounds = [], [], []
+        for term, lst_occurrences in docs_occur_per_term.items():
+            num_docs_with_term = len(lst_occurrences)
+            if term not in query or num_docs_with_term == 0:
+                continue
+            query_weight = VectorRankingModel.tf_idf(doc_count, query[term].term_freq, num_docs_with_term)
+            idf = VectorRankingModel.idf(doc_count, num_docs_with_term)
+            lst_cursors.append(get_posting_cursor(lst_occurrences))
+            lst_term_weights.append(idf*query_weight)
+            lst_upper_bounds.append(idf*query_weight*float(self.idx_pre_comp_vals.term_max_tf_norm[query[term].term_id]))
+
+        evaluator = MaxScoreEvaluator(k)
+        arr_doc_ids, arr_scores = evaluator.evaluate(lst_cursors,
+                                                     lambda term, arr_doc_ids, arr_term_freqs: (1 + np.log2(arr_term_freqs)) * lst_term_weights[term],
+                                                     lst_upper_bounds, self.idx_pre_comp_vals.document_norm)
+        self.pruning_stats.add(evaluator)
+        return self.rank_document_arrays(arr_doc_ids, arr_scores, k), DocumentWeights(arr_doc_ids, arr_scores)
+
+
+class BM25RankingModel(RankingModel):
+    """
+    Modelo probabilístico BM25. O peso de um documento d para a consulta é a soma, nos termos t
+    da consulta, de:
+        freq_consulta(t) * idf(t) * f(t,d)*(k1+1) / (f(t,d) + k1*(1-b+b*|d|/avg_doc_length))
+    com idf(t) = log2(1 + (N - n_t + 0.5)/(n_t + 0.5)), que nunca é negativo. Os tamanhos dos
+    documentos vêm de IndexPreComputedVals e o fator de normalização pelo tamanho
+    (k1*(1-b+b*|d|/avg_doc_length)) é calculado uma única vez por modelo, e novamente apenas
+    quando os valores pré-computados mudam (IndexPreComputedVals.generation).
+    """
+    def __init__(self,idx_pre_comp_vals:IndexPreComputedVals, k1:float = 1.2, b:float = 0.75):
+        self.idx_pre_comp_vals = idx_pre_comp_vals
+        self.k1 = k1
+        self.b = b
+        self.compute_length_norm()
+
+    def compute_length_norm(self):
+        idx_pre_comp_vals = self.idx_pre_comp_vals
+        self.float_avg_length = idx_pre_comp_vals.avg_doc_length if idx_pre_comp_vals.avg_doc_length > 0 else 1.0
+        self.length_norm = self.k1*((1-self.b) + self.b*np.asarray(idx_pre_comp_vals.document_length, dtype=np.float64)/self.float_avg_length)
+        self.length_norm_generation = idx_pre_comp_vals.generation
+
+    @staticmethod
+    def idf(doc_count:int, num_docs_with_term:int) -> float:
+        return math.log2(1 + (doc_count - num_docs_with_term + 0.5)/(num_docs_with_term + 0.5))
+
+    def get_ordered_docs(self,query:Mapping[str,TermOccurrence],
+                              docs_occur_per_term:Mapping[str,List[TermOccurrence]], k:int = None) -> (List[int], Mapping[int,float]):
+        """
+        Avaliação termo a termo, como em VectorRankingModel: os pesos das ocorrências de cada
+        termo são calculados de uma vez (arrays) e acumulados por documento (accumulate_scores).
+        """
+        if self.length_norm_generation != self.idx_pre_comp_vals.generation:
+            self.compute_length_norm()
+        doc_count = self.idx_pre_comp_vals.doc_count
+        lst_doc_ids = []
+        lst_scores = []
+        for term, lst_occurrences in docs_occur_per_term.items():
+            num_docs_with_term = len(lst_occurrences)
+            if term not in query or num_docs_with_term == 0:
+                continue
+            arr_doc_ids, arr_term_freqs = get_posting_arrays(lst_occurrences)
+            term_weight = query[term].term_freq * BM25RankingModel.idf(doc_count, num_docs_with_term)
+            lst_doc_ids.append(arr_doc_ids)
+            lst_scores.append(arr_term_freqs*(term_weight*(self.k1+1)) / (arr_term_freqs + self.length_norm[arr_doc_ids]))
+
+        arr_doc_ids, arr_scores = accumulate_scores(lst_doc_ids, lst_scores)
+        return self.rank_document_arrays(arr_doc_ids, arr_scores, k),DocumentWeights(arr_doc_ids, arr_scores)
+
+
+class MaxScoreBM25RankingModel(BM25RankingModel):
+    """
+    BM25 que, quando k é informado, avalia a consulta com a poda MaxScore (MaxScoreEvaluator), retornando o mesmo
+    top-k (e pesos) da avaliação exaustiva. Como f/(f+L) cresce com a frequência f e diminui com a normalização L,
+    o limite superior de um termo usa a sua maior frequência e o seu menor documento (IndexPreComputedVals.term_max_tf
+    e term_min_doc_length): freq_consulta * idf * (k1+1) * max_tf/(max_tf + k1*(1-b+b*min_len/avg_doc_length)).
+    """
+    def __init__(self,idx_pre_comp_vals:IndexPreComputedVals, k1:float = 1.2, b:float = 0.75):
+        super().__init__(idx_pre_comp_vals, k1, b)
+        self.pruning_stats = PruningStats()
+
+    def get_ordered_docs(self,query:Mapping[str,TermOccurrence],
+                              docs_occur_per_term:Mapping[str,List[TermOccurrence]], k:int = None) -> (List[int], Mapping[int,float]):
+        if k is None:
+            return super().get_ordered_docs(query, docs_occur_per_term)
+        if self.length_norm_generation != self.idx_pre_comp_vals.generation:
+            self.compute_length_norm()
+
+        doc_count = self.idx_pre_comp_vals.doc_count
+        arr_length_norm = self.length_norm
+        lst_cursors, lst_term_weights, lst_upper_bounds = [], [], []
+        for term, lst_occurrences in docs_occur_per_term.items():
+            num_docs_with_term = len(lst_occurrences)
+            if term not in query or num_docs_with_term == 0:
+                continue
+            term_id = query[term].term_id
+            term_weight = query[term].term_freq * BM25RankingModel.idf(doc_count, num_docs_with_term) * (self.k1+1)
+            float_max_tf = float(self.idx_pre_comp_vals.term_max_tf[term_id])
+            float_min_norm = self.k1*((1-self.b) + self.b*float(self.idx_pre_comp_vals.term_min_doc_length[term_id])/self.float_avg_length)
+            lst_cursors.append(get_posting_cursor(lst_occurrences))
+            lst_term_weights.append(term_weight)
+            lst_upper_bounds.append(term_weight*float_max_tf/(float_max_tf + float_min_norm) if float_max_tf > 0 else term_weight)
 
+        evaluator = MaxScoreEvaluator(k)
+        arr_doc_ids, arr_scores = evaluator.evaluate(lst_cursors,
+                                                     lambda term, arr_doc_ids, arr_term_freqs: arr_term_freqs*lst_term_weights[term] / (arr_term_freqs + arr_length_norm[arr_doc_ids]),
+                                                     lst_upper_bounds)
+        self.pruning_stats.add(evaluator)
+        return self.rank_document_arrays(arr_doc_ids, arr_scores, k), DocumentWeights(arr_doc_ids, arr_scores)
@@ -0,0 +1,169 @@
+from concurrent.futures import Executor, ProcessPoolExecutor
+from collections import deque
+from typing import List, Mapping, Tuple
+from urllib.parse import urlsplit, parse_qs
+from query.processing import QueryRunner
+from query.ranking_models import IndexPreComputedVals, MaxScoreVectorRankingModel, MaxScoreBM25RankingModel
+from index.structure import Index
+from index.indexer import Cleaner, HTMLIndexer
+import numpy as np
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+
+
+# QueryRunner de cada processo do pool (criado uma única vez, em init_query_worker)
+worker_query_runner = None
+
+# as consultas sempre informam k: os modelos usam a poda MaxScore, com o mesmo top-k (e pesos) da avaliação exaustiva
+RANKING_MODELS = {"vector":MaxScoreVectorRankingModel, "bm25":MaxScoreBM25RankingModel}
+
+
+def init_query_worker(arq_index: str, str_ranking_model: str, cleaner: Cleaner):
+    """
+    Abre o índice e os valores pré-computados uma única vez por processo do pool. Os valores
+    já foram gravados pelo processo principal (QueryServer): aqui são apenas lidos.
+    """
+    global worker_query_runner
+    index = Index.read(arq_index)
+    idx_pre_comp_vals = IndexPreComputedVals(index, arq_index, persist=False)
+    worker_query_runner = QueryRunner(RANKING_MODELS[str_ranking_model](idx_pre_comp_vals), index, cleaner)
+
+
+def run_query_worker(query: str, k: int) -> Tuple[List[int], List[float]]:
+    lst_docs, dic_weights = worker_query_runner.get_docs_term(query, k)
+    return lst_docs, [float(dic_weights[doc_id]) for doc_id in lst_docs] if dic_weights is not None else None
+
+
+class QueryServer:
+    """
+    Serviço de consultas (asyncio) sobre HTTP, em uma porta TCP ou em um socket Unix:
+        GET /search?q=<consulta>&k=<quantidade>: documentos (e pesos) da consulta, em JSON
+        GET /stats: quantidade de requisições e percentis da latência, em JSON
+    O índice e os valores pré-computados são carregados uma única vez em cada processo do pool
+    (init_query_worker), que calcula as respostas sem ocupar o laço de eventos. Os valores
+    pré-computados são calculados e gravados (caso necessário) pelo processo principal antes do
+    início do pool, para que os processos apenas os leiam. Consultas idênticas que chegam
+    enquanto a primeira ainda está sendo calculada aguardam a mesma resposta.
+    """
+    # quantidade de latências guardadas para o cálculo dos percentis
+    LATENCY_WINDOW = 10000
+    DEFAULT_K = 10
+    MAX_REQUEST_SIZE = 65536
+
+    def __init__(self, arq_index: str, num_workers: int = None, str_ranking_model: str = "bm25",
+                 cleaner: Cleaner = None, executor: Executor = None):
+        if executor is None:
+            IndexPreComputedVals(Index.read(arq_index), arq_index)
+            # "spawn": processos criados por fork herdariam os sockets abertos pelo serviço
+            executor = ProcessPoolExecutor(max_workers=num_workers or os.cpu_count(), mp_context=multiprocessing.get_context("spawn"),
+                                           initializer=init_query_worker,
+                                           initargs=(arq_index, str_ranking_model, cleaner or HTMLIndexer.cleaner))
+        self.executor = executor
+        # (consulta, k) -> future da resposta ainda em cálculo
+        self.dic_in_flight = {}
+        self.lst_latencies = deque(maxlen=QueryServer.LATENCY_WINDOW)
+        self.requests = 0
+        self.coalesced = 0
+        self.server = None
+
+    async def search(self, query: str, k: int) -> Tuple[List[int], List[float]]:
+        key = (" ".join(query.split()), k)
+        future = self.dic_in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().run_in_executor(self.executor, run_query_worker, key[0], k)
+        self.dic_in_flight[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if self.dic_in_flight.get(key) is future:
+                del self.dic_in_flight[key]
+
+    def latency_percentiles(self) -> Mapping[str, float]:
+        """Percentis (em milissegundos) da latência das últimas LATENCY_WINDOW requisições"""
+        if not self.lst_latencies:
+            return {}
+        arr_percentiles = np.percentile(np.array(self.lst_latencies)*1000, [50, 90, 99])
+        return {"p50":float(arr_percentiles[0]), "p90":float(arr_percentiles[1]), "p99":float(arr_percentiles[2])}
+
+    def stats(self) -> Mapping:
+        return {"requests":self.requests, "coalesced":self.coalesced, "in_flight":len(self.dic_in_flight),
+                "latency_ms":self.latency_percentiles()}
+
+    async def handle_request(self, str_target: str) -> Tuple[int, Mapping]:
+        url = urlsplit(str_target)
+        dic_params = parse_qs(url.query)
+        if url.path == "/stats":
+            return 200, self.stats()
+        if url.path != "/search":
+            return 404, {"error":f"Caminho inexistente: {url.path}"}
+        if "q" not in dic_params:
+            return 400, {"error":"Informe a consulta no parâmetro q"}
+        try:
+            k = int(dic_params.get("k", [QueryServer.DEFAULT_K])[0])
+        except ValueError:
+            return 400, {"error":"O parâmetro k deve ser um inteiro"}
+
+        float_start = time.perf_counter()
+        lst_docs, lst_weights = await self.search(dic_params["q"][0], k)
+        self.requests += 1
+        self.lst_latencies.append(time.perf_counter() - float_start)
+        return 200, {"query":dic_params["q"][0], "docs":lst_docs, "weights":lst_weights}
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            # cabeçalhos (ignorados) até a linha em branco
+            int_size = len(request_line)
+            while True:
+                header_line = await reader.readline()
+                int_size += len(header_line)
+                if header_line in (b"\r\n", b"\n", b"") or int_size > QueryServer.MAX_REQUEST_SIZE:
+                    break
+            lst_request = request_line.decode("utf-8", errors="replace").split()
+            if len(lst_request) < 2 or lst_request[0] != "GET":
+                int_status, dic_body = 405, {"error":"Apenas requisições GET são aceitas"}
+            else:
+                int_status, dic_body = await self.handle_request(lst_request[1])
+        except Exception as error:
+            int_status, dic_body = 500, {"error":str(error)}
+
+        body = json.dumps(dic_body, ensure_ascii=False).encode("utf-8")
+        writer.write(f"HTTP/1.1 {int_status} {'OK' if int_status == 200 else 'Error'}\r\n"
+                     f"Content-Type: application/json; charset=utf-8\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("ascii") + body)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080, unix_path: str = None):
+        """Inicia o serviço em host:port ou, caso unix_path seja informado, em um socket Unix"""
+        if unix_path is not None:
+            self.server = await asyncio.start_unix_server(self.handle_client, path=unix_path)
+        else:
+            self.server = await asyncio.start_server(self.handle_client, host, port)
+        return self.server
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.executor.shutdown(wait=True)
+
+    @staticmethod
+    async def main():
+        query_server = QueryServer("wiki.idx")
+        server = await query_server.start("127.0.0.1", 8080)
+        print(f"Servindo consultas em {[str(sock.getsockname()) for sock in server.sockets]}")
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(QueryServer.main())
@@ -1,7 +1,9 @@
-from index.structure import FileIndex,TermOccurrence
-from query.processing import QueryRunner, VectorRankingModel, IndexPreComputedVals
+from index.structure import FileIndex,TermOccurrence,OccurrenceList,SegmentedIndex,DocIdMap
+from query.processing import QueryRunner, QueryResultCache, VectorRankingModel, IndexPreComputedVals
 from index.indexer import Cleaner
 from typing import Mapping
+import shutil
+import time
 import unittest
 class ProcessingTest(unittest.TestCase):
     def setUp(self):
@@ -60,7 +62,7 @@ class ProcessingTest(unittest.TestCase):
         if len(response.values())==0:
             self.assertEqual(len(expected_response.values()),0,"O retorno da função deveria ser um dicionário vazio")
             return
-        if type(list(response.values())[0]) != list:
+        if isinstance(list(response.values())[0], TermOccurrence):
             map_resp_list = {term:[occur] for term,occur in response.items()}
             map_expected_resp_list = {term:[occur] for term,occur in expected_response.items()}
         else:
@@ -131,6 +133,8 @@ class ProcessingTest(unittest.TestCase):
             self.check_terms_index(response, expected_response)
             self.check_terms_occur(response,expected_response)
             print("")
+        #as listas do FileIndex são as do índice (arrays), sem um TermOccurrence por ocorrência
+        self.assertIsInstance(self.queryRunner.get_occurrence_list_per_term(["vocês"])["vocês"], OccurrenceList)
 
     def test_get_docs_term(self):
         arr_queries = ["crocodilo","vocês","Vocês estejam","vocês vocês crocodilo"]
@@ -141,5 +145,90 @@ class ProcessingTest(unittest.TestCase):
             print()
             self.assertListEqual(resposta, arr_expected_response[i],f"A resposta a consulta '{query}' deveria ser {arr_expected_response[i]} e não {resposta}")
 
+    def test_query_cache(self):
+        resposta, pesos = self.queryRunner.get_docs_term("Vocês estejam")
+        #a mesma consulta (com os mesmos termos após o preprocessamento) deve vir do cache
+        resposta_cache, pesos_cache = self.queryRunner.get_docs_term("Vocês  estejam")
+        self.assertListEqual(resposta_cache, resposta, "A resposta do cache deveria ser igual à calculada")
+        self.assertIs(pesos_cache, pesos, "Os pesos deveriam vir do cache")
+        self.assertEqual(self.queryRunner.query_cache.cache_info()[:2], (1, 1), "Deveria haver um acerto e uma falta no cache")
+        #k diferente é outra entrada
+        self.assertListEqual(self.queryRunner.get_docs_term("Vocês estejam", k=1)[0], [3])
+        self.assertAlmostEqual(self.queryRunner.query_cache.hit_ratio(), 1/3)
+
+        #ao recarregar os valores pré-computados, o cache é descartado
+        self.queryRunner.ranking_model.idx_pre_comp_vals.precompute_vals()
+        _, pesos_recalculados = self.queryRunner.get_docs_term("Vocês estejam")
+        self.assertIsNot(pesos_recalculados, pesos, "Após recarregar os valores pré-computados a consulta deveria ser recalculada")
+        self.assertEqual(self.queryRunner.query_cache.cache_info().currsize, 1)
+
+    def test_get_docs_term_batch(self):
+        arr_queries = ["crocodilo","vocês","Vocês estejam","vocês vocês crocodilo","vocês","se divertindo"]
+        query_runner = QueryRunner(self.queryRunner.ranking_model, self.index, self.queryRunner.cleaner, cache_size=0)
+        lst_responses = query_runner.get_docs_term_batch(arr_queries, k=2)
+        self.assertEqual(len(lst_responses), len(arr_queries))
+        for query, (resposta, pesos) in zip(arr_queries, lst_responses):
+            resposta_esperada, pesos_esperados = self.queryRunner.get_docs_term(query, k=2)
+            self.assertListEqual(resposta, resposta_esperada, f"A resposta em lote da consulta '{query}' deveria ser igual à individual")
+            self.assertDictEqual(dict(pesos), dict(pesos_esperados), f"Os pesos em lote da consulta '{query}' deveriam ser iguais aos individuais")
+        self.assertGreater(query_runner.batch_qps, 0, "A vazão do lote deveria ser registrada")
+
+    def test_segmented_index(self):
+        #documentos incluídos e removidos de um SegmentedIndex são considerados sem reconstruir o índice
+        shutil.rmtree("processing_test_idx", ignore_errors=True)
+        try:
+            index = SegmentedIndex("processing_test_idx", flush_doc_count=2)
+            #as ocorrências de cada documento são indexadas em sequência
+            lst_occurrences = sorted((occur.doc_id, term, occur.term_freq) for term in self.index.vocabulary
+                                     for occur in self.index.get_occurrence_list(term))
+            for doc_id, term, term_freq in lst_occurrences:
+                index.index(term, doc_id, term_freq)
+            precomp = IndexPreComputedVals(index)
+            query_runner = QueryRunner(VectorRankingModel(precomp), index, self.queryRunner.cleaner)
+            self.assertListEqual(query_runner.get_docs_term("vocês")[0], [2,3])
+
+            index.index("vocês", 4, 5)
+            index.delete_document(2)
+            precomp.precompute_vals()
+            self.assertListEqual(query_runner.get_docs_term("vocês")[0], [4,3], "A consulta deveria considerar as alterações no índice")
+            index.close()
+        finally:
+            shutil.rmtree("processing_test_idx", ignore_errors=True)
+
+    def test_external_doc_ids(self):
+        #o índice usa doc_ids internos; as respostas devem vir com os doc_ids externos
+        self.index.doc_id_map = DocIdMap([900, 700, 500, 300])
+        resposta, pesos = self.queryRunner.get_docs_term("Vocês estejam")
+        self.assertListEqual(resposta, [300, 500], "A resposta deveria usar os doc_ids externos")
+        self.assertIn(300, pesos)
+        self.assertNotIn(3, pesos, "Os pesos deveriam ser acessados pelos doc_ids externos")
+        self.assertGreater(pesos[300], pesos[500])
+        self.assertCountEqual(list(pesos), [300, 500])
+        #respostas do cache e em lote também são traduzidas
+        self.assertListEqual(self.queryRunner.get_docs_term("Vocês  estejam")[0], [300, 500])
+        self.assertListEqual(self.queryRunner.get_docs_term_batch(["vocês", "adoro"])[1][0], [700])
+
+    def test_query_result_cache_eviction(self):
+        cache = QueryResultCache(maxsize=2, max_docs=5)
+        cache.put("a", 2, "resposta a")
+        cache.put("b", 2, "resposta b")
+        self.assertEqual(cache.get("a"), "resposta a")
+        #"b" é a usada há mais tempo
+        cache.put("c", 1, "resposta c")
+        self.assertIsNone(cache.get("b"), "A entrada usada há mais tempo deveria ser descartada")
+        #limite de documentos: "a" (2) + "c" (1) + "d" (3) > 5
+        cache.put("d", 3, "resposta d")
+        self.assertIsNone(cache.get("a"), "O limite de documentos deveria descartar a entrada usada há mais tempo")
+        cache.put("e", 6, "resposta e")
+        self.assertIsNone(cache.get("e"), "Respostas maiores que o limite não deveriam ser guardadas")
+        self.assertEqual(cache.cache_info().evictions, 2)
+
+        cache_ttl = QueryResultCache(ttl=0.01)
+        cache_ttl.put("a", 1, "resposta a")
+        self.assertEqual(cache_ttl.get("a"), "resposta a")
+        time.sleep(0.02)
+        self.assertIsNone(cache_ttl.get("a"), "A resposta deveria expirar após o ttl")
+        self.assertEqual(cache_ttl.cache_info().expirations, 1)
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -1,5 +1,10 @@
-from query.ranking_models import IndexPreComputedVals,VectorRankingModel,BooleanRankingModel,  OPERATOR
-from index.structure import HashIndex,FileIndex,TermOccurrence
+from query.ranking_models import IndexPreComputedVals,VectorRankingModel,MaxScoreVectorRankingModel,BM25RankingModel,MaxScoreBM25RankingModel,BooleanRankingModel,  OPERATOR
+from index.structure import Index,HashIndex,FileIndex,SegmentedIndex,TermOccurrence
+import numpy as np
+import os
+import shutil
+import threading
+import time
 import unittest
 
 class RankingModelTest(unittest.TestCase):
@@ -61,6 +66,85 @@ class RankingModelTest(unittest.TestCase):
         for doc_id,norma_esperada in norma_esperada_per_doc.items():
             self.assertAlmostEqual(norma_esperada, precomp.document_norm[doc_id], places=2,msg=f"Norma inesperada do documento {doc_id}")
 
+    def test_precomputed_vals_persisted(self):
+        index = HashIndex()
+        for doc_id,term,freq in [(1,"new",4),(1,"york",1),(1,"times",1),(2,"new",1),(2,"york",1),
+                                 (2,"post",1),(3,"los",1),(3,"angeles",1),(3,"times",1)]:
+            index.index(term,doc_id,freq)
+        index.write("precomp_test.idx")
+        if os.path.exists("precomp_test.idx.document_norm.npy"):
+            os.remove("precomp_test.idx.document_norm.npy")
+
+        #na primeira vez os valores são calculados e gravados; na segunda, mapeados em memória
+        idx_lido = Index.read("precomp_test.idx")
+        precomp = IndexPreComputedVals(idx_lido, "precomp_test.idx")
+        self.assertTrue(os.path.exists("precomp_test.idx.document_norm.npy"), "As normas deveriam ser gravadas junto ao índice")
+        precomp_lido = IndexPreComputedVals(idx_lido, "precomp_test.idx")
+        self.assertIsInstance(precomp_lido.document_norm, np.memmap, "As normas gravadas deveriam ser mapeadas em memória")
+        self.assertEqual(precomp_lido.doc_count,3,"Numero de documentos inesperado")
+        for doc_id,norma_esperada in {1: 1.94, 2: 1.79, 3: 2.32}.items():
+            self.assertAlmostEqual(norma_esperada, precomp_lido.document_norm[doc_id], places=2,msg=f"Norma inesperada do documento {doc_id}")
+            self.assertEqual(precomp.document_norm[doc_id], precomp_lido.document_norm[doc_id], f"A norma lida do documento {doc_id} deveria ser a mesma calculada")
+        self.assertIsInstance(precomp_lido.document_length, np.memmap, "Os tamanhos dos documentos deveriam ser mapeados em memória")
+        self.assertEqual(precomp.avg_doc_length, precomp_lido.avg_doc_length, "O tamanho médio lido deveria ser o mesmo calculado")
+
+        #um novo índice gravado com o mesmo nome (e mesmos tamanhos) não pode usar os valores do anterior
+        precomp = precomp_lido = idx_lido = None
+        index.index("new",3,2)
+        index.write("precomp_test.idx")
+        self.assertFalse(os.path.exists("precomp_test.idx.document_norm.npy"), "Os valores do índice anterior deveriam ser removidos")
+        precomp_novo = IndexPreComputedVals(Index.read("precomp_test.idx"), "precomp_test.idx")
+        self.assertAlmostEqual(precomp_novo.document_norm[3], IndexPreComputedVals(index).document_norm[3],
+                               msg="A norma deveria ser calculada para o novo índice")
+
+        #um índice copiado sobre o arquivo (sem passar por Index.write), com a mesma quantidade de documentos e termos
+        precomp_novo = None
+        outro_index = HashIndex()
+        for doc_id,term,freq in [(1,"new",1),(1,"york",3),(1,"times",1),(2,"new",2),(2,"york",1),
+                                 (2,"post",1),(3,"los",1),(3,"angeles",2),(3,"times",1),(3,"new",1)]:
+            outro_index.index(term,doc_id,freq)
+        outro_index.write("precomp_outro.idx")
+        try:
+            shutil.copyfile("precomp_outro.idx", "precomp_test.idx")
+        finally:
+            os.remove("precomp_outro.idx")
+        precomp_copiado = IndexPreComputedVals(Index.read("precomp_test.idx"), "precomp_test.idx")
+        self.assertAlmostEqual(precomp_copiado.document_norm[1], IndexPreComputedVals(outro_index).document_norm[1],
+                               msg="Os valores gravados para outro índice não deveriam ser lidos")
+
+    def test_precomputed_vals_zero_norm(self):
+        #o documento 2 só tem termos presentes em todos os documentos (idf 0): norma 0 sem gerar NaN/inf
+        index = HashIndex()
+        for doc_id,term,freq in [(1,"comum",2),(1,"raro",1),(2,"comum",3)]:
+            index.index(term,doc_id,freq)
+        precomp = IndexPreComputedVals(index)
+        self.assertEqual(precomp.document_norm[2], 0)
+        self.assertTrue(np.all(np.isfinite(precomp.term_max_tf_norm)), f"Limites inválidos: {precomp.term_max_tf_norm}")
+
+    def test_bm25_model(self):
+        index = HashIndex()
+        for term, lst_occur in self.arr_indexes[1].items():
+            for occur in lst_occur:
+                index.index(term, occur.doc_id, occur.term_freq)
+        precomp = IndexPreComputedVals(index)
+        #tamanhos: doc 1: new(4)+york+times, doc 2: new+york+post, doc 3: los+angeles+times
+        self.assertListEqual([int(precomp.document_length[doc_id]) for doc_id in [1,2,3]], [6,3,3], "Tamanho inesperado dos documentos")
+        self.assertAlmostEqual(precomp.avg_doc_length, 4, msg="Tamanho médio inesperado dos documentos")
+
+        map_query = self.arr_queries_per_idx[1][0]
+        map_index_for_query = self.obtem_index_for_query(map_query, self.arr_indexes[1])
+        #new e times ocorrem em 2 dos 3 documentos: idf = log2(1+1.5/2.5)
+        idf = 0.678
+        for k1, b, lst_esperado, peso_por_doc_esperado in [(1.2, 0.75, [1,2,3], {1:idf*(4*2.2/(4+1.2*1.375)+2.2/(1+1.2*1.375)),
+                                                                                  2:idf*2.2/(1+1.2*0.8125), 3:idf*2.2/(1+1.2*0.8125)}),
+                                                          (2.0, 0, [1,2,3], {1:idf*(4*3/6+1), 2:idf, 3:idf})]:
+            bm25_model = BM25RankingModel(precomp, k1, b)
+            lst_response, doc_weights = bm25_model.get_ordered_docs(map_query, map_index_for_query)
+            self.assertListEqual(lst_response, lst_esperado, f"Resposta inesperada do BM25 com k1={k1} b={b}")
+            for doc_id, peso in peso_por_doc_esperado.items():
+                self.assertAlmostEqual(peso, doc_weights[doc_id], places=2, msg=f"Peso inesperado do documento {doc_id} com k1={k1} b={b}")
+            self.assertListEqual(bm25_model.get_ordered_docs(map_query, map_index_for_query, 1)[0], [1], "O top 1 deveria ser o documento 1")
+
     def obtem_index_for_query(self,map_query,map_index):
         map_index_for_query = {}
         for term, list_ocur in map_index.items():
@@ -90,6 +174,37 @@ class RankingModelTest(unittest.TestCase):
                 
 
 
+    def test_boolean_model_sorted_lists(self):
+        #listas de tamanhos bem diferentes: a interseção e a união devem ser as mesmas do numpy, ordenadas
+        rng = np.random.default_rng(3)
+        arr_universe = np.arange(1, 20001)
+        map_index = {f"t{i}":[TermOccurrence(int(doc_id), i, 1) for doc_id in np.sort(rng.choice(arr_universe, size, replace=False))]
+                        for i, size in enumerate([15, 400, 6000, 19000])}
+        arr_doc_ids_per_term = [np.array([occur.doc_id for occur in lst_occur]) for lst_occur in map_index.values()]
+        arr_and_esperado = arr_doc_ids_per_term[0]
+        arr_or_esperado = arr_doc_ids_per_term[0]
+        for arr_doc_ids in arr_doc_ids_per_term[1:]:
+            arr_and_esperado = np.intersect1d(arr_and_esperado, arr_doc_ids)
+            arr_or_esperado = np.union1d(arr_or_esperado, arr_doc_ids)
+
+        model_and = BooleanRankingModel(OPERATOR.AND)
+        model_or = BooleanRankingModel(OPERATOR.OR)
+        self.assertListEqual(model_and.intersection_all(map_index).tolist(), arr_and_esperado.tolist(), "Interseção inesperada")
+        self.assertListEqual(model_or.union_all(map_index).tolist(), arr_or_esperado.tolist(), "União inesperada")
+        self.assertListEqual(model_or.get_ordered_docs(None, map_index, 10)[0], arr_or_esperado[:10].tolist(), "Os top 10 do OR deveriam ser os menores doc_ids")
+        for arr_small, arr_large in [(np.array([1,5,9]), np.array([2,3,4])), (np.array([5]), np.array([1,2,3,4,5])), (np.array([1,10]), np.array([1,10]))]:
+            self.assertListEqual(BooleanRankingModel.galloping_intersection(arr_small, arr_large).tolist(),
+                                 np.intersect1d(arr_small, arr_large).tolist(), f"Interseção inesperada de {arr_small} e {arr_large}")
+
+    def test_rank_document_ids_top_k(self):
+        documents_weight = {7:0.5, 3:0.9, 10:0.5, 1:0.2, 4:0.9, 8:0.7}
+        model = VectorRankingModel(None)
+        #empates são desfeitos pelo menor doc_id
+        lst_esperado = [3,4,8,7,10,1]
+        self.assertListEqual(model.rank_document_ids(documents_weight), lst_esperado, "Ordenação inesperada dos documentos")
+        for k in [0,1,3,4,6,10]:
+            self.assertListEqual(model.rank_document_ids(documents_weight, k), lst_esperado[:k], f"Os top {k} documentos deveriam ser os {k} primeiros da ordenação completa")
+
     def test_vector_model(self):
         index = FileIndex()
         precomp = IndexPreComputedVals(index)
@@ -115,5 +230,208 @@ class RankingModelTest(unittest.TestCase):
                         self.assertTrue(doc_id not in doc_weights, f"O documento {doc_id} não deveria ser recuperado da consulta {query_position} indice {idx}")
                     else:
                         self.assertAlmostEqual(peso, doc_weights[doc_id], places=2,msg=f"Peso inesperado do documento {doc_id} consulta {query_position} índice {idx}. Peso calculado:{doc_weights[doc_id]} deveria ser: {peso}")
+
+    def cria_indice_zipf(self, int_num_docs, int_num_terms, int_terms_per_doc, seed=7):
+        #termos sorteados seguindo uma distribuição de Zipf, como em uma coleção real
+        rng = np.random.default_rng(seed)
+        index = HashIndex()
+        for doc_id in range(1, int_num_docs+1):
+            arr_terms = np.minimum(rng.zipf(1.3, int_terms_per_doc), int_num_terms)
+            arr_term_ids, arr_freqs = np.unique(arr_terms, return_counts=True)
+            for term_id, freq in zip(arr_term_ids.tolist(), arr_freqs.tolist()):
+                index.index(f"t{term_id}", doc_id, freq)
+        return index
+
+    def consultas_zipf(self, index, int_num_queries, int_terms_per_query, seed=11):
+        rng = np.random.default_rng(seed)
+        lst_vocab = sorted(index.vocabulary, key=lambda term: int(term[1:]))
+        lst_queries = []
+        for _ in range(int_num_queries):
+            arr_positions = np.unique(np.minimum(rng.zipf(1.2, int_terms_per_query), len(lst_vocab)) - 1)
+            lst_queries.append({lst_vocab[pos]:TermOccurrence(None, index.get_term_id(lst_vocab[pos]), 1)
+                                for pos in arr_positions.tolist()})
+        return lst_queries
+
+    def test_max_score_model(self):
+        #a poda não pode alterar o top-k nem os pesos da avaliação exaustiva
+        index = self.cria_indice_zipf(400, 300, 40)
+        precomp = IndexPreComputedVals(index)
+        vector_model = VectorRankingModel(precomp)
+        max_score_model = MaxScoreVectorRankingModel(precomp)
+        for exhaustive_model, pruned_model in [(vector_model, max_score_model), (BM25RankingModel(precomp), MaxScoreBM25RankingModel(precomp))]:
+            for query_position, map_query in enumerate(self.consultas_zipf(index, 30, 4)):
+                map_index_for_query = {term:index.get_occurrence_list(term) for term in map_query}
+                for k in [1, 5, 20]:
+                    lst_esperado, dic_pesos = exhaustive_model.get_ordered_docs(map_query, map_index_for_query, k)
+                    lst_response, doc_weights = pruned_model.get_ordered_docs(map_query, map_index_for_query, k)
+                    self.assertListEqual(lst_response, lst_esperado, f"Top {k} inesperado na consulta {query_position}: {map_query.keys()} ({type(pruned_model).__name__})")
+                    for doc_id in lst_response:
+                        self.assertEqual(doc_weights[doc_id], dic_pesos[doc_id], f"Peso inesperado do documento {doc_id} na consulta {query_position}")
+            self.assertEqual(pruned_model.pruning_stats.queries, 90)
+            self.assertLess(pruned_model.pruning_stats.postings_scored, pruned_model.pruning_stats.postings_total,
+                            f"A poda deveria ignorar ocorrências ({type(pruned_model).__name__})")
+
+        #consultas concorrentes (com k diferentes) em um mesmo modelo não interferem umas nas outras
+        lst_consultas = [(map_query, {term:index.get_occurrence_list(term) for term in map_query}) for map_query in self.consultas_zipf(index, 30, 4)]
+        dic_esperado = {(query_position, k):vector_model.get_ordered_docs(map_query, map_index_for_query, k)[0]
+                        for query_position, (map_query, map_index_for_query) in enumerate(lst_consultas) for k in [1, 7]}
+        lst_errors = []
+        def consulta(k):
+            for _ in range(5):
+                for query_position, (map_query, map_index_for_query) in enumerate(lst_consultas):
+                    if max_score_model.get_ordered_docs(map_query, map_index_for_query, k)[0] != dic_esperado[(query_position, k)]:
+                        lst_errors.append((query_position, k))
+        lst_threads = [threading.Thread(target=consulta, args=(k,)) for k in [1, 7, 1, 7]]
+        for thread in lst_threads:
+            thread.start()
+        for thread in lst_threads:
+            thread.join()
+        self.assertListEqual(lst_errors, [], "(consulta, k) com top-k inesperado nas consultas concorrentes")
+
+        #com cursores de um índice gravado (com tabelas de saltos), os termos podados não são decodificados por completo
+        int_min_doc_count, int_block_size = FileIndex.SKIP_MIN_DOC_COUNT, FileIndex.SKIP_BLOCK_SIZE
+        FileIndex.SKIP_MIN_DOC_COUNT, FileIndex.SKIP_BLOCK_SIZE = 32, 8
+        try:
+            index.write("max_score_test.idx")
+        finally:
+            FileIndex.SKIP_MIN_DOC_COUNT, FileIndex.SKIP_BLOCK_SIZE = int_min_doc_count, int_block_size
+        try:
+            idx_lido = FileIndex.open_index_file("max_score_test.idx", posting_cache_bytes=0)
+            int_total, int_decoded = -max_score_model.pruning_stats.postings_total, -max_score_model.pruning_stats.postings_decoded
+            for query_position, map_query in enumerate(self.consultas_zipf(index, 30, 4)):
+                map_index_for_query = {term:index.get_occurrence_list(term) for term in map_query}
+                lst_esperado, _ = vector_model.get_ordered_docs(map_query, map_index_for_query, 5)
+                dic_cursors = {term:idx_lido.get_posting_cursor(term) for term in map_query}
+                self.assertListEqual(max_score_model.get_ordered_docs(map_query, dic_cursors, 5)[0], lst_esperado,
+                                     f"Top 5 inesperado na consulta {query_position} com cursores")
+            int_total += max_score_model.pruning_stats.postings_total
+            int_decoded += max_score_model.pruning_stats.postings_decoded
+            self.assertLess(int_decoded, int_total, "Parte das listas dos termos podados não deveria ser decodificada")
+        finally:
+            idx_lido = None
+            os.remove("max_score_test.idx")
+
+    def test_incremental_precomputed_vals(self):
+        #documentos sorteados como em cria_indice_zipf: doc_id -> {termo: frequência}
+        rng = np.random.default_rng(5)
+        dic_docs = {}
+        for doc_id in range(1, 301):
+            arr_term_ids, arr_freqs = np.unique(np.minimum(rng.zipf(1.3, 30), 200), return_counts=True)
+            dic_docs[doc_id] = {f"t{term_id}":freq for term_id, freq in zip(arr_term_ids.tolist(), arr_freqs.tolist())}
+
+        shutil.rmtree("precomp_incr_test_idx", ignore_errors=True)
+        try:
+            index = SegmentedIndex("precomp_incr_test_idx", flush_doc_count=50)
+            for doc_id in range(1, 201):
+                for term, freq in dic_docs[doc_id].items():
+                    index.index(term, doc_id, freq)
+            precomp = IndexPreComputedVals(index)
+
+            #inclusões e remoções: com tolerância infinita, nenhuma norma anterior é recalculada
+            arr_norms_before = np.array(precomp.document_norm[:201])
+            for doc_id in range(201, 301):
+                for term, freq in dic_docs[doc_id].items():
+                    index.index(term, doc_id, freq)
+                precomp.add_document(doc_id, dic_docs[doc_id])
+            for doc_id in range(1, 201, 10):
+                index.delete_document(doc_id)
+                precomp.remove_document(doc_id, dic_docs[doc_id])
+            self.assertEqual(precomp.update_norms(float("inf")), 0, "Nenhum idf deveria ultrapassar uma tolerância infinita")
+            arr_kept = np.array([doc_id for doc_id in range(1, 201) if doc_id % 10 != 1])
+            self.assertTrue(np.array_equal(precomp.document_norm[arr_kept], arr_norms_before[arr_kept]),
+                            "As normas dos documentos anteriores não deveriam ser recalculadas")
+
+            #sem tolerância, os valores devem ser os mesmos de um novo cálculo completo
+            self.assertGreater(precomp.update_norms(0), 0)
+            precomp_full = IndexPreComputedVals(index)
+            self.assertEqual(precomp.doc_count, precomp_full.doc_count)
+            self.assertAlmostEqual(precomp.avg_doc_length, precomp_full.avg_doc_length)
+            arr_live = np.array(sorted(int(doc_id) for doc_id in index.set_documents))
+            self.assertTrue(np.allclose(precomp.document_norm[arr_live], precomp_full.document_norm[arr_live]),
+                            "As normas atualizadas por diferenças deveriam ser as de um novo cálculo")
+            self.assertTrue(np.all(precomp.term_max_tf_norm[:len(index.dic_index)] >= precomp_full.term_max_tf_norm - 1e-12),
+                            "term_max_tf_norm deveria continuar sendo um limite superior")
+
+            #com tolerância, a poda MaxScore continua retornando o top-k da avaliação exaustiva
+            for doc_id in range(1, 201, 10):
+                for term, freq in dic_docs[doc_id].items():
+                    index.index(term, doc_id, freq)
+                precomp.add_document(doc_id, dic_docs[doc_id])
+            precomp.update_norms(0.05)
+            vector_model = VectorRankingModel(precomp)
+            max_score_model = MaxScoreVectorRankingModel(precomp)
+            bm25_model = BM25RankingModel(precomp)
+            max_score_bm25_model = MaxScoreBM25RankingModel(precomp)
+            for map_query in self.consultas_zipf(index, 20, 3):
+                map_index_for_query = {term:index.get_occurrence_list(term) for term in map_query}
+                self.assertListEqual(max_score_model.get_ordered_docs(map_query, map_index_for_query, 5)[0],
+                                     vector_model.get_ordered_docs(map_query, map_index_for_query, 5)[0])
+                self.assertListEqual(max_score_bm25_model.get_ordered_docs(map_query, map_index_for_query, 5)[0],
+                                     bm25_model.get_ordered_docs(map_query, map_index_for_query, 5)[0])
+            self.assertEqual(len(BM25RankingModel(precomp).get_ordered_docs(map_query, map_index_for_query)[0]),
+                             len(set().union(*[map_index_for_query[term].doc_ids for term in map_query])))
+
+            #os arrays ampliados são gravados com o tamanho esperado e podem ser lidos novamente
+            index.close()
+            precomp.save_vals("precomp_incr_test_idx")
+            precomp_lido = IndexPreComputedVals(index, "precomp_incr_test_idx")
+            self.assertIsInstance(precomp_lido.document_norm, np.memmap, "Os valores atualizados deveriam ser lidos do arquivo")
+            self.assertTrue(np.array_equal(precomp_lido.document_norm, precomp.document_norm[:len(precomp_lido.document_norm)]))
+        finally:
+            shutil.rmtree("precomp_incr_test_idx", ignore_errors=True)
+            for str_name in list(IndexPreComputedVals.PERSISTED_ARRAYS) + [IndexPreComputedVals.FINGERPRINT_NAME]:
+                if os.path.exists(f"precomp_incr_test_idx.{str_name}.npy"):
+                    os.remove(f"precomp_incr_test_idx.{str_name}.npy")
+
+    def compara_poda(self, str_titulo, index, vector_model, max_score_model, lst_queries, k=10):
+        #cada avaliação recebe novos cursores, sem as listas do cache de ocorrências, como em uma consulta real
+        def cursores(map_query):
+            if hasattr(index, "posting_cache"):
+                index.posting_cache.clear()
+            return {term:index.get_posting_cursor(term) for term in map_query}
+
+        float_exhaustive = float_pruned = 0
+        stats = max_score_model.pruning_stats
+        int_total, int_scored, int_decoded = -stats.postings_total, -stats.postings_scored, -stats.postings_decoded
+        for query_position, map_query in enumerate(lst_queries):
+            dic_cursors = cursores(map_query)
+            time_start = time.perf_counter()
+            lst_esperado, _ = vector_model.get_ordered_docs(map_query, dic_cursors, k)
+            float_exhaustive += time.perf_counter() - time_start
+            dic_cursors = cursores(map_query)
+            time_start = time.perf_counter()
+            lst_response, _ = max_score_model.get_ordered_docs(map_query, dic_cursors, k)
+            float_pruned += time.perf_counter() - time_start
+            self.assertListEqual(lst_response, lst_esperado, f"Top {k} inesperado na consulta {query_position} ({str_titulo})")
+        int_total += stats.postings_total
+        int_scored += stats.postings_scored
+        int_decoded += stats.postings_decoded
+        print(f"{str_titulo}: {len(lst_queries)} consultas, ocorrências avaliadas {int_scored}/{int_total} "
+              f"({100*(1-int_scored/max(1,int_total)):.1f}% ignoradas), decodificadas {int_decoded}/{int_total} "
+              f"tempo exaustivo: {1000*float_exhaustive:.2f}ms MaxScore: {1000*float_pruned:.2f}ms")
+
+    def test_max_score_benchmark(self):
+        #as listas são lidas do arquivo por cursores (com tabelas de saltos), como nas consultas reais
+        self.cria_indice_zipf(40000, 5000, 60).write("pruning_test.idx")
+        index = Index.read("pruning_test.idx")
+        precomp = IndexPreComputedVals(index)
+        for int_terms_per_query in [2, 4, 8]:
+            lst_queries = self.consultas_zipf(index, 50, int_terms_per_query)
+            self.compara_poda(f"Zipf com até {int_terms_per_query} termos", index, VectorRankingModel(precomp),
+                              MaxScoreVectorRankingModel(precomp), lst_queries)
+            self.compara_poda(f"Zipf com até {int_terms_per_query} termos (BM25)", index, BM25RankingModel(precomp),
+                              MaxScoreBM25RankingModel(precomp), lst_queries)
+
+        if not os.path.exists("wiki.idx"):
+            self.skipTest("wiki.idx não encontrado: consultas de referência não avaliadas")
+        from query.processing import QueryRunner
+        from index.indexer import HTMLIndexer
+        wiki_idx = Index.read("wiki.idx")
+        wiki_precomp = IndexPreComputedVals(wiki_idx, "wiki.idx")
+        query_runner = QueryRunner(None, wiki_idx, HTMLIndexer.cleaner)
+        lst_queries = [query_runner.get_query_term_occurence(str_query) for str_query in ["Belo Horizonte", "Irlanda", "São Paulo"]]
+        self.compara_poda("Consultas de referência", wiki_idx, VectorRankingModel(wiki_precomp),
+                          MaxScoreVectorRankingModel(wiki_precomp), lst_queries)
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
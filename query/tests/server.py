@@ -0,0 +1,74 @@
+from query.server import QueryServer
+from query.processing import QueryRunner
+from query.ranking_models import IndexPreComputedVals, BM25RankingModel
+from index.structure import HashIndex, Index
+from index.indexer import HTMLIndexer
+import asyncio
+import json
+import os
+import unittest
+
+class QueryServerTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        index = HashIndex()
+        for doc_id, term, freq in [(1,"new",4),(1,"york",1),(1,"tim",1),(2,"new",1),(2,"york",1),
+                                   (2,"post",1),(3,"los",1),(3,"angel",1),(3,"tim",1)]:
+            index.index(term, doc_id, freq)
+        index.write("server_test.idx")
+
+    def tearDown(self):
+        for str_file in os.listdir("."):
+            if str_file.startswith("server_test.idx"):
+                os.remove(str_file)
+
+    async def get(self, reader_writer, str_target: str):
+        reader, writer = reader_writer
+        writer.write(f"GET {str_target} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode("utf-8"))
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        header, _, body = response.partition(b"\r\n\r\n")
+        return int(header.split()[1]), json.loads(body)
+
+    async def test_search(self):
+        index = Index.read("server_test.idx")
+        query_runner = QueryRunner(BM25RankingModel(IndexPreComputedVals(index)), index, HTMLIndexer.cleaner)
+        lst_esperado, pesos = query_runner.get_docs_term("New York", 2)
+
+        query_server = QueryServer("server_test.idx", num_workers=1)
+        self.assertTrue(os.path.exists("server_test.idx.document_norm.npy"),
+                        "Os valores pré-computados deveriam ser gravados antes do início dos processos do pool")
+        server = await query_server.start("127.0.0.1", 0)
+        int_port = server.sockets[0].getsockname()[1]
+        try:
+            #consultas idênticas simultâneas devem ser calculadas uma única vez
+            lst_responses = await asyncio.gather(*[self.get(await asyncio.open_connection("127.0.0.1", int_port), "/search?q=New+York&k=2")
+                                                   for _ in range(5)])
+            for int_status, dic_body in lst_responses:
+                self.assertEqual(int_status, 200)
+                self.assertListEqual(dic_body["docs"], lst_esperado, "O serviço deveria retornar a mesma resposta do QueryRunner")
+                self.assertAlmostEqual(dic_body["weights"][0], pesos[lst_esperado[0]])
+            self.assertGreater(query_server.coalesced, 0, "Consultas idênticas simultâneas deveriam aguardar a mesma resposta")
+
+            int_status, dic_stats = await self.get(await asyncio.open_connection("127.0.0.1", int_port), "/stats")
+            self.assertEqual(int_status, 200)
+            self.assertEqual(dic_stats["requests"], 5)
+            self.assertLessEqual(dic_stats["latency_ms"]["p50"], dic_stats["latency_ms"]["p99"])
+
+            int_status, _ = await self.get(await asyncio.open_connection("127.0.0.1", int_port), "/search?k=2")
+            self.assertEqual(int_status, 400, "Uma consulta sem o parâmetro q é inválida")
+        finally:
+            await query_server.close()
+
+    async def test_unix_socket(self):
+        query_server = QueryServer("server_test.idx", num_workers=1)
+        await query_server.start(unix_path="server_test.idx.sock")
+        try:
+            int_status, dic_body = await self.get(await asyncio.open_unix_connection("server_test.idx.sock"), "/search?q=los&k=5")
+            self.assertEqual(int_status, 200)
+            self.assertListEqual(dic_body["docs"], [3], "Apenas o documento 3 possui o termo los")
+        finally:
+            await query_server.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,3 +1,4 @@
+from datetime import datetime
 class CheckTime(object):
     def __init__(self):
         self.time = datetime.now()
@@ -6,6 +7,9 @@ class CheckTime(object):
         delta = datetime.now()-self.time
         self.time = datetime.now()
         return delta
+    def print_delta(self,task):
+        self.printDelta(task)
+
     def printDelta(self,task):
         delta = self.finishTime()
         print(task+" done in "+str(delta.total_seconds()))